@@ -0,0 +1,253 @@
+# admission.py
+# Per-client rate limits and a cap on concurrent generations, shared by every worker on a machine
+#
+# Each limited endpoint has a token bucket per client IP: RATE_LIMIT_<ENDPOINT> = "N/S" allows
+# bursts of N requests, refilled at N every S seconds. Buckets live in a small SQLite file in
+# ADMISSION_DIR so all gunicorn workers on the dyno draw from the same ones, without a
+# database round trip per request. Generations also need one of MAX_CONCURRENT_GENERATIONS
+# slots, held as flock()ed files, so a crashed worker's slot frees itself; a slot is taken
+# before the client's token, so a 503 doesn't use up its rate limit. Requests over a
+# limit get an immediate 429 (rate) or 503 (capacity) with Retry-After instead of queueing
+# behind busy workers, and every shed request is counted for /admin/load.
+
+import os
+import math
+import time
+import fcntl
+import random
+import sqlite3
+import tempfile
+import threading
+from functools import wraps
+from flask import Response, make_response, request
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMITS = {
+    'generate': os.getenv('RATE_LIMIT_GENERATE', '5/300'),  # 5 generations per 5 minutes per client
+    'search': os.getenv('RATE_LIMIT_SEARCH', '30/60'),
+    'suggest': os.getenv('RATE_LIMIT_SUGGEST', '120/60'),  # one request per keystroke
+}
+MAX_CONCURRENT_GENERATIONS = int(os.getenv('MAX_CONCURRENT_GENERATIONS', '4'))  # per machine
+# Proxies that append to X-Forwarded-For (1 on Heroku); the client is the entry before them.
+# 0 ignores the header, so a client talking to the app directly can't pick its own address.
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+ADMISSION_DIR = os.getenv('ADMISSION_DIR', os.path.join(tempfile.gettempdir(), 'pim-admission'))
+GENERATION_RETRY_AFTER = 30  # seconds to suggest when every generation slot is busy
+IDLE_BUCKET_SECONDS = 3600
+
+
+def parse_limit(spec):
+    """'N/S' -> (capacity N, tokens per second)"""
+    capacity, seconds = spec.split('/')
+    return float(capacity), float(capacity) / float(seconds)
+
+
+def client_ip():
+    """The client address, skipping the trusted proxies at the end of X-Forwarded-For"""
+    forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+    if TRUSTED_PROXIES and len(forwarded) >= TRUSTED_PROXIES:
+        return forwarded[-TRUSTED_PROXIES]
+    return request.remote_addr or 'unknown'
+
+
+class AdmissionStore:
+    """Token buckets and shed counters in a SQLite file shared by the workers on this machine"""
+
+    def __init__(self, directory=ADMISSION_DIR):
+        self.directory = directory
+        self.path = os.path.join(directory, 'admission.db')
+        self._local = threading.local()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # counters, not records: losing the last writes is fine
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shed (
+                    endpoint TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (endpoint, reason)
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate):
+        """Take a token from a bucket; returns 0 if granted, else seconds until one is available"""
+        conn = self.connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            granted = tokens >= 1
+            if granted:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            if random.random() < 0.001:
+                # Idle buckets have refilled; forgetting them changes nothing
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - IDLE_BUCKET_SECONDS,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return 0 if granted else (1 - tokens) / rate
+
+    def record_shed(self, endpoint, reason):
+        self.connection().execute("""
+            INSERT INTO shed (endpoint, reason, count) VALUES (?, ?, 1)
+            ON CONFLICT (endpoint, reason) DO UPDATE SET count = count + 1
+        """, (endpoint, reason))
+
+    def shed_counts(self):
+        rows = self.connection().execute("SELECT endpoint, reason, count FROM shed ORDER BY endpoint, reason")
+        return {f"{endpoint}:{reason}": count for endpoint, reason, count in rows}
+
+    def active_buckets(self):
+        return self.connection().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class Slot:
+    """A held slot: its lock file and the busy marker in_use() probes (close to release)"""
+
+    def __init__(self, lock, marker):
+        self.lock = lock
+        self.marker = marker
+
+    def close(self):
+        self.marker.close()
+        self.lock.close()
+
+
+class Slots:
+    """At most `size` holders across processes, as non-blocking flock()s on numbered files
+
+    Each holder also keeps an exclusive lock on a busy marker, so in_use() can count holders
+    with shared probes of the markers and never touches the slot locks acquire() competes for.
+    """
+
+    def __init__(self, name, size, directory=ADMISSION_DIR):
+        self.name = name
+        self.size = size
+        self.directory = directory
+
+    def path(self, number, kind):
+        return os.path.join(self.directory, f'{self.name}-{number}.{kind}')
+
+    def acquire(self):
+        """A held Slot, or None when all are taken"""
+        os.makedirs(self.directory, exist_ok=True)
+        for number in random.sample(range(self.size), self.size):
+            f = open(self.path(number, 'slot'), 'w')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            marker = open(self.path(number, 'busy'), 'w')
+            # Blocks only while an in_use() probe holds it, i.e. for microseconds
+            fcntl.flock(marker, fcntl.LOCK_EX)
+            return Slot(f, marker)
+        return None
+
+    def in_use(self):
+        used = 0
+        for number in range(self.size):
+            try:
+                f = open(self.path(number, 'busy'), 'r')
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    used += 1
+        return used
+
+
+store = AdmissionStore()
+generation_slots = Slots('generation', MAX_CONCURRENT_GENERATIONS)
+
+
+def plain_rejection(message):
+    return message + '\n', 'text/plain'
+
+
+def shed(endpoint, reason, status, retry_after, message, reject):
+    """Fast refusal with Retry-After; the shed is counted"""
+    try:
+        store.record_shed(endpoint, reason)
+    except sqlite3.Error as e:
+        print(f"⚠️  Could not record shed request: {e}")
+    body, mimetype = reject(message)
+    response = Response(body, status=status, mimetype=mimetype)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def limit(endpoint, methods=None, slots=None, reject=plain_rejection):
+    """Rate-limit a view per client IP and optionally make it hold one of `slots` while it runs
+
+    reject(message) -> (body, mimetype) formats refusals, e.g. as a server-sent event.
+    """
+    capacity, rate = parse_limit(RATE_LIMITS[endpoint])
+
+    def decorator(view):
+        @wraps(view)
+        def limited(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED or (methods and request.method not in methods):
+                return view(*args, **kwargs)
+
+            # The slot first: a request turned away for capacity keeps the client's token
+            slot = slots.acquire() if slots else None
+            if slots and slot is None:
+                return shed(endpoint, 'capacity', 503, GENERATION_RETRY_AFTER,
+                            "The machine is busy with other inventions. Try again shortly.", reject)
+
+            try:
+                wait = store.take(f"{endpoint}:{client_ip()}", capacity, rate)
+            except sqlite3.Error as e:
+                # Fail open: a broken limiter must not take the site down
+                print(f"⚠️  Rate limiter unavailable: {e}")
+                wait = 0
+            if wait:
+                if slot:
+                    slot.close()
+                return shed(endpoint, 'rate', 429, wait,
+                            f"Too many requests. Try again in {math.ceil(wait)} seconds.", reject)
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                if slot:
+                    slot.close()
+                raise
+            if slot:
+                # After the last byte, so streamed generations keep their slot until done
+                response.call_on_close(slot.close)
+            return response
+        return limited
+    return decorator
+
+
+def load_stats():
+    """Shed counts, generation slots in use and tracked clients"""
+    return {
+        'enabled': RATE_LIMIT_ENABLED,
+        'limits': RATE_LIMITS,
+        'shed': store.shed_counts(),
+        'generation_slots': {'in_use': generation_slots.in_use(), 'size': generation_slots.size},
+        'active_buckets': store.active_buckets(),
+    }
@@ -1,113 +1,145 @@
 # app.py
 # Main Flask application for Perpetual Ideas Machine
+#
+# Importing this module only builds the Flask app: the database is contacted on the
+# first request, provider SDKs and the markdown renderer are imported when first
+# needed, and auto-generation runs in its own process (see generation_scheduler.py).
+# That keeps gunicorn --preload and autoscaled boots fast.
 
-from flask import Flask, render_template, request, redirect, url_for, flash
-import os
-from datetime import datetime
-import json
-import random
-from generate import generate_invention
-from domains import DOMAINS, get_domain_info, get_all_domains
-import markdown2
 from dotenv import load_dotenv
-from apscheduler.schedulers.background import BackgroundScheduler
-import atexit
 
 load_dotenv()
 
-# Check if DATABASE_URL is set (for PostgreSQL)
-database_url = os.getenv('DATABASE_URL')
-
-if database_url:
-    # Use PostgreSQL (production/Heroku)
-    print("📊 Using PostgreSQL database")
-    from database import (
-        get_invention, get_inventions_by_domain, get_all_inventions,
-        search_inventions as db_search_inventions, count_inventions_by_domain,
-        get_stats, init_db
-    )
-else:
-    # Use SQLite (local development fallback)
-    print("📊 Using SQLite database (local development only)")
-    print("⚠️  Warning: SQLite will NOT work on Heroku!")
-    print("   For Heroku deployment, you must set DATABASE_URL")
-    print("   See DATABASE_SETUP.md for instructions\n")
-    from database_sqlite import (
-        get_invention, get_inventions_by_domain, get_all_inventions,
-        search_inventions as db_search_inventions, count_inventions_by_domain,
-        get_stats, init_db
-    )
-
-# Initialize database on startup
-try:
-    init_db()
-except Exception as e:
-    print(f"⚠️  Database initialization error: {e}")
-    import sys
-    sys.exit(1)
-
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-
-# Auto-generation configuration
+from flask import (Flask, Response, render_template, request, redirect, url_for, flash, abort,
+                   send_from_directory, session, stream_with_context, jsonify, current_app)
+import os
+import json
+import time
+import click
+import threading
+from datetime import date, timedelta
+from domains import DOMAINS, get_domain_info
+import storage
+import catalogue
+import search_cache
+from profiling import init_profiling, is_admin_request, list_profiles, PROFILE_DIR
+from responses import init_responses, immutable_page, page_etag
+from search_cache import SEARCH_PREWARM
+from admission import limit, generation_slots, load_stats
+
+# Run the auto-generation scheduler inside web processes (otherwise use the worker process)
 AUTO_GENERATE_ENABLED = os.getenv('AUTO_GENERATE', 'true').lower() == 'true'
-AUTO_GENERATE_INTERVAL = int(os.getenv('AUTO_GENERATE_INTERVAL', '3600'))  # 1 hour default
+AUTO_GENERATE_IN_WEB = os.getenv('AUTO_GENERATE_IN_WEB', 'false').lower() == 'true'
+
+# After a client creates an invention, its reads skip the read replicas for this long
+REPLICA_PIN_SECONDS = float(os.getenv('REPLICA_PIN_SECONDS', '30'))
+
+_routes = []
+
+
+def route(rule, **options):
+    """Record a view so create_app() can register it"""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+def create_app():
+    """Build the Flask app without touching the database or starting threads"""
+    # Static files are served by responses.py under fingerprinted names
+    app = Flask(__name__, static_folder=None)
+    app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    init_profiling(app)
+    init_responses(app)
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_feeds_command)
+
+    app.before_request(_pin_recent_writers)
+    app.teardown_request(_unpin)
+
+    if SEARCH_PREWARM:
+        app.before_request(_prewarm_search_once)
+
+    if AUTO_GENERATE_ENABLED and AUTO_GENERATE_IN_WEB:
+        # Start after fork, on the first request each worker serves
+        app.before_request(_start_auto_generation_once)
+
+    return app
+
+
+@click.command('init-db')
+def init_db_command():
+    """Create the database schema and run migrations"""
+    storage.init_db()
+
+
+@click.command('rebuild-feeds')
+def rebuild_feeds_command():
+    """Re-render every feed and sitemap from the database"""
+    import feeds
+    print(f"✅ Rebuilt {feeds.rebuild_all()} feeds and sitemaps")
+
+
+def pin_to_primary(seconds=REPLICA_PIN_SECONDS):
+    """Read this client's requests from the primary for a while (read-your-writes)"""
+    session['primary_until'] = max(session.get('primary_until', 0), time.time() + seconds)
+    storage.pin_primary()
+
+
+def has_session():
+    """Whether the client sent a session cookie; reading session without one would add Vary: Cookie"""
+    return current_app.config['SESSION_COOKIE_NAME'] in request.cookies
+
 
-# Initialize scheduler
-scheduler = BackgroundScheduler()
+def _pin_recent_writers():
+    if has_session() and session.get('primary_until', 0) > time.time():
+        storage.pin_primary()
 
 
-def auto_generate_invention():
-    """Automatically generate an invention in a random domain"""
+def _unpin(exc=None):
+    storage.pin_primary(False)
+
+
+_search_prewarmed = False
+
+
+def _prewarm_search_once():
+    """Fill this worker's search cache with the most popular queries, off the request path"""
+    global _search_prewarmed
+    if not _search_prewarmed:
+        _search_prewarmed = True
+        threading.Thread(target=_prewarm_search, name='search-prewarm', daemon=True).start()
+
+
+def _prewarm_search():
     try:
-        # Check if we're past February 1, 2026
-        cutoff_date = datetime(2026, 2, 1)
-        if datetime.utcnow() >= cutoff_date:
-            print(f"⏹️  Auto-generation stopped: Reached cutoff date (Feb 1, 2026)")
-            scheduler.shutdown()
-            return
-        
-        # Select random domain
-        domain_keys = list(DOMAINS.keys())
-        domain_key = random.choice(domain_keys)
-        domain_info = get_domain_info(domain_key)
-        
-        # Generate invention
-        inv_id = generate_invention(domain_key, domain_info['name'])
-        print(f"✅ Auto-generated invention {inv_id} in {domain_info['name']}")
+        count = search_cache.cache.prewarm(search_results)
+        print(f"🔎 Prewarmed {count} popular searches")
     except Exception as e:
-        print(f"❌ Auto-generation error: {str(e)}")
-
-
-# Start the scheduler
-if AUTO_GENERATE_ENABLED:
-    # Check if we're already past the cutoff date
-    cutoff_date = datetime(2026, 2, 1)
-    if datetime.utcnow() >= cutoff_date:
-        print(f"⏹️  Auto-generation disabled: Past cutoff date (Feb 1, 2026)")
-    else:
-        scheduler.add_job(
-            func=auto_generate_invention,
-            trigger="interval",
-            seconds=AUTO_GENERATE_INTERVAL,
-            id='auto_generate_job',
-            name='Auto-generate inventions',
-            replace_existing=True
-        )
-        scheduler.start()
-        days_remaining = (cutoff_date - datetime.utcnow()).days
-        print(f"🤖 Auto-generation enabled: every {AUTO_GENERATE_INTERVAL} seconds ({AUTO_GENERATE_INTERVAL/60} minutes)")
-        print(f"📅 Will run until February 1, 2026 ({days_remaining} days remaining)")
-        
-        # Shut down the scheduler when exiting the app
-        atexit.register(lambda: scheduler.shutdown())
+        print(f"⚠️  Search prewarm failed: {e}")
+
+
+_auto_generation_started = False
+
 
+def _start_auto_generation_once():
+    global _auto_generation_started
+    if not _auto_generation_started:
+        _auto_generation_started = True
+        from generation_scheduler import start_background
+        start_background()
 
-@app.route('/')
+
+@route('/')
 def index():
     """Main landing page with domain grid and statistics"""
     try:
-        stats = get_stats()
+        stats = catalogue.get_stats()
     except Exception as e:
         print(f"Error getting stats: {e}")
         stats = {'total_inventions': 0, 'domains_active': 0, 'by_domain': {}}
@@ -117,7 +149,7 @@ def index():
                          stats=stats)
 
 
-@app.route('/domain/<domain_key>')
+@route('/domain/<domain_key>')
 def view_domain(domain_key):
     """List all inventions for a specific domain"""
     domain_info = get_domain_info(domain_key)
@@ -126,7 +158,7 @@ def view_domain(domain_key):
         return redirect(url_for('index'))
     
     try:
-        inventions = get_inventions_by_domain(domain_key)
+        inventions = catalogue.get_inventions_by_domain(domain_key)
     except Exception as e:
         flash(f'Error loading inventions: {str(e)}', 'error')
         inventions = []
@@ -137,13 +169,13 @@ def view_domain(domain_key):
                          inventions=inventions)
 
 
-@app.route('/invention/<domain_key>/<invention_id>')
+@route('/invention/<domain_key>/<invention_id>')
 def view_invention(domain_key, invention_id):
     """View a specific invention"""
     domain_info = get_domain_info(domain_key)
     
     try:
-        invention = get_invention(domain_key, invention_id)
+        invention = storage.get_invention(domain_key, invention_id)
     except Exception as e:
         flash(f'Error loading invention: {str(e)}', 'error')
         return redirect(url_for('view_domain', domain_key=domain_key))
@@ -152,17 +184,28 @@ def view_invention(domain_key, invention_id):
         flash('Invention not found', 'error')
         return redirect(url_for('view_domain', domain_key=domain_key))
     
-    # Convert markdown to HTML
-    html_content = markdown2.markdown(invention['content'], extras=['fenced-code-blocks', 'tables'])
-    
-    return render_template('invention.html',
-                         domain_key=domain_key,
-                         domain_info=domain_info,
-                         invention=invention,
-                         html_content=html_content)
+    def render():
+        # Convert markdown to HTML
+        import markdown2
+        html_content = markdown2.markdown(invention['content'], extras=['fenced-code-blocks', 'tables'])
+
+        return render_template('invention.html',
+                             domain_key=domain_key,
+                             domain_info=domain_info,
+                             invention=invention,
+                             html_content=html_content)
+
+    if has_session() and session.get('_flashes'):
+        # Pending flash messages make this rendering one-off
+        return render()
+
+    # Inventions never change once saved (the hash covers the content), so the
+    # rendered and compressed page is reused until the content or templates change
+    return immutable_page(page_etag('invention', invention['invention_id'], invention['hash']), render)
 
 
-@app.route('/generate', methods=['GET', 'POST'])
+@route('/generate', methods=['GET', 'POST'])
+@limit('generate', methods=['POST'], slots=generation_slots)
 def generate():
     """Generate a new invention"""
     if request.method == 'POST':
@@ -174,7 +217,9 @@ def generate():
             return redirect(url_for('generate'))
         
         try:
+            from generate import generate_invention
             inv_id = generate_invention(domain_key, domain_info['name'])
+            pin_to_primary()
             flash(f'Successfully generated invention: {inv_id}', 'success')
             return redirect(url_for('view_invention', domain_key=domain_key, invention_id=inv_id))
         except Exception as e:
@@ -184,52 +229,174 @@ def generate():
     return render_template('generate.html', domains=DOMAINS)
 
 
-@app.route('/search')
+def sse(event, data):
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_rejection(message):
+    return sse('failed', {'message': message}), 'text/event-stream'
+
+
+@route('/generate/stream', methods=['POST'])
+@limit('generate', slots=generation_slots, reject=sse_rejection)
+def generate_stream():
+    """Generate a new invention, streaming its text to the browser as server-sent events"""
+    domain_key = request.form.get('domain')
+    domain_info = get_domain_info(domain_key)
+    if not domain_info:
+        return Response(sse('failed', {'message': 'Invalid domain selected'}),
+                        status=400, mimetype='text/event-stream')
+
+    from generate import stream_invention
+    from providers import PROVIDER_TIMEOUT
+
+    # The session cookie goes out with the headers, before the invention is saved
+    pin_to_primary(PROVIDER_TIMEOUT + REPLICA_PIN_SECONDS)
+
+    def events():
+        # Send the first byte before the model answers so proxies keep the connection open
+        yield ': generating\n\n'
+        try:
+            for event, data in stream_invention(domain_key, domain_info['name']):
+                if event == 'text':
+                    yield sse('text', data)
+                elif event == 'section':
+                    yield sse('section', {'name': data[0], 'text': data[1]})
+                elif event == 'saved':
+                    yield sse('saved', {
+                        'id': data,
+                        'url': url_for('view_invention', domain_key=domain_key, invention_id=data)
+                    })
+        except Exception as e:
+            print(f"❌ Streaming generation error: {str(e)}")
+            yield sse('failed', {'message': f'Error generating invention: {str(e)}'})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def search_results(query, **filters):
+    """A page of search hits formatted for search.html, with context around the first match, and facet counts"""
+    found = storage.search_inventions(query, **filters)
+    results = []
+    for result in found['results']:
+        # Find context around match
+        content = result.get('content', '')
+        match_pos = content.lower().find(query)
+        if match_pos >= 0:
+            start = max(0, match_pos - 100)
+            end = min(len(content), match_pos + 100)
+            context = ('...' if start > 0 else '') + content[start:end] + ('...' if end < len(content) else '')
+        else:
+            context = content[:200] + '...'
+
+        results.append({
+            'domain_key': result['domain_key'],
+            'domain_name': result['domain_name'],
+            'id': result['invention_id'],
+            'title': result['title'],
+            'context': context,
+            'date': result['created_at']
+        })
+    found['results'] = results
+    return found
+
+
+def search_filters(args):
+    """Search filters from the query string; invalid values are ignored"""
+    filters = {}
+    if args.get('domain') in DOMAINS:
+        filters['domain_key'] = args['domain']
+    for arg, name in (('from', 'date_from'), ('to', 'date_to')):
+        try:
+            filters[name] = date.fromisoformat(args.get(arg, '')).isoformat()
+        except ValueError:
+            pass
+    if args.get('title') == '1':
+        filters['title_only'] = True
+    page = args.get('page', 1, type=int)
+    if page > 1:
+        filters['page'] = page
+    return filters
+
+
+def month_range(month):
+    """('YYYY-MM-01', last day of the month) for a 'YYYY-MM' facet"""
+    first = date.fromisoformat(f"{month}-01")
+    following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return first.isoformat(), (following - timedelta(days=1)).isoformat()
+
+
+@route('/search')
+@limit('search')
 def search():
-    """Search across all inventions"""
+    """Search across all inventions, narrowed by domain, dates or title"""
     query = request.args.get('q', '')
-    if not query:
+    if not query.strip():
         return render_template('search.html', query='', results=[])
-    
+
+    filters = search_filters(request.args)
+    corrected = None
     try:
-        raw_results = db_search_inventions(query)
-        # Format results to match template expectations
-        results = []
-        for result in raw_results:
-            # Find context around match
-            content = result.get('content', '')
-            content_lower = content.lower()
-            query_lower = query.lower()
-            match_pos = content_lower.find(query_lower)
-            if match_pos >= 0:
-                start = max(0, match_pos - 100)
-                end = min(len(content), match_pos + 100)
-                context = ('...' if start > 0 else '') + content[start:end] + ('...' if end < len(content) else '')
-            else:
-                context = content[:200] + '...'
-            
-            results.append({
-                'domain_key': result['domain_key'],
-                'domain_name': result['domain_name'],
-                'id': result['invention_id'],
-                'title': result['title'],
-                'context': context,
-                'date': result['created_at']
-            })
+        # search_results() runs on the normalized (lower-cased) query
+        found = search_cache.cache.get(query, search_results, **filters)
+        if not found['total'] and not filters:
+            # Probably a typo: search for the closest indexed terms instead
+            from search_index import did_you_mean
+            corrected = did_you_mean(search_cache.normalize(query))
+            if corrected:
+                found = search_cache.cache.get(corrected, search_results)
     except Exception as e:
         flash(f'Error searching: {str(e)}', 'error')
-        results = []
-    
-    return render_template('search.html', query=query, results=results)
+        found = {'results': [], 'total': 0, 'domains': {}, 'months': {}}
+
+    current = {'q': corrected or query, 'domain': request.args.get('domain'), 'from': request.args.get('from'),
+               'to': request.args.get('to'), 'title': request.args.get('title')}
 
+    def search_url(**changes):
+        # Changing a filter starts again from the first page
+        args = dict(current, **changes)
+        return url_for('search', **{key: value for key, value in args.items() if value})
+
+    domains = sorted(((key, DOMAINS[key]['name'], count) for key, count in found['domains'].items() if key in DOMAINS),
+                     key=lambda item: -item[2])
+    months = [(month, count) + month_range(month) for month, count in sorted(found['months'].items(), reverse=True)]
+    page = filters.get('page', 1)
+    pages = max(1, -(-found['total'] // storage.SEARCH_LIMIT))
+
+    return render_template('search.html', query=query, corrected=corrected, results=found['results'],
+                           total=found['total'], domains=domains, months=months, filters=filters,
+                           page=page, pages=pages, search_url=search_url)
+
+
+@route('/api/suggest')
+@limit('suggest')
+def api_suggest():
+    """Titles and terms completing a partly typed query, for type-ahead"""
+    import suggest
+    query = request.args.get('q', '')
+    try:
+        count = max(1, min(int(request.args.get('limit', suggest.SUGGEST_LIMIT)), 20))
+    except ValueError:
+        return jsonify(error='limit must be an integer'), 400
 
-@app.route('/stats')
+    found = suggest.get_suggester().suggest(query, count)
+    for title in found['titles']:
+        title['url'] = url_for('view_invention', domain_key=title['domain_key'], invention_id=title['invention_id'])
+    response = jsonify(query=query, **found)
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+
+@route('/stats')
 def stats():
     """Statistics dashboard"""
     try:
-        stats_data = get_stats()
+        stats_data = catalogue.get_stats()
         # Get recent inventions
-        recent_inventions = get_all_inventions(limit=20)
+        recent_inventions = catalogue.get_all_inventions(limit=20)
         stats_data['recent_inventions'] = recent_inventions
     except Exception as e:
         flash(f'Error loading statistics: {str(e)}', 'error')
@@ -238,9 +405,94 @@ def stats():
     return render_template('stats.html', stats=stats_data, domains=DOMAINS)
 
 
-# Helper functions (kept for backward compatibility and template formatting)
+def serve_feed(name):
+    """A cached feed or sitemap, answering 304 when the client already has it"""
+    import feeds
+    document = feeds.cache.get(name)
+    if document is None:
+        abort(404)
+
+    response = Response(document['body'], content_type=document['content_type'])
+    response.set_etag(document['etag'])
+    response.last_modified = document['updated_at']
+    response.cache_control.public = True
+    response.cache_control.max_age = int(feeds.FEED_CACHE_SECONDS)
+    return response.make_conditional(request)
+
+
+@route('/feed.atom')
+@route('/feed.json')
+def site_feed():
+    """Newest inventions across all domains"""
+    return serve_feed(request.path.lstrip('/'))
+
+
+@route('/domain/<domain_key>/feed.atom')
+@route('/domain/<domain_key>/feed.json')
+def domain_feed(domain_key):
+    """Newest inventions in one domain"""
+    if domain_key not in DOMAINS:
+        abort(404)
+    return serve_feed(request.path.lstrip('/'))
+
+
+@route('/sitemap.xml')
+def sitemap_index():
+    """Sitemap index pointing at the page sitemap and the invention shards"""
+    return serve_feed('sitemap.xml')
+
+
+@route('/sitemaps/<name>')
+def sitemap_shard(name):
+    """One sitemap shard"""
+    return serve_feed(f'sitemaps/{name}')
+
+
+@route('/admin/profiles')
+def admin_profiles():
+    """List the slowest captured request profiles"""
+    if not is_admin_request():
+        abort(404)
+
+    profiles = list_profiles()
+    return render_template('profiles.html', profiles=profiles, token=request.args.get('token', ''))
+
+
+@route('/admin/search-cache')
+def admin_search_cache():
+    """Search cache hit rate and most frequent queries"""
+    if not is_admin_request():
+        abort(404)
+
+    return search_cache.cache.stats()
+
+
+@route('/admin/load')
+def admin_load():
+    """Requests shed by the rate limiter and generation cap"""
+    if not is_admin_request():
+        abort(404)
+
+    return load_stats()
+
+
+@route('/admin/profiles/<route>/<filename>')
+def admin_profile_file(route, filename):
+    """Download a captured profile file"""
+    if not is_admin_request():
+        abort(404)
+
+    return send_from_directory(os.path.abspath(PROFILE_DIR), os.path.join(route, filename), as_attachment=True)
+
+
+app = create_app()
 
 
 if __name__ == '__main__':
+    # Local development: one process serves requests and runs auto-generation
+    # (in the reloader's child process only, so it doesn't run twice)
+    if AUTO_GENERATE_ENABLED and not AUTO_GENERATE_IN_WEB and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from generation_scheduler import start_background
+        start_background()
     app.run(debug=True)
 
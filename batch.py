@@ -0,0 +1,219 @@
+# batch.py
+# Bulk generation through the OpenAI Batch API for offline backfills
+
+import os
+import json
+import time
+from datetime import datetime
+from domains import DOMAINS, get_domain_info
+from providers import get_client, OPENAI_MODEL, MAX_TOKENS, TEMPERATURE
+from generate import build_prompt, save_generated_invention
+from parsing import validate_invention
+
+BATCH_STATE_FILE = os.getenv('BATCH_STATE_FILE', 'batch_state.json')
+BATCH_WORK_DIR = os.getenv('BATCH_WORK_DIR', 'batches')
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', '30'))  # seconds
+BATCH_ENDPOINT = '/v1/chat/completions'
+
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+def load_state(path=BATCH_STATE_FILE):
+    """Load the backfill state, or None when no backfill is in progress"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=BATCH_STATE_FILE):
+    """Atomically persist the backfill state"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_requests(per_domain, domain_keys=None):
+    """Batch request lines: per_domain prompts for each domain"""
+    lines = []
+    for domain_key in domain_keys or DOMAINS.keys():
+        domain_name = get_domain_info(domain_key)['name']
+        prompt = build_prompt(domain_name)
+        for n in range(per_domain):
+            lines.append({
+                'custom_id': f"{domain_key}:{n}",
+                'method': 'POST',
+                'url': BATCH_ENDPOINT,
+                'body': {
+                    'model': OPENAI_MODEL,
+                    'messages': [{'role': 'user', 'content': prompt}],
+                    'temperature': TEMPERATURE,
+                    'max_tokens': MAX_TOKENS,
+                },
+            })
+    return lines
+
+
+def start_backfill(per_domain, domain_keys=None):
+    """Write the request JSONL and record a fresh backfill state"""
+    os.makedirs(BATCH_WORK_DIR, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    input_path = os.path.join(BATCH_WORK_DIR, f"batch-{stamp}.jsonl")
+
+    with open(input_path, 'w') as f:
+        for line in build_requests(per_domain, domain_keys):
+            f.write(json.dumps(line) + '\n')
+
+    state = {
+        'status': 'built',
+        'key': f"pim-backfill-{stamp}",  # metadata on the batch, to find it again after a crash
+        'input_path': input_path,
+        'output_path': os.path.join(BATCH_WORK_DIR, f"batch-{stamp}-output.jsonl"),
+        'input_file_id': None,
+        'batch_id': None,
+        'saved': {},
+        'failed': {},
+        'created_at': stamp,
+    }
+    save_state(state)
+    return state
+
+
+def submit(state):
+    """Upload the request file and create the batch"""
+    client = get_client('openai')
+    state.setdefault('key', f"pim-backfill-{state['created_at']}")  # state files from older versions
+
+    if not state['input_file_id']:
+        with open(state['input_path'], 'rb') as f:
+            uploaded = client.files.create(file=f, purpose='batch')
+        state['input_file_id'] = uploaded.id
+        save_state(state)
+
+    # A crash between create and save must not create (and bill) a second batch on resume
+    batch = find_batch(state) if state['status'] == 'submitting' else None
+    if batch is None:
+        state['status'] = 'submitting'
+        state['submitting_at'] = int(time.time())
+        save_state(state)
+        batch = client.batches.create(
+            input_file_id=state['input_file_id'],
+            endpoint=BATCH_ENDPOINT,
+            completion_window='24h',
+            metadata={'backfill': state['key']},
+        )
+    state['batch_id'] = batch.id
+    state['status'] = 'submitted'
+    save_state(state)
+    print(f"📤 Submitted batch {batch.id}")
+    return state
+
+
+def find_batch(state):
+    """The batch already created for this backfill, if the create call went through"""
+    for batch in get_client('openai').batches.list(limit=100):
+        if (batch.metadata or {}).get('backfill') == state['key']:
+            return batch
+        if batch.created_at < state['submitting_at'] - 3600:
+            # Listed newest first: anything older predates this submission
+            return None
+    return None
+
+
+def wait_for_batch(state):
+    """Poll the batch until it reaches a terminal status"""
+    client = get_client('openai')
+
+    while True:
+        batch = client.batches.retrieve(state['batch_id'])
+        counts = batch.request_counts
+        progress = f" ({counts.completed}/{counts.total})" if counts else ''
+        print(f"⏳ Batch {batch.id}: {batch.status}{progress}")
+
+        if batch.status in TERMINAL_STATUSES:
+            state['status'] = batch.status
+            state['output_file_id'] = batch.output_file_id
+            state['error_file_id'] = batch.error_file_id
+            save_state(state)
+            return state
+
+        time.sleep(BATCH_POLL_INTERVAL)
+
+
+def download_file(file_id, path):
+    """Download a batch output file once, returning the local path"""
+    if not os.path.exists(path):
+        content = get_client('openai').files.content(file_id)
+        content.write_to_file(path + '.part')
+        os.replace(path + '.part', path)
+    return path
+
+
+def read_results(paths):
+    """Yield result objects from batch output JSONL files, one line at a time"""
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def process_results(state):
+    """Stream batch output through the normal save pipeline, skipping items already saved"""
+    state.setdefault('batch_status', state['status'])
+
+    # Keep local copies so a crash while saving does not mean downloading again
+    paths = []
+    if state.get('output_file_id'):
+        paths.append(download_file(state['output_file_id'], state['output_path']))
+    if state.get('error_file_id'):
+        paths.append(download_file(state['error_file_id'], state['output_path'].replace('-output', '-errors')))
+    if not paths:
+        print(f"⚠️  Batch {state['batch_id']} finished as {state['batch_status']} without output")
+
+    for result in read_results(paths):
+        custom_id = result['custom_id']
+        if custom_id in state['saved']:
+            continue
+
+        response = result.get('response') or {}
+        if result.get('error') or response.get('status_code') != 200:
+            state['failed'][custom_id] = result.get('error') or response.get('status_code')
+            save_state(state)
+            continue
+
+        domain_key = custom_id.split(':', 1)[0]
+        domain_name = get_domain_info(domain_key)['name']
+        content = response['body']['choices'][0]['message']['content']
+        problems = validate_invention(content)
+        if problems:
+            print(f"⚠️  Discarding malformed invention {custom_id}: {', '.join(problems)}")
+            state['failed'][custom_id] = f"malformed: {', '.join(problems)}"
+            save_state(state)
+            continue
+        state['saved'][custom_id] = save_generated_invention(content, domain_key, domain_name)
+        state['failed'].pop(custom_id, None)
+        save_state(state)
+
+    state['status'] = 'done'
+    save_state(state)
+    print(f"✅ Backfill saved {len(state['saved'])} inventions ({len(state['failed'])} failed)")
+    return state
+
+
+def run_backfill(per_domain=1, domain_keys=None, resume=True):
+    """Submit a batch backfill, or pick up an interrupted one, and save its results"""
+    state = load_state() if resume else None
+    if state and state['status'] == 'done':
+        state = None
+    if state:
+        print(f"🔄 Resuming backfill from {BATCH_STATE_FILE} (status: {state['status']})")
+    else:
+        state = start_backfill(per_domain, domain_keys)
+
+    if state['status'] in ('built', 'submitting'):
+        state = submit(state)
+    if state['status'] not in TERMINAL_STATUSES:
+        state = wait_for_batch(state)
+    return process_results(state)
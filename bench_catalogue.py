@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# bench_catalogue.py
+# Measures the catalogue's memory per invention and its listing latency against SQLite queries
+#
+# Usage: python bench_catalogue.py [--count 20000] [--reads 200]
+#
+# Memory is measured with tracemalloc for the catalogue and for the same listing rows
+# held as a list of dicts, as a per-process cache of storage results would hold them.
+# Latency compares the home, domain and stats reads with the queries they replace.
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import os
+import time
+import random
+import argparse
+import statistics
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+
+def synthetic_rows(count, seed=1):
+    """Listing rows with realistic title and preview lengths, one every 37 minutes"""
+    from domains import DOMAINS
+
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 11)))
+                  for _ in range(5000)]
+    domains = list(DOMAINS.items())
+    start = datetime(2025, 12, 16)
+    rows = []
+    for n in range(count):
+        timestamp = start + timedelta(minutes=37 * n)
+        domain_key, domain = domains[n % len(domains)]
+        rows.append({
+            'invention_id': f"inv-{timestamp.strftime('%Y%m%d-%H%M%S')}",
+            'domain_key': domain_key,
+            'domain_name': domain['name'],
+            'title': ' '.join(rng.choices(vocabulary, k=8)).title(),
+            'preview': ' '.join(rng.choices(vocabulary, k=60))[:300],
+            'content': ' '.join(rng.choices(vocabulary, k=60)),
+            'created_at': timestamp,
+        })
+    return rows
+
+
+def measured(build):
+    """(result of build(), bytes it allocated and kept)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def median_us(fn, repeat=5, calls=20):
+    """Median microseconds per call over several passes"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        timings.append((time.perf_counter() - start) / calls * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Listing catalogue benchmark')
+    parser.add_argument('--count', type=int, default=20000, help='inventions to generate')
+    parser.add_argument('--reads', type=int, default=20, help='calls per timing pass')
+    args = parser.parse_args()
+
+    from catalogue import Catalogue
+    from database_sqlite import SQLiteRepository
+
+    rows = synthetic_rows(args.count)
+    listing = [{k: v for k, v in row.items() if k != 'content'} for row in rows]
+
+    def load_catalogue():
+        catalogue = Catalogue()
+        for row in listing:
+            catalogue.add(row)
+        return catalogue
+
+    def load_dicts():
+        # Fresh rows, so the dicts own their strings as rows fetched from the database would
+        return [{k: v for k, v in dict(row, id=row['invention_id'], date=row['created_at'].date().isoformat()).items()
+                 if k != 'content'} for row in synthetic_rows(args.count)]
+
+    catalogue, catalogue_bytes = measured(load_catalogue)
+    _, dict_bytes = measured(load_dicts)
+    print(f"Catalogue benchmark ({args.count} inventions)")
+    print(f"  {'layout':<17} {'bytes':>12} {'per invention':>14}")
+    for label, size in [('list of dicts', dict_bytes), ('catalogue', catalogue_bytes)]:
+        print(f"  {label:<17} {size:>12} {size / args.count:>14.1f}")
+
+    domain_key = rows[0]['domain_key']
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = SQLiteRepository(os.path.join(tmp, 'bench.db'))
+        repo.init_db()
+        repo.save_many([dict(row, hash=str(n)) for n, row in enumerate(rows)])
+        reads = [
+            ('recent 20', lambda: catalogue.recent(20), lambda: repo.get_all_inventions(20)),
+            ('domain page', lambda: catalogue.domain(domain_key), lambda: repo.get_inventions_by_domain(domain_key)),
+            ('stats', catalogue.stats, repo.get_stats),
+        ]
+        print(f"\n  {'read':<17} {'catalogue':>12} {'sqlite':>12}  (medians)")
+        for label, from_catalogue, from_sqlite in reads:
+            print(f"  {label:<17} {median_us(from_catalogue, calls=args.reads):>9.1f} us "
+                  f"{median_us(from_sqlite, calls=args.reads):>9.1f} us")
+        repo.reset_connection()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
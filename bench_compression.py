@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# bench_compression.py
+# Measures the content compression ratio and the decode latency it adds to full-document reads
+#
+# Usage: python bench_compression.py [--source db|publications|synthetic] [--count 2000] [--reads 200]
+#
+# The dictionary is trained on half of the corpus and measured on the other half, so the
+# ratio reflects inventions the dictionary has not seen. The synthetic corpus wraps
+# word-level Markov text built from publications/ in format_invention(), for trying the
+# benchmark before the database holds enough inventions. On-disk sizes are split into the
+# search index (trigrams of every body, whichever way the bodies are stored) and the rest.
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import os
+import glob
+import time
+import random
+import argparse
+import statistics
+import tempfile
+import zstandard
+from compression import CONTENT_COMPRESSION_LEVEL, DICTIONARY_SIZE, MIN_TRAINING_SAMPLES, train_dictionary
+
+
+def load_corpus(source, count):
+    """Invention bodies from the configured database, publications/ or the synthetic generator"""
+    if source == 'db':
+        import storage
+        return storage.get_repository().sample_contents(count)
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'publications')
+    files = sorted(glob.glob(os.path.join(root, '*', '*', '*.md')))
+    publications = [open(path, encoding='utf-8').read() for path in files]
+    if source == 'publications':
+        return publications
+    return synthetic_corpus(publications, count)
+
+
+def synthetic_corpus(publications, count, seed=1):
+    """Formatted inventions whose sections are Markov text over the publications' words"""
+    from datetime import datetime, timedelta
+    from domains import DOMAINS
+    from generate import format_invention
+
+    rng = random.Random(seed)
+    words = ' '.join(publications).split()
+    following = {}
+    for current, nxt in zip(words, words[1:]):
+        following.setdefault(current, []).append(nxt)
+
+    def text(length):
+        word = rng.choice(words)
+        out = [word]
+        for _ in range(length - 1):
+            word = rng.choice(following.get(word) or words)
+            out.append(word)
+        return ' '.join(out)
+
+    corpus = []
+    start = datetime(2025, 12, 16)
+    domains = list(DOMAINS.items())
+    for n in range(count):
+        timestamp = start + timedelta(minutes=37 * n)
+        inv_id = f"inv-{timestamp.strftime('%Y%m%d-%H%M%S')}"
+        domain_key, domain = domains[n % len(domains)]
+        content = (f"TITLE: {text(8)}\n\nABSTRACT: {text(60)}\n\nDETAILED DESCRIPTION: {text(300)}\n\n"
+                   f"CLAIMS:\n" + ''.join(f"{i}. {text(30)}\n" for i in range(1, 5)) +
+                   f"\nENABLEMENT: {text(150)}\n")
+        corpus.append(format_invention(content, timestamp, inv_id, domain_key, domain['name']))
+    return corpus
+
+
+def median_us(fn, items, repeat=5):
+    """Median microseconds per item over several passes"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        timings.append((time.perf_counter() - start) / len(items) * 1e6)
+    return statistics.median(timings)
+
+
+def bench_codecs(train, test):
+    """Stored size and decode time per document for each storage format"""
+    dictionary = zstandard.ZstdCompressionDict(train_dictionary(train, DICTIONARY_SIZE))
+    plain = [text.encode('utf-8') for text in test]
+    results = {'plain': (sum(map(len, plain)), median_us(lambda b: b.decode('utf-8'), plain))}
+
+    for label, dict_data in [('zstd', None), ('zstd+dictionary', dictionary)]:
+        compressor = zstandard.ZstdCompressor(level=CONTENT_COMPRESSION_LEVEL, dict_data=dict_data)
+        decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+        blobs = [compressor.compress(b) for b in plain]
+        results[label] = (sum(map(len, blobs)), median_us(lambda b: decompressor.decompress(b).decode('utf-8'), blobs))
+    return results, len(dictionary.as_bytes())
+
+
+SEARCH_TABLES = ('invention_search', 'search_terms', 'term_trigrams')
+
+
+def search_index_bytes(conn):
+    """Bytes of the database file used by the search index (see search_index.py), or None without dbstat"""
+    try:
+        rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    except Exception:
+        return None
+    return sum(size for name, size in rows if name.startswith(SEARCH_TABLES)
+               or name.startswith(tuple(f'sqlite_autoindex_{table}' for table in SEARCH_TABLES)))
+
+
+def bench_reads(corpus, reads):
+    """get_invention latency, database file size and the search index's share of it on SQLite"""
+    from database_sqlite import SQLiteRepository
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, compress in [('plain', False), ('compressed', True)]:
+            path = os.path.join(tmp, f'{label}.db')
+            repo = SQLiteRepository(path)
+            repo.compress = compress
+            repo.init_db()
+            if compress:
+                repo.add_dictionary(train_dictionary(corpus, DICTIONARY_SIZE))
+            repo.save_many([
+                {'invention_id': f'inv-{n:06d}', 'domain_key': 'bench', 'domain_name': 'Bench',
+                 'title': f'Bench {n}', 'content': text, 'hash': str(n)}
+                for n, text in enumerate(corpus)
+            ])
+            repo.connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            ids = [f'inv-{n % len(corpus):06d}' for n in range(reads)]
+            latency = median_us(lambda i: repo.get_invention('bench', i)['content'], ids)
+            results[label] = (os.path.getsize(path), search_index_bytes(repo.connection()), latency)
+            repo.reset_connection()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Content compression benchmark')
+    parser.add_argument('--source', choices=['db', 'publications', 'synthetic'], default='db')
+    parser.add_argument('--count', type=int, default=2000, help='inventions to load or generate')
+    parser.add_argument('--reads', type=int, default=200, help='get_invention calls per pass')
+    args = parser.parse_args()
+
+    corpus = [text for text in load_corpus(args.source, args.count) if text]
+    if len(corpus) < 2 * MIN_TRAINING_SAMPLES:
+        print(f"Need at least {2 * MIN_TRAINING_SAMPLES} inventions, found {len(corpus)}"
+              + (" (try --source synthetic)" if args.source != 'synthetic' else ""))
+        return 1
+
+    codecs, dictionary_size = bench_codecs(corpus[::2], corpus[1::2])
+    plain_size = codecs['plain'][0]
+    print(f"Compression benchmark ({len(corpus)} inventions from {args.source}, level {CONTENT_COMPRESSION_LEVEL}, "
+          f"{dictionary_size} byte dictionary)")
+    print(f"  {'format':<17} {'bytes':>10} {'ratio':>7} {'decode/doc':>12}")
+    for label, (size, decode) in codecs.items():
+        print(f"  {label:<17} {size:>10} {plain_size / size:>6.2f}x {decode:>9.1f} us")
+
+    reads = bench_reads(corpus, args.reads)
+    print(f"\n  get_invention on SQLite ({args.reads} reads per pass, medians)")
+    print(f"  {'storage':<17} {'on disk':>10} {'search index':>13} {'the rest':>10} {'read':>12}")
+    for label, (size, index_size, latency) in reads.items():
+        index_column = f"{index_size:>13} {size - index_size:>10}" if index_size is not None else f"{'n/a':>13} {'':>10}"
+        print(f"  {label:<17} {size:>10} {index_column} {latency:>9.1f} us")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# bench_startup.py
+# Measures cold import time of app.py and time to first request, each in a fresh interpreter
+#
+# Usage: python bench_startup.py [--runs 10]
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/')
+t2 = time.perf_counter()
+response = client.get('/')
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'first_request': t2 - t1, 'second_request': t3 - t2, 'status': response.status_code}))
+"""
+
+
+def run_probe(env):
+    """Run the probe in a fresh interpreter and return its timings plus total wall time"""
+    import time
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', PROBE], env=env, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    timings = json.loads(output.stdout.strip().splitlines()[-1])
+    timings['process'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup-time benchmark')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.pop('DATABASE_URL', None)
+        env.update({
+            'SQLITE_PATH': os.path.join(tmp, 'bench.db'),
+            'AUTO_GENERATE': 'false',
+            'PYTHONDONTWRITEBYTECODE': '0',
+        })
+
+        # Schema creation is an explicit step, not part of startup
+        subprocess.run([sys.executable, 'init_db.py'], env=env, capture_output=True, check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+
+        run_probe(env)  # warm the bytecode cache
+        runs = [run_probe(env) for _ in range(args.runs)]
+
+    print(f"Startup benchmark ({args.runs} runs, SQLite, medians)")
+    for key, label in [('import', 'import app'), ('first_request', 'first request'),
+                       ('second_request', 'second request'), ('process', 'whole process')]:
+        values = [run[key] * 1000 for run in runs]
+        print(f"  {label:<15} {statistics.median(values):8.1f} ms   (min {min(values):.1f}, max {max(values):.1f})")
+
+
+if __name__ == '__main__':
+    main()
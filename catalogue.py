@@ -0,0 +1,205 @@
+# catalogue.py
+# Compact in-process catalogue of invention metadata for the home, domain and stats pages
+#
+# Listing pages need only id, domain, title, date and a short preview. Each web process
+# keeps those in a few typed arrays plus one UTF-8 text buffer instead of a dict per row:
+# 26 bytes of arrays plus the id, title and preview text, about 400-450 bytes per invention
+# in all, most of it the 300-character preview (some 45 MB per 100,000 inventions).
+# Positions are kept sorted by created_at, so recent inventions and per-domain listings
+# are slices found by binary search, and counts are array lengths.
+#
+# The catalogue loads on first use and then polls for rows created since the newest one
+# it has, at most every CATALOGUE_POLL_SECONDS. Saves in this process are taken in at
+# once by a save listener, including re-saves of existing inventions, whose new title and
+# preview replace the old ones. Re-saves in other processes keep their created_at, so the
+# poll doesn't see them; they show once this process restarts.
+
+import os
+import time
+import bisect
+import threading
+from array import array
+from datetime import datetime, timedelta
+import storage
+
+CATALOGUE_ENABLED = os.getenv('CATALOGUE_ENABLED', 'true').lower() == 'true'
+CATALOGUE_POLL_SECONDS = float(os.getenv('CATALOGUE_POLL_SECONDS', '5'))
+
+PREVIEW_LENGTH = 300  # as the domain page shows
+SEPARATOR = '\x1f'
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_seconds(value):
+    """created_at (a datetime, or a string from SQLite) as seconds since the epoch, UTC"""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return (value.replace(tzinfo=None) - EPOCH).total_seconds()
+
+
+class Catalogue:
+    """Invention metadata in parallel arrays, ordered by created_at"""
+
+    __slots__ = ('created', 'domains', 'offsets', 'text', 'replaced', 'order', 'by_domain',
+                 'domain_keys', 'domain_names', 'domain_numbers', 'newest', 'checked_at', '_lock')
+
+    def __init__(self):
+        self.created = array('d')       # seconds since the epoch, by arrival
+        self.domains = array('H')       # index into domain_keys, by arrival
+        self.offsets = array('Q', [0])  # text of arrival i is text[offsets[i]:offsets[i + 1]]
+        self.text = bytearray()         # "invention_id \x1f title \x1f preview", UTF-8
+        self.replaced = {}              # arrival -> text of a re-saved invention (text is append-only)
+        self.order = array('I')         # arrivals sorted by created_at
+        self.by_domain = []             # per domain number, its arrivals sorted by created_at
+        self.domain_keys = []
+        self.domain_names = []
+        self.domain_numbers = {}
+        self.newest = None              # raw created_at of the newest row, for polling
+        self.checked_at = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.created)
+
+    # --- loading -------------------------------------------------------
+
+    def refresh(self, force=False):
+        """Add rows created since the last poll"""
+        if not force and time.monotonic() - self.checked_at < CATALOGUE_POLL_SECONDS:
+            return
+        self.checked_at = time.monotonic()
+        rows = storage.get_repository().catalogue_since(self.newest, PREVIEW_LENGTH)
+        with self._lock:
+            for row in rows:
+                self.add(row)
+
+    def on_save(self, repository, rows, previous=()):
+        """Save listener: take in the saved rows, so re-saved titles and previews show at once"""
+        saved = repository.catalogue_rows([row['invention_id'] for row in rows], PREVIEW_LENGTH)
+        with self._lock:
+            for row in saved:
+                self.add(row)
+
+    def add(self, row):
+        """Insert one row in created_at order, or update the title and preview of one already held"""
+        seconds = to_seconds(row['created_at'])
+        key = lambda position: self.created[position]
+        start = bisect.bisect_left(self.order, seconds, key=key)
+        end = bisect.bisect_right(self.order, seconds, key=key)
+        fields = (row['invention_id'], row['title'] or '', (row['preview'] or '')[:PREVIEW_LENGTH])
+        text = SEPARATOR.join(field.replace(SEPARATOR, ' ') for field in fields).encode('utf-8')
+        for i in range(start, end):
+            position = self.order[i]
+            if self._field(position, 0) == row['invention_id']:
+                if text != self._text(position):
+                    self.replaced[position] = text
+                return
+
+        number = self.domain_numbers.get(row['domain_key'])
+        if number is None:
+            number = self.domain_numbers[row['domain_key']] = len(self.domain_keys)
+            self.domain_keys.append(row['domain_key'])
+            self.domain_names.append(row['domain_name'])
+            self.by_domain.append(array('I'))
+
+        position = len(self.created)
+        self.created.append(seconds)
+        self.domains.append(number)
+        self.text += text
+        self.offsets.append(len(self.text))
+        self.order.insert(end, position)
+        positions = self.by_domain[number]
+        positions.insert(bisect.bisect_right(positions, seconds, key=key), position)
+        if self.newest is None or seconds >= to_seconds(self.newest):
+            self.newest = row['created_at']
+
+    # --- reading -------------------------------------------------------
+
+    def _text(self, position):
+        text = self.replaced.get(position)
+        return text if text is not None else bytes(self.text[self.offsets[position]:self.offsets[position + 1]])
+
+    def _field(self, position, index):
+        return self._text(position).decode('utf-8').split(SEPARATOR)[index]
+
+    def row(self, position, preview_length=PREVIEW_LENGTH):
+        """The listing columns storage returns for one invention"""
+        invention_id, title, preview = self._text(position).decode('utf-8').split(SEPARATOR)
+        created_at = EPOCH + timedelta(seconds=self.created[position])
+        number = self.domains[position]
+        return {
+            'id': invention_id,
+            'invention_id': invention_id,
+            'domain_key': self.domain_keys[number],
+            'domain_name': self.domain_names[number],
+            'title': title,
+            'preview': preview[:preview_length],
+            'created_at': created_at,
+            'date': created_at.date().isoformat(),
+        }
+
+    def recent(self, limit, preview_length=200):
+        """Newest inventions across all domains"""
+        with self._lock:
+            return [self.row(p, preview_length) for p in reversed(self.order[-limit:] if limit else self.order)]
+
+    def domain(self, domain_key, limit=None, preview_length=PREVIEW_LENGTH):
+        """Newest-first inventions in one domain"""
+        with self._lock:
+            number = self.domain_numbers.get(domain_key)
+            if number is None:
+                return []
+            positions = self.by_domain[number]
+            return [self.row(p, preview_length) for p in reversed(positions[-limit:] if limit else positions)]
+
+    def stats(self):
+        """The same shape as Repository.get_stats()"""
+        with self._lock:
+            by_domain = {key: len(self.by_domain[n]) for n, key in enumerate(self.domain_keys) if self.by_domain[n]}
+            return {
+                'total_inventions': len(self.created),
+                'domains_active': len(by_domain),
+                'by_domain': by_domain,
+            }
+
+    def memory_bytes(self):
+        """Bytes held by the arrays and text"""
+        arrays = [self.created, self.domains, self.offsets, self.order] + self.by_domain
+        return (sum(a.itemsize * len(a) for a in arrays) + len(self.text)
+                + sum(len(text) for text in self.replaced.values()))
+
+
+_catalogue = None
+_load_lock = threading.Lock()
+
+
+def get_catalogue():
+    """This process's catalogue, loaded on first use and kept fresh by polling"""
+    global _catalogue
+    if _catalogue is None:
+        with _load_lock:
+            if _catalogue is None:
+                catalogue = Catalogue()
+                catalogue.refresh(force=True)
+                storage.on_save(catalogue.on_save)
+                _catalogue = catalogue
+    _catalogue.refresh()
+    return _catalogue
+
+
+# Listing reads for app.py: from the catalogue, or the database when it is disabled
+
+def get_stats():
+    return get_catalogue().stats() if CATALOGUE_ENABLED else storage.get_stats()
+
+
+def get_inventions_by_domain(domain_key, limit=None):
+    if CATALOGUE_ENABLED:
+        return get_catalogue().domain(domain_key, limit)
+    return storage.get_inventions_by_domain(domain_key, limit)
+
+
+def get_all_inventions(limit=100):
+    if CATALOGUE_ENABLED:
+        return get_catalogue().recent(limit)
+    return storage.get_all_inventions(limit)
@@ -0,0 +1,124 @@
+# compression.py
+# Transparent zstd compression of invention content with corpus-trained dictionaries
+#
+# Each row records how its body is stored in content_codec: NULL means plain text in
+# `content`, 0 means zstd without a dictionary, and n means zstd with dictionary
+# version n from the content_dictionaries table. Rows are decompressed only when
+# their content is read (see storage.InventionRow). Train a dictionary once the corpus has some inventions:
+#
+#   python compression.py train --recompress
+
+if __name__ == '__main__':
+    # Running from the command line: load .env before configuration is read
+    from dotenv import load_dotenv
+    load_dotenv()
+
+import os
+import threading
+
+CONTENT_COMPRESSION = os.getenv('CONTENT_COMPRESSION', 'true').lower() == 'true'
+CONTENT_COMPRESSION_LEVEL = int(os.getenv('CONTENT_COMPRESSION_LEVEL', '9'))
+DICTIONARY_SIZE = int(os.getenv('CONTENT_DICTIONARY_SIZE', '16384'))  # bytes
+DICTIONARY_SAMPLES = int(os.getenv('CONTENT_DICTIONARY_SAMPLES', '2000'))  # inventions to train on
+
+# zstd cannot train a useful dictionary from fewer documents
+MIN_TRAINING_SAMPLES = 8
+NO_DICTIONARY = 0
+
+
+class ContentCodec:
+    """Compresses with the newest dictionary and decompresses with whichever one a row names"""
+
+    def __init__(self, load_dictionaries, level=CONTENT_COMPRESSION_LEVEL):
+        # load_dictionaries() returns {version: dictionary bytes}
+        self.load_dictionaries = load_dictionaries
+        self.level = level
+        self._dictionaries = None
+        self._lock = threading.Lock()
+        # zstd compressor objects must not be shared between threads
+        self._local = threading.local()
+
+    def refresh(self):
+        """Reload dictionaries (after training a new one)"""
+        import zstandard
+
+        dictionaries = {
+            version: zstandard.ZstdCompressionDict(bytes(data))
+            for version, data in self.load_dictionaries().items()
+        }
+        with self._lock:
+            self._dictionaries = dictionaries
+
+    def latest_version(self):
+        """Dictionary version new content is compressed with"""
+        if self._dictionaries is None:
+            self.refresh()
+        return max(self._dictionaries, default=NO_DICTIONARY)
+
+    def _dictionary(self, version):
+        if version == NO_DICTIONARY:
+            return None
+        if self._dictionaries is None or version not in self._dictionaries:
+            # Trained by another process since we loaded them
+            self.refresh()
+        return self._dictionaries[version]
+
+    def _cached(self, kind, version, factory):
+        cache = self._local.__dict__.setdefault(kind, {})
+        if version not in cache:
+            cache[version] = factory()
+        return cache[version]
+
+    def compress(self, text):
+        """(dictionary version, compressed bytes) for a document"""
+        import zstandard
+
+        version = self.latest_version()
+        compressor = self._cached('compressors', version, lambda: zstandard.ZstdCompressor(
+            level=self.level, dict_data=self._dictionary(version), write_content_size=True))
+        return version, compressor.compress(text.encode('utf-8'))
+
+    def decompress(self, version, blob):
+        """The document stored in a compressed blob"""
+        import zstandard
+
+        decompressor = self._cached('decompressors', version, lambda: zstandard.ZstdDecompressor(
+            dict_data=self._dictionary(version)))
+        return decompressor.decompress(blob).decode('utf-8')
+
+
+def train_dictionary(samples, size=DICTIONARY_SIZE):
+    """Train a zstd dictionary from a list of documents"""
+    import zstandard
+
+    if len(samples) < MIN_TRAINING_SAMPLES:
+        raise ValueError(f"Need at least {MIN_TRAINING_SAMPLES} inventions to train a dictionary, found {len(samples)}")
+    return zstandard.train_dictionary(size, [text.encode('utf-8') for text in samples]).as_bytes()
+
+
+def main():
+    """Train a content dictionary and optionally recompress stored inventions with it"""
+    import argparse
+    import storage
+
+    parser = argparse.ArgumentParser(description='Content compression maintenance')
+    parser.add_argument('command', choices=['train', 'recompress'])
+    parser.add_argument('--recompress', action='store_true', help='after training, rewrite every row with the new dictionary')
+    parser.add_argument('--size', type=int, default=DICTIONARY_SIZE, help='dictionary size in bytes')
+    parser.add_argument('--samples', type=int, default=DICTIONARY_SAMPLES, help='inventions to train on')
+    args = parser.parse_args()
+
+    repository = storage.get_repository()
+    if args.command == 'train':
+        samples = repository.sample_contents(args.samples)
+        version = repository.add_dictionary(train_dictionary(samples, args.size))
+        print(f"📚 Trained content dictionary v{version} from {len(samples)} inventions")
+
+    if args.command == 'recompress' or args.recompress:
+        count = repository.recompress_all()
+        print(f"🗜️  Recompressed {count} inventions with dictionary v{repository.codec.latest_version()}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
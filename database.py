@@ -2,229 +2,314 @@
 # PostgreSQL database management for Perpetual Ideas Machine
 
 import os
+import time
+import random
+import threading
+from urllib.parse import urlsplit
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from urllib.parse import urlparse
-from dotenv import load_dotenv
-
-load_dotenv()
-
-
-def get_db_connection():
-    """Get PostgreSQL database connection"""
-    database_url = os.getenv('DATABASE_URL')
-    
-    if not database_url:
-        raise ValueError(
-            "DATABASE_URL not set in environment.\n"
-            "For local development, you need PostgreSQL installed.\n"
-            "See DATABASE_SETUP.md for setup instructions.\n\n"
-            "Quick setup:\n"
-            "  brew install postgresql@15\n"
-            "  brew services start postgresql@15\n"
-            "  createdb pim_db\n"
-            "  echo 'DATABASE_URL=postgresql://localhost:5432/pim_db' >> .env"
-        )
-    
-    # Heroku uses postgres://, but psycopg2 requires postgresql://
-    if database_url.startswith('postgres://'):
-        database_url = database_url.replace('postgres://', 'postgresql://', 1)
-    
-    conn = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
-    return conn
-
-
-def init_db():
-    """Initialize database tables"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Create inventions table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS inventions (
-            id SERIAL PRIMARY KEY,
-            invention_id VARCHAR(255) UNIQUE NOT NULL,
-            domain_key VARCHAR(255) NOT NULL,
-            domain_name VARCHAR(255) NOT NULL,
-            title TEXT,
-            content TEXT NOT NULL,
-            hash VARCHAR(64) NOT NULL,
-            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+from psycopg2.extras import RealDictCursor, execute_batch
+from storage import Repository, QUERIES, PREVIEW_LENGTH, compile_positional
+
+# Optional read replicas: comma-separated PostgreSQL URLs
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '5'))  # seconds behind the primary before falling back
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '5'))  # seconds between health checks
+
+# Bound how long a request thread can wait on an unreachable or stuck server (primary and replicas)
+DATABASE_CONNECT_TIMEOUT = int(os.getenv('DATABASE_CONNECT_TIMEOUT', '3'))  # seconds
+DATABASE_STATEMENT_TIMEOUT = float(os.getenv('DATABASE_STATEMENT_TIMEOUT', '5'))  # seconds, 0 disables
+
+
+def describe_url(url):
+    """host:port/database without credentials, for logs"""
+    parts = urlsplit(url)
+    return f"{parts.hostname}:{parts.port or 5432}{parts.path}"
+
+
+class Replica:
+    """A read replica with its own connections, health and replication lag"""
+
+    def __init__(self, url):
+        self.name = describe_url(url)
+        self.repository = PostgresRepository(url)
+        self.healthy = True
+        self.lag = None
+        self.checked_at = None
+        self.reads = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Whether the replica may serve reads, re-checking it when the last check is stale"""
+        with self._lock:
+            due = self.checked_at is None or time.monotonic() - self.checked_at >= REPLICA_CHECK_INTERVAL
+            if due:
+                # Other threads keep using the last result while this one checks
+                self.checked_at = time.monotonic()
+        if due:
+            self.check()
+        return self.healthy and self.lag is not None and self.lag <= REPLICA_MAX_LAG
+
+    def check(self):
+        try:
+            lag = float(self.repository.fetch_one('replica_lag')['lag'])
+        except psycopg2.Error as e:
+            self.mark_failed(e)
+            return
+        if lag > REPLICA_MAX_LAG and (self.lag is None or self.lag <= REPLICA_MAX_LAG):
+            print(f"⚠️  Replica {self.name} is {lag:.1f}s behind, reading from the primary")
+        elif lag <= REPLICA_MAX_LAG and (not self.healthy or (self.lag is not None and self.lag > REPLICA_MAX_LAG)):
+            print(f"✅ Replica {self.name} caught up ({lag:.1f}s behind)")
+        self.healthy = True
+        self.lag = lag
+
+    def mark_failed(self, error):
+        self.failures += 1
+        if self.healthy:
+            print(f"⚠️  Replica {self.name} unavailable, reading from the primary: {error}")
+        self.healthy = False
+        with self._lock:
+            self.checked_at = time.monotonic()
+
+
+class PostgresRepository(Repository):
+    """PostgreSQL backend using server-side prepared statements"""
+
+    dialect = 'postgres'
+    no_limit = None  # LIMIT NULL returns every row
+
+    migrations = [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS inventions (
+                id SERIAL PRIMARY KEY,
+                invention_id VARCHAR(255) UNIQUE NOT NULL,
+                domain_key VARCHAR(255) NOT NULL,
+                domain_name VARCHAR(255) NOT NULL,
+                title TEXT,
+                content TEXT NOT NULL,
+                hash VARCHAR(64) NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_domain_key ON inventions(domain_key)",
+            "CREATE INDEX IF NOT EXISTS idx_created_at ON inventions(created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_invention_id ON inventions(invention_id)",
+        ]),
+        (2, [
+            # Compressed content (see compression.py) and an uncompressed preview for listings
+            "ALTER TABLE inventions ADD COLUMN IF NOT EXISTS content_codec INTEGER",
+            "ALTER TABLE inventions ADD COLUMN IF NOT EXISTS content_z BYTEA",
+            "ALTER TABLE inventions ADD COLUMN IF NOT EXISTS preview TEXT",
+            # Already compressed: keep TOAST from trying pglz on it again
+            "ALTER TABLE inventions ALTER COLUMN content_z SET STORAGE EXTERNAL",
+            f"UPDATE inventions SET preview = substr(content, 1, {PREVIEW_LENGTH}) WHERE preview IS NULL",
+            """
+            CREATE TABLE IF NOT EXISTS content_dictionaries (
+                version INTEGER PRIMARY KEY,
+                dictionary BYTEA NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ]),
+        (3, [
+            # Where the body lives when not in this table (see segment_store.py)
+            "ALTER TABLE inventions ADD COLUMN IF NOT EXISTS content_store TEXT",
+        ]),
+        (4, [
+            # Pre-rendered feeds and sitemaps (see feeds.py)
+            """
+            CREATE TABLE IF NOT EXISTS feeds (
+                name VARCHAR(255) PRIMARY KEY,
+                content_type VARCHAR(255) NOT NULL,
+                body TEXT NOT NULL,
+                etag VARCHAR(64) NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            )
+            """,
+        ]),
+        (5, [
+            # Corpus generation for search caches and the popular-search tally (see search_cache.py)
+            """
+            CREATE TABLE IF NOT EXISTS counters (
+                name VARCHAR(255) PRIMARY KEY,
+                value BIGINT NOT NULL DEFAULT 0
+            )
+            """,
+            "INSERT INTO counters (name, value) VALUES ('corpus_generation', 0) ON CONFLICT (name) DO NOTHING",
+            """
+            CREATE TABLE IF NOT EXISTS search_queries (
+                query VARCHAR(255) PRIMARY KEY,
+                searches BIGINT NOT NULL DEFAULT 0,
+                last_searched TIMESTAMP
+            )
+            """,
+        ]),
+        (6, [
+            # Trigram search index and term vocabulary (see search_index.py)
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            # Titles and plain bodies are indexed where they are stored...
+            "CREATE INDEX IF NOT EXISTS idx_inventions_title_trgm ON inventions USING GIN (title gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS idx_inventions_content_trgm ON inventions USING GIN (content gin_trgm_ops)",
+            # ...and only bodies kept compressed or in segment files need a plain-text copy
+            """
+            CREATE TABLE IF NOT EXISTS invention_search (
+                invention_id VARCHAR(255) PRIMARY KEY,
+                body TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_search_body_trgm ON invention_search USING GIN (body gin_trgm_ops)",
+            """
+            CREATE TABLE IF NOT EXISTS search_terms (
+                term VARCHAR(64) PRIMARY KEY,
+                documents INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_search_terms_trgm ON search_terms USING GIN (term gin_trgm_ops)",
+        ]),
+        # No schema change: the vocabulary is re-extracted without ids, hashes and boilerplate
+        (7, []),
+    ]
+
+    def __init__(self, database_url, replica_urls=()):
+        super().__init__()
+        # Heroku uses postgres://, but psycopg2 requires postgresql://
+        if database_url.startswith('postgres://'):
+            database_url = database_url.replace('postgres://', 'postgresql://', 1)
+        self.database_url = database_url
+        self.statements = {
+            name: compile_positional(query.sql['postgres'], lambda n: f"${n}")
+            for name, query in QUERIES.items() if query.sql['postgres']
+        }
+        self.replicas = [Replica(url) for url in replica_urls]
+        self.primary_reads = 0
+        if self.replicas:
+            print(f"📚 Load-balancing reads across {len(self.replicas)} replica(s)")
+
+    def _run(self, name, params, fetch):
+        """Send replica-safe reads to a healthy replica, everything else to the primary"""
+        query = QUERIES[name]
+        if self.replicas and query.replica and not self.pinned() and not self.in_transaction():
+            candidates = [replica for replica in self.replicas if replica.available()]
+            if candidates:
+                replica = random.choice(candidates)
+                try:
+                    result = replica.repository._execute(replica.repository.connection(), name, params, fetch)
+                except psycopg2.Error as e:
+                    replica.mark_failed(e)
+                else:
+                    replica.reads += 1
+                    if not (query.primary_fallback and fetch == 'one' and result is None):
+                        return self._decode_result(result, fetch)
+        if query.readonly:
+            self.primary_reads += 1
+        return super()._run(name, params, fetch)
+
+    def replica_status(self):
+        """Health, lag and read counts for each replica"""
+        status = {
+            replica.name: {
+                'healthy': replica.healthy,
+                'lag': replica.lag,
+                'reads': replica.reads,
+                'failures': replica.failures,
+            }
+            for replica in self.replicas
+        }
+        status['primary'] = {'healthy': True, 'lag': 0.0, 'reads': self.primary_reads, 'failures': 0}
+        return status
+
+    def connect(self):
+        """Get PostgreSQL database connection"""
+        conn = psycopg2.connect(
+            self.database_url,
+            cursor_factory=RealDictCursor,
+            connect_timeout=DATABASE_CONNECT_TIMEOUT,
+            options=f"-c statement_timeout={int(DATABASE_STATEMENT_TIMEOUT * 1000)}",
         )
-    """)
-    
-    # Create indexes
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_domain_key ON inventions(domain_key)
-    """)
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_created_at ON inventions(created_at)
-    """)
-    cur.execute("""
-        CREATE INDEX IF NOT EXISTS idx_invention_id ON inventions(invention_id)
-    """)
-    
-    conn.commit()
-    cur.close()
-    conn.close()
-    print("✅ Database initialized")
-
-
-def save_invention(invention_id, domain_key, domain_name, title, content, hash_value):
-    """Save invention to database"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
-            INSERT INTO inventions (invention_id, domain_key, domain_name, title, content, hash)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (invention_id) DO UPDATE
-            SET content = EXCLUDED.content,
-                title = EXCLUDED.title,
-                hash = EXCLUDED.hash
-        """, (invention_id, domain_key, domain_name, title, content, hash_value))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
-
-
-def get_invention(domain_key, invention_id):
-    """Get a specific invention"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT * FROM inventions
-        WHERE domain_key = %s AND invention_id = %s
-    """, (domain_key, invention_id))
-    
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    
-    return dict(result) if result else None
-
-
-def get_inventions_by_domain(domain_key, limit=None):
-    """Get all inventions for a domain"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    query = """
-        SELECT invention_id as id, invention_id, domain_key, domain_name, title, 
-               LEFT(content, 300) as preview, created_at,
-               DATE(created_at) as date
-        FROM inventions
-        WHERE domain_key = %s
-        ORDER BY created_at DESC
-    """
-    
-    if limit:
-        query += f" LIMIT {limit}"
-    
-    cur.execute(query, (domain_key,))
-    
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
-    
-    return [dict(row) for row in results]
-
-
-def get_all_inventions(limit=100):
-    """Get all inventions across all domains"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT invention_id as id, invention_id, domain_key, domain_name, title,
-               LEFT(content, 200) as preview, created_at,
-               DATE(created_at) as date
-        FROM inventions
-        ORDER BY created_at DESC
-        LIMIT %s
-    """, (limit,))
-    
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
-    
-    return [dict(row) for row in results]
-
-
-def search_inventions(query):
-    """Search inventions by content"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    search_term = f"%{query}%"
-    
-    cur.execute("""
-        SELECT invention_id as id, invention_id, domain_key, domain_name, title, content, created_at,
-               DATE(created_at) as date
-        FROM inventions
-        WHERE LOWER(content) LIKE LOWER(%s) OR LOWER(title) LIKE LOWER(%s)
-        ORDER BY created_at DESC
-        LIMIT 50
-    """, (search_term, search_term))
-    
-    results = cur.fetchall()
-    cur.close()
-    conn.close()
-    
-    return [dict(row) for row in results]
-
-
-def count_inventions_by_domain(domain_key):
-    """Count inventions in a domain"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT COUNT(*) as count
-        FROM inventions
-        WHERE domain_key = %s
-    """, (domain_key,))
-    
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    
-    return result['count'] if result else 0
-
-
-def get_stats():
-    """Get overall statistics"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Total inventions
-    cur.execute("SELECT COUNT(*) as total FROM inventions")
-    total = cur.fetchone()['total']
-    
-    # Count by domain
-    cur.execute("""
-        SELECT domain_key, COUNT(*) as count
-        FROM inventions
-        GROUP BY domain_key
-    """)
-    by_domain = {row['domain_key']: row['count'] for row in cur.fetchall()}
-    
-    # Active domains
-    domains_active = len(by_domain)
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'total_inventions': total,
-        'domains_active': domains_active,
-        'by_domain': by_domain
-    }
+        # Single statements commit on their own; batches open explicit transactions
+        conn.autocommit = True
+        return conn
+
+    def _prepare(self, cur, name):
+        """PREPARE a catalogue query on this connection the first time it is used"""
+        if name in self._local.prepared:
+            return
+        sql, _ = self.statements[name]
+        cur.execute(f"PREPARE pim_{name} AS {sql}")
+        self._local.prepared.add(name)
+
+    def _execute_sql(self, name, params):
+        _, order = self.statements[name]
+        values = tuple(params[key] for key in order)
+        placeholders = ', '.join(['%s'] * len(values))
+        return (f"EXECUTE pim_{name} ({placeholders})" if values else f"EXECUTE pim_{name}"), values
+
+    def _execute(self, conn, name, params, fetch, retry=True):
+        try:
+            with conn.cursor() as cur:
+                self._prepare(cur, name)
+                cur.execute(*self._execute_sql(name, params))
+                if fetch == 'one':
+                    row = cur.fetchone()
+                    return dict(row) if row else None
+                if fetch == 'all':
+                    return [dict(row) for row in cur.fetchall()]
+                return cur.rowcount
+        except psycopg2.errors.FeatureNotSupported:
+            # "cached plan must not change result type" after a migration altered the table
+            if self.in_transaction():
+                # The error aborted the transaction; a new connection prepares the statement afresh
+                self.reset_connection()
+                raise
+            if not retry:
+                raise
+            with conn.cursor() as cur:
+                cur.execute(f"DEALLOCATE pim_{name}")
+            self._local.prepared.discard(name)
+            return self._execute(conn, name, params, fetch, retry=False)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The server closed the connection; reconnect once (never mid-transaction)
+            self.reset_connection()
+            if not retry or self.in_transaction():
+                raise
+            return self._execute(self.connection(), name, params, fetch, retry=False)
+
+    def _execute_many(self, conn, name, param_rows):
+        with conn.cursor() as cur:
+            self._prepare(cur, name)
+            calls = [self._execute_sql(name, row) for row in param_rows]
+            execute_batch(cur, calls[0][0], [values for _, values in calls])
+
+    def _statement(self, conn, sql):
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            if sql == 'ROLLBACK':
+                # Don't rely on statements prepared in the rolled back transaction
+                cur.execute("DEALLOCATE ALL")
+                self._local.prepared.clear()
+
+    def _applied_versions(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("SELECT version FROM schema_migrations")
+            return {row['version'] for row in cur.fetchall()}
 
+    def _migrate(self, conn, version, statements):
+        with conn.cursor() as cur:
+            cur.execute("BEGIN")
+            try:
+                # Index builds and backfilling UPDATEs may take longer than a request query
+                cur.execute("SET LOCAL statement_timeout = 0")
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
@@ -1,178 +1,174 @@
 # database_sqlite.py
 # SQLite fallback for local development (does NOT work on Heroku)
 
-import sqlite3
+import json
 import os
-from datetime import datetime
-
-DB_PATH = 'local_inventions.db'
-
-def init_db():
-    """Initialize SQLite database"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS inventions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            invention_id TEXT UNIQUE NOT NULL,
-            domain_key TEXT NOT NULL,
-            domain_name TEXT NOT NULL,
-            title TEXT,
-            content TEXT NOT NULL,
-            hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_domain_key ON inventions(domain_key)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON inventions(created_at)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_invention_id ON inventions(invention_id)")
-    
-    conn.commit()
-    conn.close()
-    print("✅ SQLite database initialized (local development only)")
-
-def save_invention(invention_id, domain_key, domain_name, title, content, hash_value):
-    """Save invention to SQLite database"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
-            INSERT OR REPLACE INTO inventions 
-            (invention_id, domain_key, domain_name, title, content, hash)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (invention_id, domain_key, domain_name, title, content, hash_value))
-        
-        conn.commit()
-    finally:
-        conn.close()
-
-def get_invention(domain_key, invention_id):
-    """Get a specific invention"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT * FROM inventions
-        WHERE domain_key = ? AND invention_id = ?
-    """, (domain_key, invention_id))
-    
-    result = cur.fetchone()
-    conn.close()
-    
-    return dict(result) if result else None
-
-def get_inventions_by_domain(domain_key, limit=None):
-    """Get all inventions for a domain"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    
-    query = """
-        SELECT invention_id as id, invention_id, domain_key, domain_name, title, 
-               substr(content, 1, 300) as preview, created_at,
-               DATE(created_at) as date
-        FROM inventions
-        WHERE domain_key = ?
-        ORDER BY created_at DESC
-    """
-    
-    if limit:
-        query += f" LIMIT {limit}"
-    
-    cur.execute(query, (domain_key,))
-    results = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    
-    return results
-
-def get_all_inventions(limit=100):
-    """Get all inventions across all domains"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT invention_id as id, invention_id, domain_key, domain_name, title,
-               substr(content, 1, 200) as preview, created_at,
-               DATE(created_at) as date
-        FROM inventions
-        ORDER BY created_at DESC
-        LIMIT ?
-    """, (limit,))
-    
-    results = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    
-    return results
-
-def search_inventions(query):
-    """Search inventions by content"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    
-    search_term = f"%{query}%"
-    
-    cur.execute("""
-        SELECT invention_id as id, invention_id, domain_key, domain_name, title, content, created_at,
-               DATE(created_at) as date
-        FROM inventions
-        WHERE LOWER(content) LIKE LOWER(?) OR LOWER(title) LIKE LOWER(?)
-        ORDER BY created_at DESC
-        LIMIT 50
-    """, (search_term, search_term))
-    
-    results = [dict(row) for row in cur.fetchall()]
-    conn.close()
-    
-    return results
-
-def count_inventions_by_domain(domain_key):
-    """Count inventions in a domain"""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT COUNT(*) as count
-        FROM inventions
-        WHERE domain_key = ?
-    """, (domain_key,))
-    
-    result = cur.fetchone()
-    conn.close()
-    
-    return result[0] if result else 0
-
-def get_stats():
-    """Get overall statistics"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    
-    # Total inventions
-    cur.execute("SELECT COUNT(*) as total FROM inventions")
-    total = cur.fetchone()['total']
-    
-    # Count by domain
-    cur.execute("""
-        SELECT domain_key, COUNT(*) as count
-        FROM inventions
-        GROUP BY domain_key
-    """)
-    by_domain = {row['domain_key']: row['count'] for row in cur.fetchall()}
-    
-    # Active domains
-    domains_active = len(by_domain)
-    
-    conn.close()
-    
-    return {
-        'total_inventions': total,
-        'domains_active': domains_active,
-        'by_domain': by_domain
-    }
+import sqlite3
+from storage import Repository, QUERIES, PREVIEW_LENGTH
+from search_index import trigrams
+
+DB_PATH = os.getenv('SQLITE_PATH', 'local_inventions.db')
+
+
+class SQLiteRepository(Repository):
+    """SQLite backend; sqlite3 keeps the compiled catalogue statements in its per-connection cache"""
+
+    dialect = 'sqlite'
+    no_limit = -1  # SQLite rejects LIMIT NULL
+
+    migrations = [
+        (1, [
+            """
+            CREATE TABLE IF NOT EXISTS inventions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                invention_id TEXT UNIQUE NOT NULL,
+                domain_key TEXT NOT NULL,
+                domain_name TEXT NOT NULL,
+                title TEXT,
+                content TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_domain_key ON inventions(domain_key)",
+            "CREATE INDEX IF NOT EXISTS idx_created_at ON inventions(created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_invention_id ON inventions(invention_id)",
+        ]),
+        (2, [
+            # Compressed content (see compression.py) and an uncompressed preview for listings
+            "ALTER TABLE inventions ADD COLUMN content_codec INTEGER",
+            "ALTER TABLE inventions ADD COLUMN content_z BLOB",
+            "ALTER TABLE inventions ADD COLUMN preview TEXT",
+            f"UPDATE inventions SET preview = substr(content, 1, {PREVIEW_LENGTH}) WHERE preview IS NULL",
+            """
+            CREATE TABLE IF NOT EXISTS content_dictionaries (
+                version INTEGER PRIMARY KEY,
+                dictionary BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ]),
+        (3, [
+            # Where the body lives when not in this table (see segment_store.py)
+            "ALTER TABLE inventions ADD COLUMN content_store TEXT",
+        ]),
+        (4, [
+            # Pre-rendered feeds and sitemaps (see feeds.py)
+            """
+            CREATE TABLE IF NOT EXISTS feeds (
+                name TEXT PRIMARY KEY,
+                content_type TEXT NOT NULL,
+                body TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                updated_at TIMESTAMP NOT NULL
+            )
+            """,
+        ]),
+        (5, [
+            # Corpus generation for search caches and the popular-search tally (see search_cache.py)
+            """
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            "INSERT INTO counters (name, value) VALUES ('corpus_generation', 0) ON CONFLICT (name) DO NOTHING",
+            """
+            CREATE TABLE IF NOT EXISTS search_queries (
+                query TEXT PRIMARY KEY,
+                searches INTEGER NOT NULL DEFAULT 0,
+                last_searched TIMESTAMP
+            )
+            """,
+        ]),
+        (6, [
+            # Trigram search index and term vocabulary (see search_index.py)
+            # Contentless: the index alone, not a second copy of every body
+            "CREATE VIRTUAL TABLE IF NOT EXISTS invention_search USING fts5(title, body, content='', tokenize='trigram')",
+            """
+            CREATE TABLE IF NOT EXISTS search_terms (
+                term TEXT PRIMARY KEY,
+                documents INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS term_trigrams (
+                trigram TEXT NOT NULL,
+                term TEXT NOT NULL,
+                PRIMARY KEY (trigram, term)
+            ) WITHOUT ROWID
+            """,
+        ]),
+        # No schema change: the vocabulary is re-extracted without ids, hashes and boilerplate
+        (7, []),
+    ]
+
+    # Take the write lock up front, so concurrent saves queue instead of failing to upgrade
+    begin = 'BEGIN IMMEDIATE'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.statements = {name: query.sql['sqlite'] for name, query in QUERIES.items() if query.sql['sqlite']}
+
+    def connect(self):
+        """Get SQLite database connection"""
+        # Large enough to keep every catalogue statement compiled
+        conn = sqlite3.connect(self.path, cached_statements=256, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _index_terms(self, counts):
+        """Also store new terms' trigrams, which pg_trgm would index on PostgreSQL"""
+        super()._index_terms(counts)
+        self.execute_many('save_term_trigrams', [{'term': term, 'trigrams': sorted(trigrams(term))}
+                                                 for term, n in sorted(counts.items()) if n > 0])
+
+    def clear_search_index(self):
+        with self.transaction():
+            super().clear_search_index()
+            self.execute('clear_term_trigrams')
+
+    def lock_feeds(self):
+        """The transaction's BEGIN IMMEDIATE already excludes other writers"""
+
+    def _bind(self, name, params):
+        """Arrays travel as JSON and are unpacked with json_each()"""
+        arrays = QUERIES[name].arrays
+        return {key: json.dumps(value) if key in arrays else value for key, value in params.items()}
+
+    def _execute(self, conn, name, params, fetch):
+        cur = conn.execute(self.statements[name], self._bind(name, params))
+        if fetch == 'one':
+            row = cur.fetchone()
+            return dict(row) if row else None
+        if fetch == 'all':
+            return [dict(row) for row in cur.fetchall()]
+        return cur.rowcount
+
+    def _execute_many(self, conn, name, param_rows):
+        conn.executemany(self.statements[name], [self._bind(name, row) for row in param_rows])
+
+    def _statement(self, conn, sql):
+        conn.execute(sql)
+
+    def _applied_versions(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        return {row['version'] for row in conn.execute("SELECT version FROM schema_migrations")}
 
+    def _migrate(self, conn, version, statements):
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("INSERT INTO schema_migrations (version) VALUES (?)", (version,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
@@ -0,0 +1,351 @@
+# feeds.py
+# Atom/JSON feeds and sharded sitemaps, rebuilt when inventions are saved and served from cache
+#
+# Crawlers and prior-art indexers poll these instead of the domain listing pages.
+# Every save re-renders only what it touches (the global feeds and its domain's feeds)
+# and appends new inventions to the newest sitemap shard, re-rendering a shard only when
+# the append can't be trusted and the sitemap index only when a shard is added. Results
+# are stored in the feeds table, so web processes on other dynos serve the same bytes.
+# Rebuilds hold a lock for their transaction, so the web and worker processes never
+# overwrite a newer document with one built from older rows.
+# Web processes keep the rendered documents in memory and revalidate them against the
+# table's ETag.
+
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from xml.sax.saxutils import escape
+from domains import DOMAINS
+import storage
+
+SITE_URL = os.getenv('SITE_URL', 'http://localhost:5000').rstrip('/')
+SITE_TITLE = 'Perpetual Ideas Machine'
+FEED_SIZE = int(os.getenv('FEED_SIZE', '50'))  # entries per feed
+FEED_CACHE_SECONDS = float(os.getenv('FEED_CACHE_SECONDS', '60'))  # between ETag checks against the database
+SITEMAP_SHARD_SIZE = 50000  # URLs per sitemap file (the sitemaps.org limit)
+
+ATOM = 'application/atom+xml; charset=utf-8'
+JSON_FEED = 'application/feed+json; charset=utf-8'
+XML = 'application/xml; charset=utf-8'
+
+
+def invention_url(domain_key, invention_id):
+    return f"{SITE_URL}/invention/{domain_key}/{invention_id}"
+
+
+def as_datetime(value):
+    """created_at as a datetime (SQLite returns strings)"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def iso(value):
+    return as_datetime(value).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def shard_name(number):
+    return f"sitemaps/inventions-{number:04d}.xml"
+
+
+def feed_names(domain_key=None):
+    """Names of the Atom and JSON feeds for the whole site or one domain"""
+    prefix = f"domain/{domain_key}/" if domain_key else ''
+    return [f"{prefix}feed.atom", f"{prefix}feed.json"]
+
+
+# --- rendering -----------------------------------------------------------
+
+def render_atom(entries, title, self_url, home_url):
+    updated = iso(entries[0]['created_at']) if entries else iso(datetime.utcnow())
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<feed xmlns="http://www.w3.org/2005/Atom">',
+        f'  <title>{escape(title)}</title>',
+        f'  <id>{escape(self_url)}</id>',
+        f'  <link rel="self" href="{escape(self_url)}"/>',
+        f'  <link rel="alternate" href="{escape(home_url)}"/>',
+        f'  <updated>{updated}</updated>',
+        f'  <author><name>{SITE_TITLE}</name></author>',
+        '  <rights>CC0 1.0 Universal (Public Domain Dedication)</rights>',
+    ]
+    for entry in entries:
+        url = invention_url(entry['domain_key'], entry['invention_id'])
+        parts += [
+            '  <entry>',
+            f'    <title>{escape(entry["title"] or entry["invention_id"])}</title>',
+            f'    <id>{escape(url)}</id>',
+            f'    <link href="{escape(url)}"/>',
+            f'    <published>{iso(entry["created_at"])}</published>',
+            f'    <updated>{iso(entry["created_at"])}</updated>',
+            f'    <category term="{escape(entry["domain_key"])}" label="{escape(entry["domain_name"])}"/>',
+            f'    <summary>{escape(entry["preview"] or "")}</summary>',
+            '  </entry>',
+        ]
+    parts.append('</feed>')
+    return '\n'.join(parts) + '\n'
+
+
+def render_json_feed(entries, title, self_url, home_url):
+    return json.dumps({
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': title,
+        'home_page_url': home_url,
+        'feed_url': self_url,
+        'items': [
+            {
+                'id': invention_url(entry['domain_key'], entry['invention_id']),
+                'url': invention_url(entry['domain_key'], entry['invention_id']),
+                'title': entry['title'] or entry['invention_id'],
+                'summary': entry['preview'] or '',
+                'date_published': iso(entry['created_at']),
+                'tags': [entry['domain_key']],
+            }
+            for entry in entries
+        ],
+    }, indent=1) + '\n'
+
+
+def render_urlset(urls):
+    """A sitemap from (url, lastmod or None) pairs"""
+    parts = ['<?xml version="1.0" encoding="utf-8"?>',
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    parts += [render_url(url, lastmod) for url, lastmod in urls]
+    parts.append('</urlset>')
+    return '\n'.join(parts) + '\n'
+
+
+def render_url(url, lastmod=None):
+    lastmod = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
+    return f'  <url><loc>{escape(url)}</loc>{lastmod}</url>'
+
+
+def shard_loc(row):
+    """How a row's URL appears in a rendered shard"""
+    return f"<loc>{escape(invention_url(row['domain_key'], row['invention_id']))}</loc>"
+
+
+def shard_urls(rows):
+    """(url, lastmod) pairs for sitemap rows"""
+    return [(invention_url(row['domain_key'], row['invention_id']), iso(row['created_at'])[:10]) for row in rows]
+
+
+def render_sitemap_index(names):
+    parts = ['<?xml version="1.0" encoding="utf-8"?>',
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">']
+    parts += [f'  <sitemap><loc>{escape(SITE_URL)}/{name}</loc></sitemap>' for name in names]
+    parts.append('</sitemapindex>')
+    return '\n'.join(parts) + '\n'
+
+
+# --- building ------------------------------------------------------------
+
+@contextmanager
+def locked(repository):
+    """Rebuild feeds one process at a time, so an older build can't overwrite a newer one
+
+    Reads inside the transaction see everything committed before the lock was taken,
+    and go to the primary, so a lagging replica can't drop the rows just saved.
+    """
+    try:
+        with repository.transaction():
+            repository.lock_feeds()
+            yield
+    except BaseException:
+        # Documents cached during the build were rolled back with it
+        cache.forget()
+        raise
+
+
+def build(repository, name):
+    """(content type, body) for a feed or sitemap name, or None when there is no such document"""
+    if name in feed_names():
+        entries = repository.recent_entries(FEED_SIZE)
+        return render(name, entries, f"{SITE_TITLE}: all inventions", f"{SITE_URL}/")
+
+    if name.startswith('domain/'):
+        domain_key = name.split('/')[1]
+        if domain_key not in DOMAINS or name not in feed_names(domain_key):
+            return None
+        entries = repository.recent_entries(FEED_SIZE, domain_key)
+        return render(name, entries, f"{SITE_TITLE}: {DOMAINS[domain_key]['name']}",
+                      f"{SITE_URL}/domain/{domain_key}")
+
+    if name == 'sitemap.xml':
+        shards = max(1, -(-repository.get_stats()['total_inventions'] // SITEMAP_SHARD_SIZE))
+        return XML, render_sitemap_index(['sitemaps/pages.xml'] + [shard_name(n) for n in range(1, shards + 1)])
+
+    if name == 'sitemaps/pages.xml':
+        urls = [(f"{SITE_URL}/", None), (f"{SITE_URL}/stats", None)]
+        urls += [(f"{SITE_URL}/domain/{key}", None) for key in DOMAINS]
+        return XML, render_urlset(urls)
+
+    if name.startswith('sitemaps/inventions-') and name.endswith('.xml'):
+        try:
+            number = int(name[len('sitemaps/inventions-'):-len('.xml')])
+        except ValueError:
+            return None
+        if number < 1 or name != shard_name(number):
+            return None
+        rows = repository.sitemap_page((number - 1) * SITEMAP_SHARD_SIZE, SITEMAP_SHARD_SIZE)
+        if not rows and number > 1:
+            return None
+        return XML, render_urlset(shard_urls(rows))
+
+    return None
+
+
+def render(name, entries, title, home_url):
+    self_url = f"{SITE_URL}/{name}"
+    if name.endswith('.atom'):
+        return ATOM, render_atom(entries, title, self_url, home_url)
+    return JSON_FEED, render_json_feed(entries, title, self_url, home_url)
+
+
+class FeedCache:
+    """Rendered documents held in memory and revalidated against the feeds table"""
+
+    def __init__(self):
+        # name -> {'content_type', 'body', 'etag', 'updated_at', 'checked_at'} (and 'urls' for sitemap shards)
+        self.documents = {}
+        self._lock = threading.Lock()
+
+    def store(self, repository, name, built):
+        """Save a freshly built document to the table and this process's cache"""
+        content_type, body = built
+        etag = hashlib.sha256(body.encode('utf-8')).hexdigest()[:32]
+        current = self.documents.get(name)
+        if current and current['etag'] == etag:
+            return current
+        updated_at = datetime.utcnow().replace(microsecond=0)
+        repository.save_feed(name, content_type, body, etag, updated_at)
+        return self.remember(name, {'content_type': content_type, 'body': body, 'etag': etag,
+                                    'updated_at': updated_at})
+
+    def remember(self, name, row):
+        """Cache a document as stored in the table"""
+        document = {'content_type': row['content_type'], 'body': row['body'], 'etag': row['etag'],
+                    'updated_at': as_datetime(row['updated_at']), 'checked_at': time.monotonic()}
+        with self._lock:
+            self.documents[name] = document
+        return document
+
+    def forget(self):
+        with self._lock:
+            self.documents.clear()
+
+    def get(self, name):
+        """The document for a name, or None if there is no such feed or sitemap"""
+        document = self.documents.get(name)
+        if document and time.monotonic() - document['checked_at'] < FEED_CACHE_SECONDS:
+            return document
+
+        repository = storage.get_repository()
+        if document and repository.feed_etag(name) == document['etag']:
+            document['checked_at'] = time.monotonic()
+            return document
+
+        row = repository.get_feed(name)
+        if row is None:
+            # Never built (fresh database or a domain without inventions yet)
+            with locked(repository):
+                # Unless a save built it while this process waited for the lock
+                row = repository.get_feed(name)
+                if row is None:
+                    built = build(repository, name)
+                    return self.store(repository, name, built) if built else None
+        return self.remember(name, row)
+
+
+cache = FeedCache()
+
+
+def update_feeds(repository, rows, previous=()):
+    """Re-render the feeds and sitemap shard affected by newly saved inventions"""
+    names = feed_names()
+    for domain_key in sorted({row['domain_key'] for row in rows}):
+        names += feed_names(domain_key)
+
+    with locked(repository):
+        for name in names:
+            built = build(repository, name)
+            if built:
+                cache.store(repository, name, built)
+        update_sitemaps(repository, rows)
+
+
+def update_sitemaps(repository, rows):
+    """Append newly published inventions to the last shard; re-render shards only when that can't be done"""
+    # New inventions are the newest, so they land in the last shard
+    total = repository.get_stats()['total_inventions']
+    last_shard = max(1, -(-total // SITEMAP_SHARD_SIZE))
+    start = (last_shard - 1) * SITEMAP_SHARD_SIZE
+    in_last_shard = total - start
+
+    name = shard_name(last_shard)
+    document = shard_document(repository, name)
+    if document and document['urls'] == in_last_shard:
+        # Re-saves of published inventions leave the sitemaps as they are
+        return
+
+    fresh = None
+    if document and document['urls'] < in_last_shard:
+        # Read on from the shard's last URL: if it is still in place, everything after it is new
+        stored = document['urls']
+        skip = 1 if stored else 0
+        page = repository.sitemap_page(start + stored - skip, in_last_shard - stored + skip)
+        if last_loc(document['body']) == (shard_loc(page[0]) if skip and page else None):
+            fresh = page[skip:]
+
+    if fresh is not None:
+        # The shard held every earlier invention and the new ones sort last: add their lines
+        lines = ''.join(render_url(url, lastmod) + '\n' for url, lastmod in shard_urls(fresh))
+        body = document['body'].replace('</urlset>\n', lines + '</urlset>\n')
+        cache.store(repository, name, (XML, body))['urls'] = in_last_shard
+    else:
+        # Back-dated inventions shift every later URL along
+        first_shard = max(1, -(-(total - len(rows)) // SITEMAP_SHARD_SIZE))
+        for n in range(first_shard, last_shard + 1):
+            built = build(repository, shard_name(n))
+            if built:
+                cache.store(repository, shard_name(n), built)
+
+    if not document:
+        # A shard was started (or never built): list it in the index
+        cache.store(repository, 'sitemap.xml', build(repository, 'sitemap.xml'))
+
+
+def shard_document(repository, name):
+    """A stored sitemap shard with its URL count, from this process's cache when its ETag is current"""
+    document = cache.documents.get(name)
+    if not (document and repository.feed_etag(name) == document['etag']):
+        row = repository.get_feed(name)
+        if row is None:
+            return None
+        document = cache.remember(name, row)
+    if 'urls' not in document:
+        # Counted once per stored version; appends keep the count up to date
+        document['urls'] = document['body'].count('<url>')
+    return document
+
+
+def last_loc(body):
+    """The last <loc> element of a rendered shard, or None when it lists no URLs"""
+    at = body.rfind('<loc>')
+    return body[at:body.index('</loc>', at) + len('</loc>')] if at >= 0 else None
+
+
+def rebuild_all(repository=None):
+    """Render every feed and sitemap from scratch; returns how many documents were written"""
+    repository = repository or storage.get_repository()
+    with locked(repository):
+        names = feed_names() + [name for key in DOMAINS for name in feed_names(key)]
+        shards = max(1, -(-repository.get_stats()['total_inventions'] // SITEMAP_SHARD_SIZE))
+        names += ['sitemap.xml', 'sitemaps/pages.xml'] + [shard_name(n) for n in range(1, shards + 1)]
+        for name in names:
+            cache.store(repository, name, build(repository, name))
+    return len(names)
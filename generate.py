@@ -1,46 +1,142 @@
 # generate.py
 # Invention generation logic using AI
 
+if __name__ == '__main__':
+    # Running from the command line: load .env before configuration is read
+    from dotenv import load_dotenv
+    load_dotenv()
+
 import os
 from datetime import datetime
 import hashlib
 import json
-from dotenv import load_dotenv
+import threading
+from storage import save_invention
+
+# Provider selection, retries and failover live in providers.py
+from providers import router, MAX_TOKENS, MAX_OUTPUT_TOKENS
+from parsing import (
+    InventionSplitter, SectionParser, validate_invention, section_of,
+    SECTION_PATTERN, INVENTION_START, INVENTION_END
+)
+
+# Inventions requested per model call, sharing one copy of the instruction prompt
+INVENTIONS_PER_CALL = int(os.getenv('INVENTIONS_PER_CALL', '1'))
+MALFORMED_RETRIES = int(os.getenv('MALFORMED_RETRIES', '2'))
 
-load_dotenv()
 
-# Check if DATABASE_URL is set to determine which database module to use
-database_url = os.getenv('DATABASE_URL')
-if database_url:
-    from database import save_invention
-else:
-    from database_sqlite import save_invention
+class PartialGeneration(Exception):
+    """A multi-invention call failed after saving some inventions; `saved` holds their ids"""
 
-# Determine which AI provider to use
-AI_PROVIDER = os.getenv('AI_PROVIDER', 'openai').lower()
+    def __init__(self, saved, error):
+        super().__init__(f"{error} (after saving {len(saved)} invention(s))")
+        self.saved = saved
 
 
-def generate_invention(domain_key, domain_name):
+def generate_invention(domain_key, domain_name, prefer=None):
     """Generate a novel invention using AI for a specific domain"""
-    
-    # Check which provider to use
-    if AI_PROVIDER == 'anthropic':
-        return generate_with_anthropic(domain_key, domain_name)
-    else:
-        return generate_with_openai(domain_key, domain_name)
+    for event, data in stream_invention(domain_key, domain_name, prefer):
+        if event == 'saved':
+            return data
 
 
 def generate_with_openai(domain_key, domain_name):
-    """Generate invention using OpenAI API"""
-    from openai import OpenAI
-    
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not set in environment")
-    
-    client = OpenAI(api_key=api_key)
-    
-    prompt = f"""Generate a truly novel and innovative {domain_name} invention that would be worthy of patent protection. This should NOT be:
+    """Generate invention using OpenAI API, failing over to Anthropic"""
+    return generate_invention(domain_key, domain_name, prefer='openai')
+
+
+def generate_with_anthropic(domain_key, domain_name):
+    """Generate invention using Anthropic API, failing over to OpenAI"""
+    return generate_invention(domain_key, domain_name, prefer='anthropic')
+
+
+def stream_invention(domain_key, domain_name, prefer=None):
+    """Generate an invention, yielding (event, data) pairs while the completion streams in
+
+    Events are 'text' for each chunk, 'section' with (name, header text) as each section
+    header completes, and finally 'saved' with the invention id. Closing the generator
+    early abandons the completion without saving anything.
+    """
+    parser = SectionParser()
+    chunks = []
+    for chunk in router.stream(build_prompt(domain_name), prefer=prefer):
+        chunks.append(chunk)
+        yield 'text', chunk
+        for header in parser.feed(chunk):
+            yield 'section', header
+    for header in parser.close():
+        yield 'section', header
+
+    yield 'saved', save_generated_invention(''.join(chunks), domain_key, domain_name)
+
+
+def generate_inventions(domain_key, domain_name, count=INVENTIONS_PER_CALL):
+    """Generate several inventions in one model call, returning the saved ids
+
+    Each delimited invention is validated and saved as soon as it is split off the stream.
+    Malformed, cut off or missing items are regenerated one at a time. If generation
+    fails after some inventions were saved, PartialGeneration carries their ids.
+    """
+    if count <= 1:
+        return [generate_invention(domain_key, domain_name)]
+
+    saved = []
+    try:
+        return _generate_inventions(domain_key, domain_name, count, saved)
+    except Exception as e:
+        if saved:
+            raise PartialGeneration(saved, e) from e
+        raise
+
+
+def _generate_inventions(domain_key, domain_name, count, saved):
+    max_tokens = min(MAX_TOKENS * count, MAX_OUTPUT_TOKENS)
+    splitter = InventionSplitter()
+
+    def save_valid(items):
+        for item in items:
+            if len(saved) == count:
+                return
+            problems = validate_invention(item)
+            if problems:
+                print(f"⚠️  Discarding malformed invention in {domain_name}: {', '.join(problems)}")
+                continue
+            saved.append(save_generated_invention(item, domain_key, domain_name))
+
+    for chunk in router.stream(build_prompt(domain_name, count), max_tokens=max_tokens):
+        save_valid(splitter.feed(chunk))
+    completed, unterminated = splitter.close()
+    save_valid(completed)
+    if unterminated and len(saved) < count:
+        # No end marker: the output stopped mid-invention, most likely at max_tokens
+        print(f"✂️  Dropping an invention in {domain_name} cut off at the {max_tokens}-token output limit")
+
+    for _ in range(count - len(saved)):
+        inv_id = generate_valid_invention(domain_key, domain_name)
+        if inv_id:
+            saved.append(inv_id)
+    return saved
+
+
+def generate_valid_invention(domain_key, domain_name):
+    """Generate a single invention, retrying while the output is malformed"""
+    for attempt in range(MALFORMED_RETRIES + 1):
+        content = ''.join(router.stream(build_prompt(domain_name)))
+        problems = validate_invention(content)
+        if not problems:
+            return save_generated_invention(content, domain_key, domain_name)
+        print(f"⚠️  Malformed invention in {domain_name} (attempt {attempt + 1}): {', '.join(problems)}")
+    return None
+
+
+def build_prompt(domain_name, count=1):
+    """Build the invention prompt for a domain, asking for count inventions"""
+    if count == 1:
+        request_line = f"Generate a truly novel and innovative {domain_name} invention that would be worthy of patent protection."
+    else:
+        request_line = f"Generate {count} distinct, truly novel and innovative {domain_name} inventions, each worthy of patent protection on its own."
+
+    prompt = request_line + f""" This should NOT be:
 - A simple combination of existing technologies
 - An obvious modification of existing products
 - A general improvement without specific technical innovation
@@ -83,101 +179,36 @@ ENABLEMENT: [Step-by-step instructions detailed enough for reproduction, includi
 - Troubleshooting tips
 - Expected performance characteristics]
 """
-    
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=1.0,
-        max_tokens=3000
-    )
-    
-    content = response.choices[0].message.content
-    
-    # Create invention record
-    timestamp = datetime.utcnow()
-    inv_id = f"inv-{timestamp.strftime('%Y%m%d-%H%M%S')}"
-    
-    # Extract title
-    title = extract_title_from_content(content)
-    
-    # Format as markdown
-    markdown_content = format_invention(content, timestamp, inv_id, domain_key, domain_name)
-    
-    # Calculate hash
-    hash_value = hashlib.sha256(markdown_content.encode()).hexdigest()
-    
-    # Save to database
-    save_invention(inv_id, domain_key, domain_name, title, markdown_content, hash_value)
-    
-    return inv_id
-
-
-def generate_with_anthropic(domain_key, domain_name):
-    """Generate invention using Anthropic API"""
-    import anthropic
-    
-    api_key = os.getenv('ANTHROPIC_API_KEY')
-    if not api_key:
-        raise ValueError("ANTHROPIC_API_KEY not set in environment")
-    
-    client = anthropic.Anthropic(api_key=api_key)
-    
-    prompt = f"""Generate a truly novel and innovative {domain_name} invention that would be worthy of patent protection. This should NOT be:
-- A simple combination of existing technologies
-- An obvious modification of existing products
-- A general improvement without specific technical innovation
-
-Instead, create an invention that:
-1. Solves a real problem in a non-obvious way
-2. Contains a surprising technical insight or mechanism
-3. Has specific, novel technical features (not just "AI-powered" or "smart")
-4. Includes concrete specifications (exact materials, dimensions, mechanisms, chemical formulas, algorithms, etc.)
-5. Would not be obvious to someone skilled in the {domain_name} field
-
-Think deeply about:
-- What fundamental constraints or problems exist in this domain?
-- What counter-intuitive approach might work?
-- What specific mechanism or structure would enable this?
-- What exact parameters or configurations make it work?
+    if count > 1:
+        prompt += f"""
+Write all {count} inventions in full. Put the line "{INVENTION_START.format(n='N')}" (with N the invention number) before each one and the line "{INVENTION_END}" after each one. Do not write anything outside these blocks.
+"""
+    return prompt
 
-Provide in this format:
 
-TITLE: [Specific, descriptive title that captures the core innovation]
+_last_id_second = None
+_id_sequence = 0
+_id_lock = threading.Lock()
 
-ABSTRACT: [2-3 sentences explaining the problem, the non-obvious solution, and key benefit]
 
-DETAILED DESCRIPTION: [Highly specific technical details including:
-- Exact materials, alloys, compounds, or technologies (with specifications)
-- Precise dimensions, ratios, temperatures, pressures, voltages, etc.
-- Detailed structure, mechanism, or algorithm
-- How different components interact at a technical level
-- Why these specific choices enable the innovation (not just that they do)]
+def new_invention_id(timestamp):
+    """Invention id for a timestamp, suffixed when several are created in the same second"""
+    global _last_id_second, _id_sequence
+    second = timestamp.strftime('%Y%m%d-%H%M%S')
+    with _id_lock:
+        if second == _last_id_second:
+            _id_sequence += 1
+            return f"inv-{second}-{_id_sequence}"
+        _last_id_second = second
+        _id_sequence = 1
+    return f"inv-{second}"
 
-CLAIMS: [List 3-5 specific, technically novel aspects. Each claim should describe something that is:
-1. Not obvious from prior art
-2. Technically specific (not generic)
-3. Essential to the invention's function]
 
-ENABLEMENT: [Step-by-step instructions detailed enough for reproduction, including:
-- Specific manufacturing or synthesis procedures
-- Testing and calibration methods
-- Operating parameters and conditions
-- Troubleshooting tips
-- Expected performance characteristics]
-"""
-    
-    message = client.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        max_tokens=3000,
-        temperature=1.0,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    
-    content = message.content[0].text
-    
+def save_generated_invention(content, domain_key, domain_name):
+    """Format, hash and save AI-generated content, returning the invention id"""
     # Create invention record
     timestamp = datetime.utcnow()
-    inv_id = f"inv-{timestamp.strftime('%Y%m%d-%H%M%S')}"
+    inv_id = new_invention_id(timestamp)
     
     # Extract title
     title = extract_title_from_content(content)
@@ -198,8 +229,8 @@ def extract_title_from_content(content):
     """Extract title from AI-generated content"""
     lines = content.split('\n')
     for line in lines:
-        if line.strip().startswith('TITLE:'):
-            return line.replace('TITLE:', '').strip()
+        if section_of(line) == 'TITLE':
+            return SECTION_PATTERN.sub('', line, count=1).strip(' *')
     return "Untitled Invention"
 
 
@@ -231,3 +262,40 @@ This invention is published as prior art under Creative Commons CC0 1.0 Universa
 """
     return markdown
 
+
+
+def main():
+    """Command line entry point for one-off generation and batch backfills"""
+    import argparse
+    import random
+    from domains import DOMAINS, get_domain_info
+
+    parser = argparse.ArgumentParser(description='Generate inventions')
+    parser.add_argument('--domain', choices=sorted(DOMAINS), help='domain to generate in (default: random, or all for --batch)')
+    parser.add_argument('--count', type=int, default=INVENTIONS_PER_CALL, help='inventions to request in one model call')
+    parser.add_argument('--batch', action='store_true', help='backfill through the OpenAI Batch API')
+    parser.add_argument('--per-domain', type=int, default=1, help='inventions per domain in a batch backfill')
+    parser.add_argument('--fresh', action='store_true', help='start a new backfill instead of resuming an interrupted one')
+    args = parser.parse_args()
+
+    if args.batch:
+        from batch import run_backfill
+        run_backfill(args.per_domain, [args.domain] if args.domain else None, resume=not args.fresh)
+        return 0
+
+    domain_key = args.domain or random.choice(list(DOMAINS.keys()))
+    domain_name = get_domain_info(domain_key)['name']
+    try:
+        saved = generate_inventions(domain_key, domain_name, args.count)
+    except PartialGeneration as e:
+        for inv_id in e.saved:
+            print(f"✅ Generated invention {inv_id} in {domain_name}")
+        print(f"❌ {e}")
+        return 1
+    for inv_id in saved:
+        print(f"✅ Generated invention {inv_id} in {domain_name}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
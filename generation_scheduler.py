@@ -0,0 +1,266 @@
+# generation_scheduler.py
+# Adaptive, domain-balanced scheduling of automatic invention generation
+
+if __name__ == '__main__':
+    # Running as the worker process: load .env before configuration is read
+    from dotenv import load_dotenv
+    load_dotenv()
+
+import os
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from domains import DOMAINS, get_domain_info
+
+# Auto-generation configuration
+AUTO_GENERATE_INTERVAL = int(os.getenv('AUTO_GENERATE_INTERVAL', '3600'))  # 1 hour default
+AUTO_GENERATE_MIN_INTERVAL = float(os.getenv('AUTO_GENERATE_MIN_INTERVAL', str(AUTO_GENERATE_INTERVAL / 4)))
+AUTO_GENERATE_MAX_INTERVAL = float(os.getenv('AUTO_GENERATE_MAX_INTERVAL', str(AUTO_GENERATE_INTERVAL * 8)))
+AUTO_GENERATE_SLOTS = int(os.getenv('AUTO_GENERATE_SLOTS', '1'))  # generations running in parallel
+AUTO_GENERATE_UNTIL = os.getenv('AUTO_GENERATE_UNTIL', '2026-02-01')  # ISO date, empty for no cutoff
+DOMAIN_WEIGHTS = os.getenv('DOMAIN_WEIGHTS', '')  # e.g. "biotechnology=2,software-algorithms=0.5"
+
+
+def parse_cutoff(value):
+    """Cutoff datetime from an ISO date string, or None"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def parse_weights(value):
+    """Per-domain target weights; domains not listed get weight 1"""
+    weights = {key: 1.0 for key in DOMAINS}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        key, _, weight = item.partition('=')
+        if key.strip() not in DOMAINS:
+            raise ValueError(f"Unknown domain in DOMAIN_WEIGHTS: {key.strip()}")
+        weights[key.strip()] = float(weight)
+    return weights
+
+
+class DomainBalancer:
+    """Picks the domain furthest below its weighted share of the corpus"""
+
+    def __init__(self, weights, count_fn):
+        self.weights = weights
+        self.count_fn = count_fn
+        self.counts = None
+        self.in_flight = Counter()
+        self.picks = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Reload per-domain counts from the database"""
+        counts = Counter(self.count_fn())
+        with self._lock:
+            self.counts = counts
+
+    def pick(self):
+        """Choose the next domain and mark it as in flight"""
+        # Pick up inventions created elsewhere (manual /generate, backfills) now and then
+        if self.counts is None or self.picks % 20 == 0:
+            self.refresh()
+        with self._lock:
+            self.picks += 1
+            total_weight = sum(self.weights.values())
+            total = sum(self.counts.values()) + sum(self.in_flight.values()) + 1
+
+            def deficit(key):
+                target = total * self.weights[key] / total_weight
+                return target - self.counts[key] - self.in_flight[key]
+
+            candidates = [key for key, weight in self.weights.items() if weight > 0]
+            best = max(deficit(key) for key in candidates)
+            domain_key = random.choice([key for key in candidates if deficit(key) >= best - 1e-9])
+            self.in_flight[domain_key] += 1
+            return domain_key
+
+    def done(self, domain_key, created=0):
+        """Record the outcome of a generation for a picked domain"""
+        with self._lock:
+            self.in_flight[domain_key] -= 1
+            self.counts[domain_key] += created
+
+
+class RateController:
+    """Adjusts the generation interval from latency and rate-limit feedback (AIMD)"""
+
+    def __init__(self, interval, min_interval, max_interval, slots):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.slots = slots
+        self._lock = threading.Lock()
+
+    def on_success(self, latency=None):
+        with self._lock:
+            interval = self.interval * 0.9
+            # No point starting generations faster than the slots can finish them
+            if latency:
+                interval = max(interval, latency / self.slots)
+            self.interval = min(self.max_interval, max(self.min_interval, interval))
+
+    def on_rate_limited(self, wait=0.0):
+        with self._lock:
+            self.interval = min(self.max_interval, max(self.interval * 2, wait))
+
+    def on_error(self):
+        with self._lock:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+
+    def slot_interval(self):
+        """Seconds between runs of one slot so all slots together hit the target rate"""
+        with self._lock:
+            return self.interval * self.slots
+
+
+class GenerationScheduler:
+    """Runs balanced auto-generation slots on an APScheduler instance"""
+
+    def __init__(self, scheduler, count_fn, generate_fn, router,
+                 slots=AUTO_GENERATE_SLOTS, cutoff=AUTO_GENERATE_UNTIL, weights=DOMAIN_WEIGHTS):
+        self.scheduler = scheduler
+        self.generate_fn = generate_fn
+        self.router = router
+        self.slots = max(1, slots)
+        self.cutoff = parse_cutoff(cutoff)
+        self.balancer = DomainBalancer(parse_weights(weights), count_fn)
+        self.rate = RateController(AUTO_GENERATE_INTERVAL, AUTO_GENERATE_MIN_INTERVAL,
+                                   AUTO_GENERATE_MAX_INTERVAL, self.slots)
+
+    def past_cutoff(self):
+        return self.cutoff is not None and datetime.utcnow() >= self.cutoff
+
+    def job_id(self, slot):
+        return f'auto_generate_slot_{slot}'
+
+    def start(self):
+        """Add one job per slot; returns False when past the cutoff date"""
+        if self.past_cutoff():
+            print(f"⏹️  Auto-generation disabled: past cutoff date ({self.cutoff.date()})")
+            return False
+
+        slot_interval = self.rate.slot_interval()
+        now = datetime.now()
+        for slot in range(self.slots):
+            self.scheduler.add_job(
+                func=self.run_slot,
+                args=(slot,),
+                trigger='interval',
+                seconds=slot_interval,
+                id=self.job_id(slot),
+                name=f'Auto-generate inventions (slot {slot})',
+                replace_existing=True,
+                max_instances=1,
+                # Stagger slots evenly across the first interval
+                next_run_time=now + timedelta(seconds=slot_interval * (slot + 1) / self.slots)
+            )
+
+        print(f"🤖 Auto-generation enabled: {self.slots} slot(s), one invention every ~{self.rate.interval:.0f} seconds")
+        if self.cutoff:
+            print(f"📅 Will run until {self.cutoff.date()} ({(self.cutoff - datetime.utcnow()).days} days remaining)")
+        return True
+
+    def stop(self):
+        for slot in range(self.slots):
+            try:
+                self.scheduler.remove_job(self.job_id(slot))
+            except Exception:
+                pass
+
+    def run_slot(self, slot):
+        """Generate in the most under-represented domain, then adapt the schedule"""
+        if self.past_cutoff():
+            print(f"⏹️  Auto-generation stopped: reached cutoff date ({self.cutoff.date()})")
+            self.stop()
+            return
+
+        wait = self.router.wait_for_headroom()
+        if wait > 0:
+            print(f"⏸️  Slot {slot} waiting for rate-limit reset ({wait:.0f}s)")
+            self.rate.on_rate_limited(wait)
+            self._reschedule(slot)
+            return
+
+        domain_key = self.balancer.pick()
+        domain_name = get_domain_info(domain_key)['name']
+        rate_limited_before = self.router.rate_limited_count()
+        created = []
+        try:
+            created = self.generate_fn(domain_key, domain_name)
+            for inv_id in created:
+                print(f"✅ Auto-generated invention {inv_id} in {domain_name}")
+        except Exception as e:
+            # generate_inventions' PartialGeneration still counts the inventions it saved
+            created = getattr(e, 'saved', created)
+            for inv_id in created:
+                print(f"✅ Auto-generated invention {inv_id} in {domain_name}")
+            print(f"❌ Auto-generation error: {str(e)}")
+        finally:
+            self.balancer.done(domain_key, len(created))
+
+        if self.router.rate_limited_count() > rate_limited_before:
+            self.rate.on_rate_limited(self.router.wait_for_headroom())
+        elif created:
+            self.rate.on_success(self.router.typical_latency())
+        else:
+            self.rate.on_error()
+        self._reschedule(slot)
+
+    def _reschedule(self, slot):
+        try:
+            self.scheduler.reschedule_job(self.job_id(slot), trigger='interval', seconds=self.rate.slot_interval())
+        except Exception:
+            # The job was removed (cutoff reached or scheduler shut down)
+            pass
+
+
+def build_generation_scheduler(scheduler):
+    """GenerationScheduler wired to the storage layer, generator and provider router"""
+    import storage
+    from generate import generate_inventions
+    from providers import router
+
+    return GenerationScheduler(
+        scheduler,
+        count_fn=lambda: storage.get_stats()['by_domain'],
+        generate_fn=generate_inventions,
+        router=router
+    )
+
+
+def executors():
+    return {'default': {'type': 'threadpool', 'max_workers': max(10, AUTO_GENERATE_SLOTS)}}
+
+
+def start_background():
+    """Run auto-generation on a background thread of the current process"""
+    import atexit
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    scheduler = BackgroundScheduler(executors=executors())
+    if build_generation_scheduler(scheduler).start():
+        scheduler.start()
+        # Shut down the scheduler when exiting the app
+        atexit.register(lambda: scheduler.shutdown())
+    return scheduler
+
+
+def main():
+    """Dedicated auto-generation process (Procfile worker)"""
+    from apscheduler.schedulers.blocking import BlockingScheduler
+
+    scheduler = BlockingScheduler(executors=executors())
+    if not build_generation_scheduler(scheduler).start():
+        return 0
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
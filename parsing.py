@@ -0,0 +1,131 @@
+# parsing.py
+# Incremental parsing and validation of AI-generated invention text
+
+import re
+
+# Sections every invention must contain, in order
+SECTIONS = ('TITLE', 'ABSTRACT', 'DETAILED DESCRIPTION', 'CLAIMS', 'ENABLEMENT')
+
+# Markers used when several inventions are requested in one call
+INVENTION_START = '=== INVENTION {n} ==='
+INVENTION_END = '=== END INVENTION ==='
+
+SECTION_PATTERN = re.compile(r'^[\s*#]*(' + '|'.join(SECTIONS) + r')[\s*]*:', re.IGNORECASE)
+START_PATTERN = re.compile(r'^\s*=+\s*INVENTION\s*\d*\s*=+\s*$', re.IGNORECASE)
+END_PATTERN = re.compile(r'^\s*=+\s*END\s+INVENTION\s*=+\s*$', re.IGNORECASE)
+
+
+def section_of(line):
+    """Section name if the line starts a section, else None"""
+    match = SECTION_PATTERN.match(line)
+    return match.group(1).upper() if match else None
+
+
+def validate_invention(content):
+    """List of problems with an invention's structure (empty when valid)"""
+    found = []
+    lengths = {}
+    current = None
+    for line in content.split('\n'):
+        section = section_of(line)
+        if section:
+            found.append(section)
+            current = section
+            # Text on the header line itself counts towards the section
+            lengths[section] = len(SECTION_PATTERN.sub('', line, count=1).strip())
+        elif current:
+            lengths[current] += len(line.strip())
+
+    problems = []
+    for section in SECTIONS:
+        if section not in found:
+            problems.append(f"missing {section}")
+        elif lengths.get(section, 0) == 0:
+            problems.append(f"empty {section}")
+    order = [s for s in found if s in SECTIONS]
+    if not problems and order[:len(SECTIONS)] != list(SECTIONS):
+        problems.append("sections out of order")
+    return problems
+
+
+class InventionSplitter:
+    """Splits a stream of text holding several delimited inventions
+
+    Feed chunks as they arrive; each call returns the inventions completed so far.
+    """
+
+    def __init__(self):
+        self._partial_line = ''
+        self._lines = None  # None while outside an invention block
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return any completed inventions"""
+        completed = []
+        lines = (self._partial_line + chunk).split('\n')
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._consume(line, completed)
+        return completed
+
+    def close(self):
+        """Flush the stream; returns (completed inventions, unterminated trailing invention or None)
+
+        The trailing one is usually cut off by the output token limit.
+        """
+        completed = []
+        if self._partial_line:
+            self._consume(self._partial_line, completed)
+            self._partial_line = ''
+        unterminated = self._finish() if self._lines else None
+        return completed, unterminated
+
+    def _consume(self, line, completed):
+        if START_PATTERN.match(line):
+            # A new start marker also terminates an unclosed invention
+            if self._lines:
+                completed.append(self._finish())
+            self._lines = []
+        elif END_PATTERN.match(line):
+            if self._lines is not None:
+                completed.append(self._finish())
+        elif self._lines is not None:
+            self._lines.append(line)
+
+    def _finish(self):
+        text = '\n'.join(self._lines).strip()
+        self._lines = None
+        return text
+
+
+class SectionParser:
+    """Follows the sections of one invention as its text streams in
+
+    Feed chunks as they arrive; each call returns (section, header text) for the
+    section headers completed so far, e.g. ('TITLE', 'Self-Healing Gasket').
+    """
+
+    def __init__(self):
+        self._partial_line = ''
+        self.current = None
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return any section headers it completed"""
+        if '\n' not in chunk:
+            self._partial_line += chunk
+            return []
+        lines = (self._partial_line + chunk).split('\n')
+        self._partial_line = lines.pop()
+        return [header for header in map(self._header, lines) if header]
+
+    def close(self):
+        """Flush the stream, returning a header on an unterminated last line if any"""
+        header = self._header(self._partial_line)
+        self._partial_line = ''
+        return [header] if header else []
+
+    def _header(self, line):
+        section = section_of(line)
+        if not section:
+            return None
+        self.current = section
+        return section, SECTION_PATTERN.sub('', line, count=1).strip(' *')
@@ -0,0 +1,287 @@
+# profiling.py
+# On-demand sampling profiler for Flask requests
+
+import os
+import sys
+import json
+import hmac
+import time
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import request, g
+
+# Profiling configuration
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.01'))  # fraction of requests
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '0'))  # 0 disables slow-request capture
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_FORMAT = os.getenv('PROFILE_FORMAT', 'collapsed').lower()  # collapsed or speedscope
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+PROFILE_EXTENSIONS = {
+    'collapsed': '.collapsed',
+    'speedscope': '.speedscope.json',
+}
+
+
+def is_admin_request():
+    """Check whether the request carries the admin token"""
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get('X-Admin-Token') or request.args.get('token') or ''
+    # Constant time, so response timing doesn't reveal how much of a guess was right
+    return hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+class Sampler:
+    """Background thread that samples the stacks of registered request threads"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._active = {}
+        self._thread = None
+
+    def register(self, thread_id):
+        """Start collecting samples for a thread"""
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def unregister(self, thread_id):
+        """Stop collecting samples for a thread; returns a copy of what was collected"""
+        with self._lock:
+            return Counter(self._active.pop(thread_id, None) or ())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                targets = list(self._active)
+                if not targets:
+                    self._wakeup.clear()
+            if not targets:
+                self._wakeup.wait()
+                continue
+
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id in targets:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if stack:
+                    # Root first, leaf last
+                    stacks.append((thread_id, tuple(reversed(stack))))
+            del frames
+            with self._lock:
+                # Only threads still registered: a finished request may be writing its copy
+                for thread_id, stack in stacks:
+                    samples = self._active.get(thread_id)
+                    if samples is not None:
+                        samples[stack] += 1
+            time.sleep(self.interval)
+
+
+_sampler = Sampler(PROFILE_INTERVAL_MS / 1000.0)
+
+
+def frame_label(code):
+    """Human readable label for a code object"""
+    filename = code.co_filename
+    cwd = os.getcwd()
+    if filename.startswith(cwd):
+        filename = os.path.relpath(filename, cwd)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def route_slug(rule):
+    """Turn a URL rule like /domain/<domain_key> into a directory name"""
+    slug = rule.strip('/').replace('<', '').replace('>', '').replace('/', '_').replace(':', '-')
+    return slug or 'index'
+
+
+def to_collapsed(samples):
+    """Render samples in Brendan Gregg's collapsed-stack format"""
+    lines = []
+    for stack, count in samples.items():
+        lines.append(';'.join(frame_label(code) for code in stack) + f" {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def to_speedscope(samples, name):
+    """Render samples as a speedscope 'sampled' profile"""
+    frame_index = {}
+    frames = []
+    stacks = []
+    weights = []
+    for stack, count in samples.items():
+        indexed = []
+        for code in stack:
+            label = frame_label(code)
+            if label not in frame_index:
+                frame_index[label] = len(frames)
+                frames.append({'name': label})
+            indexed.append(frame_index[label])
+        stacks.append(indexed)
+        weights.append(count * PROFILE_INTERVAL_MS)
+
+    return json.dumps({
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': stacks,
+            'weights': weights,
+        }],
+        'name': name,
+        'exporter': 'perpetual-ideas-machine',
+    })
+
+
+def write_profile(route, path, elapsed_ms, samples):
+    """Write a captured profile to PROFILE_DIR/<route>/"""
+    directory = os.path.join(PROFILE_DIR, route_slug(route))
+    os.makedirs(directory, exist_ok=True)
+
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    fmt = PROFILE_FORMAT if PROFILE_FORMAT in PROFILE_EXTENSIONS else 'collapsed'
+    # Duration is encoded in the filename so the admin page can rank files without opening them
+    filename = f"{stamp}-{int(elapsed_ms)}ms-{os.getpid()}-{random.randint(0, 9999):04d}{PROFILE_EXTENSIONS[fmt]}"
+
+    if fmt == 'speedscope':
+        body = to_speedscope(samples, f"{request.method} {path}")
+    else:
+        body = to_collapsed(samples)
+
+    with open(os.path.join(directory, filename), 'w') as f:
+        f.write(body)
+    return os.path.join(directory, filename)
+
+
+def load_profile(filepath):
+    """Load a profile file as a Counter of label stacks"""
+    stacks = Counter()
+    with open(filepath) as f:
+        if filepath.endswith(PROFILE_EXTENSIONS['speedscope']):
+            data = json.load(f)
+            frames = data['shared']['frames']
+            profile = data['profiles'][0]
+            for stack, weight in zip(profile['samples'], profile['weights']):
+                labels = tuple(frames[i]['name'] for i in stack)
+                stacks[labels] += int(round(weight / PROFILE_INTERVAL_MS)) or 1
+        else:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line:
+                    continue
+                stack, _, count = line.rpartition(' ')
+                stacks[tuple(stack.split(';'))] += int(count)
+    return stacks
+
+
+def top_frames(stacks, limit=5):
+    """Leaf frames with the most samples (self time)"""
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack[-1]] += count
+    total = sum(leaves.values()) or 1
+    return [
+        {'frame': label, 'samples': count, 'percent': round(100.0 * count / total, 1)}
+        for label, count in leaves.most_common(limit)
+    ]
+
+
+def list_profiles(limit=50):
+    """List captured profiles on disk, slowest first"""
+    captured = []
+    if not os.path.isdir(PROFILE_DIR):
+        return captured
+
+    for route in os.listdir(PROFILE_DIR):
+        directory = os.path.join(PROFILE_DIR, route)
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            parts = filename.split('-')
+            if len(parts) < 4 or not parts[2].endswith('ms'):
+                continue
+            captured.append({
+                'route': route,
+                'file': filename,
+                'path': os.path.join(directory, filename),
+                'captured_at': f"{parts[0]}-{parts[1]}",
+                'duration_ms': int(parts[2][:-2]),
+            })
+
+    captured.sort(key=lambda p: p['duration_ms'], reverse=True)
+    captured = captured[:limit]
+    for profile in captured:
+        try:
+            stacks = load_profile(profile['path'])
+            profile['samples'] = sum(stacks.values())
+            profile['top_frames'] = top_frames(stacks)
+        except (OSError, ValueError, KeyError) as e:
+            profile['samples'] = 0
+            profile['top_frames'] = [{'frame': f'unreadable: {e}', 'samples': 0, 'percent': 0}]
+    return captured
+
+
+def _start_profile():
+    forced = is_admin_request() and request.args.get('profile') == '1'
+    if not (PROFILE_ENABLED or forced):
+        return
+
+    sampled = forced or random.random() < PROFILE_SAMPLE_RATE
+    if not sampled and PROFILE_SLOW_MS <= 0:
+        return
+
+    thread_id = threading.get_ident()
+    _sampler.register(thread_id)
+    g._profile = {
+        'thread_id': thread_id,
+        'sampled': sampled,
+        'start': time.perf_counter(),
+    }
+
+
+def _finish_profile(exc=None):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return
+
+    samples = _sampler.unregister(profile['thread_id'])
+    elapsed_ms = (time.perf_counter() - profile['start']) * 1000.0
+    slow = PROFILE_SLOW_MS > 0 and elapsed_ms >= PROFILE_SLOW_MS
+    if not (profile['sampled'] or slow) or not samples:
+        return
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    try:
+        write_profile(route, request.path, elapsed_ms, samples)
+    except OSError as e:
+        print(f"⚠️  Could not write profile for {request.path}: {e}")
+
+
+def init_profiling(app):
+    """Register the profiling hooks on a Flask app"""
+    app.before_request(_start_profile)
+    app.teardown_request(_finish_profile)
+
+    if PROFILE_ENABLED:
+        print(f"🔬 Request profiling enabled: sample rate {PROFILE_SAMPLE_RATE}, "
+              f"slow threshold {PROFILE_SLOW_MS or 'off'} ms, writing {PROFILE_FORMAT} to {PROFILE_DIR}/")
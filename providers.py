@@ -0,0 +1,425 @@
+# providers.py
+# AI provider calls with retries, circuit breakers and automatic failover
+
+import os
+import time
+import random
+import re
+import threading
+from datetime import datetime
+
+# Model settings shared by every provider call
+MAX_TOKENS = 3000
+MAX_OUTPUT_TOKENS = int(os.getenv('PROVIDER_MAX_OUTPUT_TOKENS', '7000'))  # ceiling for multi-invention calls
+TEMPERATURE = 1.0
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4')
+ANTHROPIC_MODEL = os.getenv('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20241022')
+
+# Retry and failover configuration
+PROVIDER_MAX_RETRIES = int(os.getenv('PROVIDER_MAX_RETRIES', '3'))
+PROVIDER_BACKOFF_BASE = float(os.getenv('PROVIDER_BACKOFF_BASE', '1.0'))  # seconds
+PROVIDER_BACKOFF_MAX = float(os.getenv('PROVIDER_BACKOFF_MAX', '30'))  # seconds
+PROVIDER_TIMEOUT = float(os.getenv('PROVIDER_TIMEOUT', '180'))  # seconds per request
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '60'))  # seconds
+PROVIDER_EXPLORE_RATE = float(os.getenv('PROVIDER_EXPLORE_RATE', '0.05'))  # share of calls that probe the runner-up
+# Expected seconds per call assumed for a provider that hasn't been used yet
+PROVIDER_UNMEASURED_LATENCY = float(os.getenv('PROVIDER_UNMEASURED_LATENCY', '60'))
+
+PROVIDER_KEYS = {
+    'openai': 'OPENAI_API_KEY',
+    'anthropic': 'ANTHROPIC_API_KEY',
+}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class ProviderError(RuntimeError):
+    """Raised when no provider could complete a request"""
+
+
+def status_code_of(error):
+    """HTTP status code carried by an SDK error, if any"""
+    return getattr(error, 'status_code', None)
+
+
+def retry_after_of(error):
+    """Seconds to wait according to the Retry-After header of an SDK error"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    """Whether an error is worth retrying on the same provider"""
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Connection resets and timeouts carry no status code
+    name = type(error).__name__
+    return 'Timeout' in name or 'Connection' in name
+
+
+def parse_duration(value):
+    """Parse OpenAI reset durations like '20ms', '1s' or '6m0.5s' into seconds"""
+    total = 0.0
+    for amount, unit in re.findall(r'([\d.]+)(ms|h|m|s)', value):
+        total += float(amount) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+    return total
+
+
+def parse_rate_limit_headers(headers):
+    """Remaining requests and seconds until reset from provider rate-limit headers"""
+    if not headers:
+        return None, None
+
+    remaining = headers.get('x-ratelimit-remaining-requests') or headers.get('anthropic-ratelimit-requests-remaining')
+    try:
+        remaining = int(remaining) if remaining is not None else None
+    except ValueError:
+        remaining = None
+
+    reset = None
+    if headers.get('x-ratelimit-reset-requests'):
+        reset = parse_duration(headers['x-ratelimit-reset-requests'])
+    elif headers.get('anthropic-ratelimit-requests-reset'):
+        try:
+            reset_at = datetime.fromisoformat(headers['anthropic-ratelimit-requests-reset'].replace('Z', '+00:00'))
+            reset = max(0.0, reset_at.timestamp() - time.time())
+        except ValueError:
+            pass
+    return remaining, reset
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than Retry-After"""
+    delay = random.uniform(0, min(PROVIDER_BACKOFF_MAX, PROVIDER_BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, PROVIDER_BACKOFF_BASE)
+    return delay
+
+
+class CircuitBreaker:
+    """Stops sending traffic to a provider after repeated failures"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a request may be sent now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+            if self.state == 'half_open' and not self._trial_in_flight:
+                # Let exactly one trial request through
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release(self):
+        """End a call without a verdict, so a half-open breaker can send another trial"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class ProviderStats:
+    """Exponentially weighted latency and success rate for a provider"""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.latency = None
+        self.success_rate = 1.0
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.remaining_requests = None
+        self.reset_at = None
+        self._lock = threading.Lock()
+
+    def observe_headers(self, headers, status=None):
+        """Track rate-limit headroom reported by the provider"""
+        remaining, reset = parse_rate_limit_headers(headers)
+        with self._lock:
+            if status == 429:
+                self.rate_limited += 1
+            if remaining is not None:
+                self.remaining_requests = remaining
+                self.reset_at = time.monotonic() + reset if reset is not None else None
+
+    def wait_for_headroom(self):
+        """Seconds until the provider accepts requests again (0 when it has headroom)"""
+        with self._lock:
+            if self.remaining_requests is None or self.remaining_requests > 0 or self.reset_at is None:
+                return 0.0
+            return max(0.0, self.reset_at - time.monotonic())
+
+    def record(self, ok, latency=None):
+        with self._lock:
+            self.requests += 1
+            if not ok:
+                self.failures += 1
+            self.success_rate += self.alpha * ((1.0 if ok else 0.0) - self.success_rate)
+            if ok and latency is not None:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += self.alpha * (latency - self.latency)
+
+    def score(self):
+        """Lower is better: expected seconds per successful call"""
+        if self.requests == 0:
+            return None
+        # A provider that has only ever failed is treated as maximally slow
+        latency = self.latency if self.latency is not None else PROVIDER_TIMEOUT
+        return latency / max(self.success_rate, 0.05)
+
+
+def stream_openai(prompt, max_tokens=MAX_TOKENS):
+    """Open a streaming OpenAI completion, returning a text-chunk iterator and response headers"""
+    raw = get_client('openai').chat.completions.with_raw_response.create(
+        model=OPENAI_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=TEMPERATURE,
+        max_tokens=max_tokens,
+        stream=True
+    )
+    return openai_text(raw.parse()), raw.headers
+
+
+def openai_text(stream):
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+
+
+def stream_anthropic(prompt, max_tokens=MAX_TOKENS):
+    """Open a streaming Anthropic message, returning a text-chunk iterator and response headers"""
+    raw = get_client('anthropic').messages.with_raw_response.create(
+        model=ANTHROPIC_MODEL,
+        max_tokens=max_tokens,
+        temperature=TEMPERATURE,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True
+    )
+    return anthropic_text(raw.parse()), raw.headers
+
+
+def anthropic_text(stream):
+    try:
+        for event in stream:
+            if event.type == 'content_block_delta' and getattr(event.delta, 'text', None):
+                yield event.delta.text
+    finally:
+        stream.close()
+
+
+PROVIDER_STREAMS = {
+    'openai': stream_openai,
+    'anthropic': stream_anthropic,
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider):
+    """Create SDK clients once per process; retries are handled by the router"""
+    with _clients_lock:
+        if provider not in _clients:
+            api_key = os.getenv(PROVIDER_KEYS[provider])
+            if not api_key:
+                raise ValueError(f"{PROVIDER_KEYS[provider]} not set in environment")
+            if provider == 'openai':
+                from openai import OpenAI
+                _clients[provider] = OpenAI(api_key=api_key, max_retries=0, timeout=PROVIDER_TIMEOUT)
+            else:
+                import anthropic
+                _clients[provider] = anthropic.Anthropic(api_key=api_key, max_retries=0, timeout=PROVIDER_TIMEOUT)
+        return _clients[provider]
+
+
+class ProviderRouter:
+    """Routes completions to the fastest healthy provider and fails over on errors"""
+
+    def __init__(self, providers=('openai', 'anthropic'), preferred=None):
+        self.providers = list(providers)
+        self.preferred = preferred or os.getenv('AI_PROVIDER', 'openai').lower()
+        self.breakers = {name: CircuitBreaker() for name in self.providers}
+        self.stats = {name: ProviderStats() for name in self.providers}
+
+    def configured(self):
+        """Providers that have an API key set"""
+        return [name for name in self.providers if os.getenv(PROVIDER_KEYS[name])]
+
+    def ordered(self, prefer=None):
+        """Configured providers, best first"""
+        prefer = prefer or self.preferred
+
+        def rank(name):
+            score = self.stats[name].score()
+            # Unmeasured providers get an assumed score, so a fast measured one stays ahead
+            if score is None:
+                score = PROVIDER_UNMEASURED_LATENCY
+            return (score, 0 if name == prefer else 1)
+
+        ordered = sorted(self.configured(), key=rank)
+        # Occasionally lead with the runner-up so its stats can recover
+        if len(ordered) > 1 and random.random() < PROVIDER_EXPLORE_RATE:
+            ordered[0], ordered[1] = ordered[1], ordered[0]
+        return ordered
+
+    def stream(self, prompt, prefer=None, max_tokens=MAX_TOKENS):
+        """Yield completion text as it arrives from the first provider that starts streaming
+
+        Retries and failover only happen before the first chunk: once text has been
+        handed on, a broken stream raises instead of silently starting over.
+        """
+        candidates = self._candidates(prefer)
+        last_error = None
+        for name in candidates:
+            if not self.breakers[name].allow():
+                print(f"⏭️  Skipping {name}: circuit open")
+                continue
+            try:
+                chunks, start = self._call_with_retries(name, PROVIDER_STREAMS[name], prompt, max_tokens)
+            except Exception as e:
+                last_error = e
+                print(f"⚠️  Provider {name} failed: {e}")
+                continue
+            started = recorded = False
+            try:
+                for chunk in chunks:
+                    started = True
+                    yield chunk
+            except Exception as e:
+                recorded = True
+                self.stats[name].record(False)
+                self.breakers[name].record_failure()
+                if started:
+                    raise
+                last_error = e
+                print(f"⚠️  Provider {name} failed: {e}")
+                continue
+            else:
+                recorded = True
+                self._record_success(name, start)
+                return
+            finally:
+                # Stop the download when the consumer goes away early
+                chunks.close()
+                if not recorded:
+                    # The consumer left (GeneratorExit is not an Exception): text had started,
+                    # so a half-open trial passed, but a partial stream has no latency to record
+                    if started:
+                        self.breakers[name].record_success()
+                    else:
+                        self.breakers[name].release()
+
+        raise ProviderError(f"All AI providers failed (tried {', '.join(candidates)})") from last_error
+
+    def _candidates(self, prefer):
+        candidates = self.ordered(prefer)
+        if not candidates:
+            raise ValueError("No AI provider configured: set OPENAI_API_KEY or ANTHROPIC_API_KEY")
+        return candidates
+
+    def _call_with_retries(self, name, call, prompt, max_tokens):
+        """Call a provider, retrying transient errors; returns the result and the start time"""
+        breaker = self.breakers[name]
+        stats = self.stats[name]
+
+        for attempt in range(PROVIDER_MAX_RETRIES + 1):
+            start = time.monotonic()
+            try:
+                result, headers = call(prompt, max_tokens)
+            except ValueError:
+                # Missing configuration is not a provider failure
+                raise
+            except Exception as e:
+                stats.record(False)
+                stats.observe_headers(getattr(getattr(e, 'response', None), 'headers', None), status_code_of(e))
+                if not is_retryable(e) or attempt == PROVIDER_MAX_RETRIES:
+                    breaker.record_failure()
+                    raise
+
+                retry_after = retry_after_of(e)
+                if retry_after is not None and retry_after > PROVIDER_BACKOFF_MAX:
+                    # The provider asked for a long pause; let the next one take over
+                    breaker.record_failure()
+                    raise
+
+                delay = backoff_delay(attempt, retry_after)
+                print(f"🔁 {name} error ({status_code_of(e) or type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            stats.observe_headers(headers)
+            return result, start
+
+    def _record_success(self, name, start):
+        self.stats[name].record(True, time.monotonic() - start)
+        self.breakers[name].record_success()
+
+    def rate_limited_count(self):
+        """Total 429 responses seen across providers"""
+        return sum(stats.rate_limited for stats in self.stats.values())
+
+    def wait_for_headroom(self):
+        """Seconds until some configured provider has request headroom again"""
+        waits = [self.stats[name].wait_for_headroom() for name in self.configured()]
+        return min(waits) if waits else 0.0
+
+    def typical_latency(self):
+        """Latency of the fastest measured provider, in seconds"""
+        latencies = [self.stats[name].latency for name in self.configured() if self.stats[name].latency]
+        return min(latencies) if latencies else None
+
+
+router = ProviderRouter()
@@ -0,0 +1,249 @@
+# responses.py
+# Compressed responses negotiated from Accept-Encoding, and fingerprinted static assets
+#
+# Dynamic pages are compressed per request at a fast level. Responses that never change
+# for a given strong ETag (feeds, sitemaps, invention pages) are compressed once at the
+# highest level and the bytes are reused from an in-process LRU. Static files are served
+# from memory under content-hash names (style.<hash>.css) with a one-year immutable
+# Cache-Control, precompressed when the manifest is built; url_for('static', ...) emits
+# the hashed names. Brotli is used when the brotli package is installed, gzip otherwise.
+
+import os
+import gzip
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+from flask import Response, request, abort, current_app
+
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'true').lower() == 'true'
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))  # smaller bodies aren't worth a round of compression
+COMPRESSED_CACHE_SIZE = int(os.getenv('COMPRESSED_CACHE_SIZE', '2000'))  # (ETag, encoding) entries kept
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, 'static')
+TEMPLATE_DIR = os.path.join(ROOT, 'templates')
+
+COMPRESSIBLE = {
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript', 'application/javascript',
+    'application/json', 'application/xml', 'application/atom+xml', 'application/feed+json', 'image/svg+xml',
+}
+
+# (gzip level, brotli quality): per-request bodies vs bodies compressed once and reused
+FAST = (6, 5)
+BEST = (9, 11)
+
+_brotli = None
+
+
+def brotli():
+    """The brotli module, or False when it isn't installed"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli as module
+            _brotli = module
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+
+def negotiate():
+    """Best content coding this request accepts: 'br', 'gzip' or None"""
+    offered = ['br', 'gzip'] if brotli() else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def compress(data, encoding, levels=FAST):
+    if encoding == 'br':
+        return brotli().compress(data, quality=levels[1])
+    return gzip.compress(data, compresslevel=levels[0], mtime=0)
+
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by (strong ETag, encoding)"""
+
+    def __init__(self, size=COMPRESSED_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+cache = CompressedCache()
+
+
+def representation_etag(etag, encoding):
+    """A compressed body is a different representation, so it gets its own ETag"""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def compress_response(response):
+    """after_request: compress text responses the client accepts an encoding for"""
+    if (not RESPONSE_COMPRESSION or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate()
+    if encoding is None or (response.content_length or 0) < COMPRESS_MIN_BYTES:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        body = cache.get((etag, encoding))
+        if body is None:
+            body = compress(response.get_data(), encoding, BEST)
+            cache.put((etag, encoding), body)
+        response.set_etag(representation_etag(etag, encoding))
+    else:
+        body = compress(response.get_data(), encoding)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response.make_conditional(request)
+
+
+# --- immutable pages -----------------------------------------------------
+
+_site_version = None
+
+
+def site_version():
+    """Hash of the templates and static assets, so a deploy that changes them changes page ETags"""
+    global _site_version
+    if _site_version is None:
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(TEMPLATE_DIR)):
+            with open(os.path.join(TEMPLATE_DIR, name), 'rb') as f:
+                digest.update(name.encode('utf-8') + f.read())
+        for name in sorted(manifest()):
+            digest.update(manifest()[name].fingerprinted.encode('utf-8'))
+        _site_version = digest.hexdigest()[:16]
+    return _site_version
+
+
+def page_etag(*parts):
+    """Strong ETag for a page that is fully determined by parts (e.g. an invention's content hash)"""
+    key = ':'.join(str(part) for part in parts + (site_version(),))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def immutable_page(etag, render):
+    """HTML response for a page that never changes for its ETag; render() only runs on a cache miss"""
+    encoding = negotiate() if RESPONSE_COMPRESSION else None
+    body = cache.get((etag, encoding))
+    if body is None:
+        body = render().encode('utf-8')
+        if encoding:
+            body = compress(body, encoding, BEST)
+        cache.put((etag, encoding), body)
+
+    response = Response(body, mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(representation_etag(etag, encoding))
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+
+# --- static assets -------------------------------------------------------
+
+class Asset:
+    """A static file held in memory with its fingerprinted name and precompressed bodies"""
+
+    def __init__(self, name, data, mtime):
+        self.name = name
+        self.mtime = mtime
+        self.etag = hashlib.sha256(data).hexdigest()[:32]
+        stem, ext = os.path.splitext(name)
+        self.fingerprinted = f"{stem}.{self.etag[:10]}{ext}"
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.bodies = {None: data}
+        if self.mimetype in COMPRESSIBLE and len(data) >= COMPRESS_MIN_BYTES:
+            for encoding in (['br', 'gzip'] if brotli() else ['gzip']):
+                self.bodies[encoding] = compress(data, encoding, BEST)
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def scan_static():
+    """name and fingerprinted name -> Asset for every file under static/"""
+    assets = {}
+    for directory, _, files in os.walk(STATIC_DIR):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, STATIC_DIR).replace(os.sep, '/')
+            previous = (_manifest or {}).get(name)
+            mtime = os.path.getmtime(path)
+            if previous and previous.mtime == mtime:
+                asset = previous
+            else:
+                with open(path, 'rb') as f:
+                    asset = Asset(name, f.read(), mtime)
+            assets[name] = assets[asset.fingerprinted] = asset
+    return assets
+
+
+def manifest():
+    """Static assets, built on first use (and rescanned on every call in debug mode)"""
+    global _manifest
+    if _manifest is None or (current_app and current_app.debug):
+        with _manifest_lock:
+            _manifest = scan_static()
+    return _manifest
+
+
+def fingerprint_static(endpoint, values):
+    """url_defaults: url_for('static', filename='style.css') -> /static/style.<hash>.css"""
+    if endpoint == 'static' and 'filename' in values:
+        asset = manifest().get(values['filename'])
+        if asset:
+            values['filename'] = asset.fingerprinted
+
+
+def serve_static(filename):
+    """A static file from memory; fingerprinted names are cached for a year"""
+    asset = manifest().get(filename)
+    if asset is None:
+        abort(404)
+
+    encoding = negotiate() if RESPONSE_COMPRESSION and len(asset.bodies) > 1 else None
+    response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if len(asset.bodies) > 1:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(representation_etag(asset.etag, encoding))
+    response.cache_control.public = True
+    if filename == asset.fingerprinted:
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        # Unhashed names (old pages, hand-written links) revalidate instead
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def init_responses(app):
+    """Serve static files from the manifest and compress responses; create the app with static_folder=None"""
+    app.add_url_rule('/static/<path:filename>', endpoint='static', view_func=serve_static)
+    app.url_defaults(fingerprint_static)
+    app.after_request(compress_response)
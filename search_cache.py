@@ -0,0 +1,124 @@
+# search_cache.py
+# In-process cache of formatted /search results, invalidated when the corpus changes
+#
+# Entries are keyed on the normalized query (case-folded, whitespace collapsed) and any
+# filters, evicted LRU-first and after SEARCH_CACHE_TTL seconds, and tagged with the
+# corpus generation: a counter every save bumps in the database. Each process re-reads
+# the counter at most every SEARCH_GENERATION_CHECK seconds (immediately after its own
+# saves), and a new value makes every older entry a miss. Query popularity is tallied
+# in the search_queries table so a fresh worker can prewarm the most common searches.
+
+import os
+import re
+import time
+import threading
+from collections import Counter, OrderedDict
+import storage
+
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '500'))  # cached result lists per process
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '600'))  # seconds
+SEARCH_GENERATION_CHECK = float(os.getenv('SEARCH_GENERATION_CHECK', '5'))  # seconds between counter reads
+SEARCH_PREWARM = int(os.getenv('SEARCH_PREWARM', '20'))  # top queries to run when a worker starts
+TALLY_FLUSH_SECONDS = 60
+MAX_TRACKED_QUERY = 100  # longer queries are cached but not tallied
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(query):
+    """Case-folded, whitespace-collapsed query; searches run on this form"""
+    return WHITESPACE.sub(' ', query).strip().lower()
+
+
+class SearchCache:
+    """LRU + TTL cache of result lists for one corpus generation"""
+
+    def __init__(self, size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (generation, expires at, results)
+        self.generation = None
+        self.checked_at = 0
+        self.hits = 0
+        self.misses = 0
+        self.queries = Counter()  # since start, for stats
+        self.unflushed = Counter()  # not yet added to search_queries
+        self.flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def current_generation(self):
+        now = time.monotonic()
+        if self.generation is None or now - self.checked_at >= SEARCH_GENERATION_CHECK:
+            self.generation = storage.get_repository().corpus_generation()
+            self.checked_at = now
+        return self.generation
+
+    def invalidate(self, repository=None, rows=None, previous=None):
+        """Re-read the corpus generation on the next lookup (save listener)"""
+        self.checked_at = 0
+
+    def get(self, query, search, **filters):
+        """Cached results for query, calling search(normalized query, **filters) on a miss"""
+        normalized = normalize(query)
+        key = (normalized,) + tuple(sorted(filters.items()))
+        generation = self.current_generation()
+        self._tally(normalized)
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == generation and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        results = search(normalized, **filters)
+        with self._lock:
+            self.entries[key] = (generation, time.monotonic() + self.ttl, results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return results
+
+    def _tally(self, normalized):
+        if not normalized or len(normalized) > MAX_TRACKED_QUERY:
+            return
+        with self._lock:
+            self.queries[normalized] += 1
+            self.unflushed[normalized] += 1
+            if time.monotonic() - self.flushed_at < TALLY_FLUSH_SECONDS:
+                return
+            counts, self.unflushed = self.unflushed, Counter()
+            self.flushed_at = time.monotonic()
+        try:
+            storage.get_repository().record_searches(counts)
+        except Exception as e:
+            print(f"⚠️  Could not record search popularity: {e}")
+
+    def prewarm(self, search, limit=SEARCH_PREWARM):
+        """Run the most popular queries so their first visitors hit the cache"""
+        queries = storage.get_repository().top_searches(limit)
+        generation = self.current_generation()
+        for query in queries:
+            results = search(query)
+            with self._lock:
+                self.entries[(query,)] = (generation, time.monotonic() + self.ttl, results)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return len(queries)
+
+    def stats(self):
+        """Hit rate, size and this process's most frequent queries"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'generation': self.generation,
+                'top_queries': self.queries.most_common(20),
+            }
+
+
+cache = SearchCache()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# search_index.py
+# Trigram search index: substring matching without table scans, and "did you mean" suggestions
+#
+# Every saved invention's title and body are trigram-indexed: a contentless FTS5 table on
+# SQLite, pg_trgm GIN indexes on inventions on PostgreSQL, where invention_search holds
+# only the bodies stored compressed or in segment files. So compressed and segment-store
+# bodies are matched in the database too. Words from each invention's title and model
+# text (not the front matter and footer generate.format_invention adds) also go into the
+# search_terms vocabulary, whose trigrams let a misspelt query word find its closest term.
+#
+# Usage: python search_index.py rebuild   # re-index everything (init_db.py does this once on upgrade)
+
+if __name__ == '__main__':
+    # Running from the command line: load .env before configuration is read
+    from dotenv import load_dotenv
+    load_dotenv()
+
+import os
+import re
+import sys
+from collections import Counter
+from parsing import SECTION_PATTERN
+
+SIMILARITY_THRESHOLD = float(os.getenv('SEARCH_SIMILARITY_THRESHOLD', '0.3'))  # as pg_trgm's default
+MIN_TERM_LENGTH = 4
+MAX_TERM_LENGTH = 40
+
+TOKEN = re.compile(r'[a-z0-9]+(?:-[a-z0-9]+)*')
+# Letters only: ids, dates, hashes and part numbers aren't worth suggesting
+WORD = re.compile(r'[a-z]+(?:-[a-z]+)*')
+
+# What generate.format_invention wraps around the model's text
+FRONT_MATTER = re.compile(r'\A---\n.*?\n---\n\s*# [^\n]*\n', re.DOTALL)
+FOOTER = '\n---\n\n**Generated by Perpetual Ideas Machine**'
+
+
+def extract_terms(text):
+    """Distinct lower-case words worth suggesting"""
+    return {token for token in TOKEN.findall(text.lower())
+            if MIN_TERM_LENGTH <= len(token) <= MAX_TERM_LENGTH and WORD.fullmatch(token)}
+
+
+def model_text(content):
+    """A stored invention's text as the model wrote it, without front matter, footer or section labels"""
+    content = FRONT_MATTER.sub('', content, count=1)
+    end = content.rfind(FOOTER)
+    if end >= 0:
+        content = content[:end]
+    return '\n'.join(SECTION_PATTERN.sub('', line, count=1) for line in content.split('\n'))
+
+
+def trigrams(word):
+    """pg_trgm-style trigrams: the word padded with two spaces in front and one behind"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Shared trigrams over all trigrams, as pg_trgm's similarity()"""
+    ta, tb = trigrams(a), trigrams(b)
+    return len(ta & tb) / len(ta | tb) if ta or tb else 0.0
+
+
+def term_counts(rows):
+    """{term: inventions containing it} for rows with title and content"""
+    counts = Counter()
+    for row in rows:
+        counts.update(extract_terms(f"{row.get('title') or ''}\n{model_text(row['content'])}"))
+    return counts
+
+
+def did_you_mean(query, repository=None):
+    """The query with misspelt words replaced by their closest indexed term, or None"""
+    if repository is None:
+        import storage
+        repository = storage.get_repository()
+
+    words = query.split(' ')
+    corrected = list(words)
+    for i, word in enumerate(words):
+        if len(word) < MIN_TERM_LENGTH or not WORD.fullmatch(word) or repository.has_term(word):
+            continue
+        matches = repository.similar_terms(word, limit=1)
+        if matches:
+            corrected[i] = matches[0]
+    return ' '.join(corrected) if corrected != words else None
+
+
+def main():
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python search_index.py rebuild")
+        return 1
+
+    import storage
+    count = storage.get_repository().rebuild_search_index()
+    print(f"✅ Indexed {count} inventions for search")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
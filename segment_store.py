@@ -0,0 +1,145 @@
+# segment_store.py
+# Append-only, content-addressed segment files for invention bodies, read through mmap
+#
+# With CONTENT_STORE=segments the database keeps only metadata, previews and search
+# columns; each body is appended once to the newest segment file, keyed by the SHA-256
+# of the stored markdown (the `hash` column). Records are self-describing, so every
+# process builds its index by scanning the segments and catches up when it meets a
+# hash another process has written since. Needs a persistent disk (not a Heroku dyno).
+#
+# Record layout: sha256 digest (32 bytes) | codec (int32, -1 = plain UTF-8) |
+#                payload length (uint32) | crc32 of payload (uint32) | payload
+
+import os
+import mmap
+import zlib
+import fcntl
+import struct
+import hashlib
+import threading
+
+CONTENT_STORE = os.getenv('CONTENT_STORE', 'database')  # 'database' or 'segments'
+SEGMENT_DIR = os.getenv('SEGMENT_DIR', 'segments')
+SEGMENT_MAX_BYTES = int(os.getenv('SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+
+HEADER = struct.Struct('<32siII')
+PLAIN = -1
+
+
+class Segment:
+    """One segment file and its current read-only mapping"""
+
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+        self.scanned = 0  # bytes of valid records indexed so far
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def view(self, end):
+        """Memoryview of the file covering at least `end` bytes"""
+        if self.map is None or len(self.map) < end:
+            with open(self.path, 'rb') as f:
+                # The old mapping stays alive while slices of it are still referenced
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self.map)
+
+
+class SegmentStore:
+    """Content-addressed body storage in append-only segment files"""
+
+    def __init__(self, directory=SEGMENT_DIR, max_bytes=SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.segments = {}
+        # sha256 hex -> (segment number, payload offset, payload length, codec)
+        self.index = {}
+        self._lock = threading.Lock()
+        with self._lock:
+            self._catch_up()
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f'segment-{number:06d}.seg')
+
+    def _catch_up(self):
+        """Index records appended since the last scan, in this or another process"""
+        numbers = sorted(
+            int(name[len('segment-'):-len('.seg')]) for name in os.listdir(self.directory)
+            if name.startswith('segment-') and name.endswith('.seg')
+        )
+        for number in numbers:
+            segment = self.segments.setdefault(number, Segment(self._segment_path(number)))
+            size = segment.size()
+            if size <= segment.scanned:
+                continue
+            view = segment.view(size)
+            offset = segment.scanned
+            while offset + HEADER.size <= size:
+                digest, codec, length, crc = HEADER.unpack_from(view, offset)
+                start = offset + HEADER.size
+                # A torn or corrupt tail ends the valid part of the segment
+                if start + length > size or zlib.crc32(view[start:start + length]) != crc:
+                    break
+                self.index[digest.hex()] = (number, start, length, None if codec == PLAIN else codec)
+                offset = start + length
+            segment.scanned = offset
+
+    def __contains__(self, content_hash):
+        return content_hash in self.index
+
+    def append(self, content_hash, content, codec, payload):
+        """Store a body under its SHA-256; codec None means payload is plain UTF-8"""
+        if hashlib.sha256(content.encode('utf-8')).hexdigest() != content_hash:
+            raise ValueError("Content hash does not match the SHA-256 of the content")
+
+        with self._lock, open(os.path.join(self.directory, 'append.lock'), 'w') as lock:
+            # One appender at a time across processes
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._catch_up()
+            existing = self.index.get(content_hash)
+            if existing and existing[3] == codec:
+                return
+
+            number = max(self.segments, default=0)
+            segment = self.segments.get(number)
+            if segment is None or segment.scanned + HEADER.size + len(payload) > self.max_bytes:
+                number += 1
+                segment = self.segments[number] = Segment(self._segment_path(number))
+
+            record = HEADER.pack(bytes.fromhex(content_hash), PLAIN if codec is None else codec,
+                                 len(payload), zlib.crc32(payload))
+            with open(segment.path, 'ab') as f:
+                # Drop a torn record left by a crashed writer before appending after it
+                f.truncate(segment.scanned)
+                f.write(record)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+            start = segment.scanned + HEADER.size
+            segment.scanned = start + len(payload)
+            self.index[content_hash] = (number, start, len(payload), codec)
+
+    def read(self, content_hash):
+        """(codec, zero-copy memoryview of the payload) for a stored body"""
+        with self._lock:
+            location = self.index.get(content_hash)
+            if location is None:
+                self._catch_up()
+                location = self.index.get(content_hash)
+            if location is None:
+                raise LookupError(f"Content {content_hash} is not in the segment store")
+            number, start, length, codec = location
+            view = self.segments[number].view(start + length)
+        return codec, view[start:start + length]
+
+    def stats(self):
+        """Segment count, total bytes and stored bodies"""
+        with self._lock:
+            return {
+                'segments': len(self.segments),
+                'bytes': sum(segment.scanned for segment in self.segments.values()),
+                'bodies': len(self.index),
+            }
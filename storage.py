@@ -0,0 +1,979 @@
+# storage.py
+# Repository interface shared by the PostgreSQL and SQLite backends
+#
+# Every query lives once in the QUERIES catalogue with :named parameters. Backends
+# compile each entry for their dialect and prepare it once per connection
+# (PREPARE/EXECUTE on PostgreSQL, the statement cache on SQLite), so new features
+# get both fast paths by adding a catalogue entry and a Repository method.
+
+import os
+import re
+import json
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from compression import CONTENT_COMPRESSION, ContentCodec
+from segment_store import CONTENT_STORE, SEGMENT_DIR
+from search_index import SIMILARITY_THRESHOLD, similarity, term_counts, trigrams
+
+
+class Query:
+    """A catalogue entry: SQL with :named parameters, optionally per dialect (or for one dialect only)"""
+
+    def __init__(self, sql=None, postgres=None, sqlite=None, readonly=True, arrays=(),
+                 replica=None, primary_fallback=False):
+        self.sql = {'postgres': postgres or sql, 'sqlite': sqlite or sql}
+        self.readonly = readonly
+        # Parameters that carry a list of values
+        self.arrays = arrays
+        # Whether a read replica may answer (reads by default)
+        self.replica = readonly if replica is None else replica
+        # Ask the primary again when a replica finds no row (it may not have replicated yet)
+        self.primary_fallback = primary_fallback
+
+
+PARAM_PATTERN = re.compile(r'(?<![:\w]):(\w+)')
+
+# Characters of each invention kept uncompressed for listing pages
+PREVIEW_LENGTH = 300
+SEARCH_LIMIT = 50
+
+PREVIEW_COLUMNS = """invention_id as id, invention_id, domain_key, domain_name, title,
+               substr(preview, 1, {length}) as preview, created_at,
+               DATE(created_at) as date"""
+
+SEARCH_COLUMNS = """invention_id as id, invention_id, domain_key, domain_name, title, content, created_at,
+               DATE(created_at) as date"""
+
+HIT_COLUMNS = f"{SEARCH_COLUMNS}, hash, content_codec, content_z, content_store"
+
+# Faceted search returns one row per hit on the requested page, each carrying a JSON
+# facets column: {"domains": {key: hits}, "months": {"YYYY-MM": hits}, "total": hits}.
+# Domain counts ignore the domain filter and month counts the date filter, so either can
+# be changed from the counts shown. With no hits, one row of NULL hit columns is returned.
+
+FACETED_SEARCH_POSTGRES = f"""
+    WITH matches AS (
+        SELECT invention_id, domain_key, to_char(created_at, 'YYYY-MM') AS month,
+               (CAST(:domain_key AS TEXT) IS NULL OR domain_key = :domain_key) AS in_domain,
+               ((CAST(:date_from AS TIMESTAMP) IS NULL OR created_at >= :date_from)
+                AND (CAST(:date_before AS TIMESTAMP) IS NULL OR created_at < :date_before)) AS in_dates
+        FROM inventions
+        WHERE invention_id IN (
+            SELECT invention_id FROM inventions
+            WHERE title ILIKE :pattern OR (NOT :title_only AND content ILIKE :pattern)
+            UNION
+            SELECT invention_id FROM invention_search
+            WHERE NOT :title_only AND body ILIKE :pattern
+        )
+    ),
+    counts AS (
+        SELECT domain_key, month, GROUPING(domain_key) AS all_domains, GROUPING(month) AS all_months,
+               COUNT(*) FILTER (WHERE in_dates) AS domain_hits,
+               COUNT(*) FILTER (WHERE in_domain) AS month_hits,
+               COUNT(*) FILTER (WHERE in_domain AND in_dates) AS total
+        FROM matches
+        GROUP BY GROUPING SETS ((domain_key), (month), ())
+    ),
+    facets AS (
+        SELECT json_build_object(
+            'domains', (SELECT json_object_agg(domain_key, domain_hits) FROM counts
+                        WHERE all_domains = 0 AND domain_hits > 0),
+            'months', (SELECT json_object_agg(month, month_hits) FROM counts
+                       WHERE all_months = 0 AND month_hits > 0),
+            'total', (SELECT total FROM counts WHERE all_domains = 1 AND all_months = 1)
+        ) AS facets
+    )
+    SELECT facets.facets, hits.*
+    FROM facets LEFT JOIN (
+        SELECT {HIT_COLUMNS}
+        FROM inventions
+        WHERE invention_id IN (SELECT invention_id FROM matches WHERE in_domain AND in_dates)
+        ORDER BY created_at DESC
+        LIMIT {SEARCH_LIMIT} OFFSET :offset
+    ) hits ON true
+    ORDER BY hits.created_at DESC
+"""
+
+
+def faceted_search_sqlite(condition):
+    """The SQLite form of FACETED_SEARCH_POSTGRES (no GROUPING SETS), for a condition on inventions"""
+    return f"""
+        WITH matches AS (
+            SELECT id, domain_key, strftime('%Y-%m', created_at) AS month,
+                   (:domain_key IS NULL OR domain_key = :domain_key) AS in_domain,
+                   ((:date_from IS NULL OR created_at >= :date_from)
+                    AND (:date_before IS NULL OR created_at < :date_before)) AS in_dates
+            FROM inventions
+            WHERE {condition}
+        ),
+        facets AS (
+            SELECT json_object(
+                'domains', json((SELECT json_group_object(domain_key, n) FROM (
+                    SELECT domain_key, COUNT(*) AS n FROM matches WHERE in_dates GROUP BY domain_key))),
+                'months', json((SELECT json_group_object(month, n) FROM (
+                    SELECT month, COUNT(*) AS n FROM matches WHERE in_domain GROUP BY month))),
+                'total', (SELECT COUNT(*) FROM matches WHERE in_domain AND in_dates)
+            ) AS facets
+        )
+        SELECT facets.facets, hits.*
+        FROM facets LEFT JOIN (
+            SELECT {HIT_COLUMNS}
+            FROM inventions
+            WHERE id IN (SELECT id FROM matches WHERE in_domain AND in_dates)
+            ORDER BY created_at DESC
+            LIMIT {SEARCH_LIMIT} OFFSET :offset
+        ) hits ON 1
+        ORDER BY hits.created_at DESC
+    """
+
+
+QUERIES = {
+    'save_invention': Query("""
+        INSERT INTO inventions (invention_id, domain_key, domain_name, title, content, hash,
+                                content_codec, content_z, content_store, preview)
+        VALUES (:invention_id, :domain_key, :domain_name, :title, :content, :hash,
+                :content_codec, :content_z, :content_store, :preview)
+        ON CONFLICT (invention_id) DO UPDATE
+        SET content = EXCLUDED.content,
+            title = EXCLUDED.title,
+            hash = EXCLUDED.hash,
+            content_codec = EXCLUDED.content_codec,
+            content_z = EXCLUDED.content_z,
+            content_store = EXCLUDED.content_store,
+            preview = EXCLUDED.preview
+    """, readonly=False),
+
+    'set_content': Query("""
+        UPDATE inventions
+        SET content = :content, content_codec = :content_codec, content_z = :content_z,
+            content_store = :content_store
+        WHERE invention_id = :invention_id
+    """, readonly=False),
+
+    'content_page': Query("""
+        SELECT invention_id, title, hash, content, content_codec, content_z, content_store
+        FROM inventions
+        WHERE invention_id > :after
+        ORDER BY invention_id
+        LIMIT :limit
+    """),
+
+    # From the primary, so a dictionary is usable as soon as it has been trained
+    'dictionaries': Query("SELECT version, dictionary FROM content_dictionaries", replica=False),
+
+    'save_dictionary': Query("""
+        INSERT INTO content_dictionaries (version, dictionary)
+        VALUES (:version, :dictionary)
+    """, readonly=False),
+
+    'get_invention': Query("""
+        SELECT * FROM inventions
+        WHERE domain_key = :domain_key AND invention_id = :invention_id
+    """, primary_fallback=True),
+
+    'get_many': Query(
+        postgres="SELECT * FROM inventions WHERE invention_id = ANY(CAST(:ids AS TEXT[]))",
+        sqlite="SELECT * FROM inventions WHERE invention_id IN (SELECT value FROM json_each(:ids))",
+        arrays=('ids',)
+    ),
+
+    # The stored versions of inventions about to be re-saved, to take out of the search index
+    'saved_versions': Query(
+        postgres="SELECT * FROM inventions WHERE invention_id = ANY(CAST(:ids AS TEXT[]))",
+        sqlite="SELECT * FROM inventions WHERE invention_id IN (SELECT value FROM json_each(:ids))",
+        arrays=('ids',), replica=False
+    ),
+
+    'inventions_by_domain': Query(f"""
+        SELECT {PREVIEW_COLUMNS.format(length=300)}
+        FROM inventions
+        WHERE domain_key = :domain_key
+        ORDER BY created_at DESC
+        LIMIT :limit
+    """),
+
+    'all_inventions': Query(f"""
+        SELECT {PREVIEW_COLUMNS.format(length=200)}
+        FROM inventions
+        ORDER BY created_at DESC
+        LIMIT :limit
+    """),
+
+    # Substring search through the trigram indexes (see search_index.py); the body comes
+    # from the inventions row so compressed and external content decode as usual
+    'search': Query(
+        postgres=FACETED_SEARCH_POSTGRES,
+        sqlite=faceted_search_sqlite("id IN (SELECT rowid FROM invention_search WHERE invention_search MATCH :phrase)")
+    ),
+
+    # Queries shorter than a trigram: pg_trgm falls back to scanning by itself. The FTS5 table
+    # keeps no text to LIKE against, so on SQLite they match titles, plain bodies and previews.
+    'search_short': Query(
+        postgres=FACETED_SEARCH_POSTGRES,
+        sqlite=faceted_search_sqlite(
+            "title LIKE :pattern OR (NOT :title_only AND (content LIKE :pattern OR preview LIKE :pattern))")
+    ),
+
+    # FTS5 stores no text (content=''), so removing a document takes the values it was indexed with
+    'unindex_invention': Query(
+        postgres="DELETE FROM invention_search WHERE invention_id = :invention_id",
+        sqlite="""
+            INSERT INTO invention_search (invention_search, rowid, title, body)
+            SELECT 'delete', id, :title, :body FROM inventions WHERE invention_id = :invention_id
+        """,
+        readonly=False
+    ),
+
+    # PostgreSQL matches titles and plain bodies in inventions itself and copies only bodies
+    # that are compressed or in segment files
+    'index_invention': Query(
+        postgres="""
+            INSERT INTO invention_search (invention_id, body)
+            SELECT invention_id, :body FROM inventions
+            WHERE invention_id = :invention_id AND content = ''
+        """,
+        sqlite="""
+            INSERT INTO invention_search (rowid, title, body)
+            SELECT id, :title, :body FROM inventions WHERE invention_id = :invention_id
+        """,
+        readonly=False
+    ),
+
+    'save_terms': Query("""
+        INSERT INTO search_terms (term, documents)
+        VALUES (:term, :documents)
+        ON CONFLICT (term) DO UPDATE
+        SET documents = search_terms.documents + EXCLUDED.documents
+    """, readonly=False),
+
+    # SQLite has no pg_trgm, so term trigrams are kept in a table of their own
+    'save_term_trigrams': Query(sqlite="""
+        INSERT OR IGNORE INTO term_trigrams (trigram, term)
+        SELECT value, :term FROM json_each(:trigrams)
+    """, readonly=False, arrays=('trigrams',)),
+
+    'drop_term': Query("DELETE FROM search_terms WHERE term = :term AND documents <= 0", readonly=False),
+
+    'get_term': Query("SELECT documents FROM search_terms WHERE term = :term"),
+
+    'frequent_terms': Query("""
+        SELECT term, documents FROM search_terms
+        ORDER BY documents DESC, term
+        LIMIT :limit
+    """),
+
+    # Candidates sharing trigrams with a word; similar_terms() ranks them
+    'term_candidates': Query(
+        postgres="""
+            SELECT term, documents FROM search_terms
+            WHERE term % :word
+            ORDER BY similarity(term, :word) DESC, documents DESC
+            LIMIT 50
+        """,
+        sqlite="""
+            SELECT t.term, s.documents
+            FROM term_trigrams t JOIN search_terms s ON s.term = t.term
+            WHERE t.trigram IN (SELECT value FROM json_each(:trigrams))
+            GROUP BY t.term
+            ORDER BY COUNT(*) DESC, s.documents DESC
+            LIMIT 50
+        """,
+        arrays=('trigrams',)
+    ),
+
+    'clear_invention_search': Query(
+        postgres="DELETE FROM invention_search",
+        sqlite="INSERT INTO invention_search (invention_search) VALUES ('delete-all')",
+        readonly=False
+    ),
+    'clear_search_terms': Query("DELETE FROM search_terms", readonly=False),
+    'clear_term_trigrams': Query(sqlite="DELETE FROM term_trigrams", readonly=False),
+
+    'count_by_domain': Query("""
+        SELECT COUNT(*) as count
+        FROM inventions
+        WHERE domain_key = :domain_key
+    """),
+
+    'count_total': Query("SELECT COUNT(*) as total FROM inventions"),
+
+    'recent_entries': Query("""
+        SELECT invention_id, domain_key, domain_name, title, preview, created_at
+        FROM inventions
+        ORDER BY created_at DESC, invention_id DESC
+        LIMIT :limit
+    """),
+
+    'recent_domain_entries': Query("""
+        SELECT invention_id, domain_key, domain_name, title, preview, created_at
+        FROM inventions
+        WHERE domain_key = :domain_key
+        ORDER BY created_at DESC, invention_id DESC
+        LIMIT :limit
+    """),
+
+    # Listing metadata for catalogue.py, oldest first
+    'catalogue_since': Query("""
+        SELECT invention_id, domain_key, domain_name, title, substr(preview, 1, :length) AS preview, created_at
+        FROM inventions
+        WHERE created_at >= :since
+        ORDER BY created_at, invention_id
+    """),
+
+    # The same columns for particular inventions, e.g. ones this process just saved
+    'catalogue_rows': Query(
+        postgres="""
+            SELECT invention_id, domain_key, domain_name, title, substr(preview, 1, :length) AS preview, created_at
+            FROM inventions WHERE invention_id = ANY(CAST(:ids AS TEXT[]))
+        """,
+        sqlite="""
+            SELECT invention_id, domain_key, domain_name, title, substr(preview, 1, :length) AS preview, created_at
+            FROM inventions WHERE invention_id IN (SELECT value FROM json_each(:ids))
+        """,
+        arrays=('ids',), replica=False
+    ),
+
+    'sitemap_page': Query("""
+        SELECT invention_id, domain_key, created_at
+        FROM inventions
+        ORDER BY created_at, invention_id
+        LIMIT :limit OFFSET :offset
+    """),
+
+    # Rendered feeds and sitemaps (see feeds.py); read from the primary so a fresh save shows up
+    'get_feed': Query("""
+        SELECT name, content_type, body, etag, updated_at FROM feeds WHERE name = :feed_name
+    """, replica=False),
+
+    'feed_etag': Query("SELECT etag FROM feeds WHERE name = :feed_name", replica=False),
+
+    'save_feed': Query("""
+        INSERT INTO feeds (name, content_type, body, etag, updated_at)
+        VALUES (:feed_name, :content_type, :body, :etag, :updated_at)
+        ON CONFLICT (name) DO UPDATE
+        SET content_type = EXCLUDED.content_type,
+            body = EXCLUDED.body,
+            etag = EXCLUDED.etag,
+            updated_at = EXCLUDED.updated_at
+    """, readonly=False),
+
+    # Serializes feed rebuilds across processes until the transaction ends (see feeds.py);
+    # SQLite's BEGIN IMMEDIATE already holds the database's write lock
+    'lock_feeds': Query(postgres="SELECT pg_advisory_xact_lock(hashtext('feeds'))", readonly=False),
+
+    # Seconds a replica is behind (0 once it has replayed everything it received)
+    'replica_lag': Query(
+        postgres="""
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END AS lag
+        """,
+        sqlite="SELECT 0 AS lag"
+    ),
+
+    'counts_per_domain': Query("""
+        SELECT domain_key, COUNT(*) as count
+        FROM inventions
+        GROUP BY domain_key
+    """),
+
+    # Bumped on every save so search caches in any process know the corpus changed
+    'bump_generation': Query(
+        "UPDATE counters SET value = value + 1 WHERE name = 'corpus_generation'", readonly=False),
+
+    'corpus_generation': Query("SELECT value FROM counters WHERE name = 'corpus_generation'"),
+
+    'record_searches': Query("""
+        INSERT INTO search_queries (query, searches, last_searched)
+        VALUES (:query, :searches, CURRENT_TIMESTAMP)
+        ON CONFLICT (query) DO UPDATE
+        SET searches = search_queries.searches + EXCLUDED.searches,
+            last_searched = EXCLUDED.last_searched
+    """, readonly=False),
+
+    'top_searches': Query("""
+        SELECT query, searches FROM search_queries
+        ORDER BY searches DESC
+        LIMIT :limit
+    """),
+}
+
+
+def compile_positional(sql, placeholder):
+    """Rewrite :named parameters as positional ones; returns (sql, parameter order)"""
+    order = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in order:
+            order.append(name)
+        return placeholder(order.index(name) + 1)
+
+    return PARAM_PATTERN.sub(replace, sql), order
+
+
+class InventionRow(dict):
+    """A row whose content is loaded and decompressed the first time it is read"""
+
+    def __init__(self, row, load_content):
+        version = row.pop('content_codec', None)
+        blob = row.pop('content_z', None)
+        store = row.pop('content_store', None)
+        super().__init__(row)
+        self._pending = None
+        if version is not None or store is not None:
+            self.pop('content', None)
+            self._pending = (load_content, version, blob, store, row.get('hash'))
+
+    def __missing__(self, key):
+        if key == 'content' and self._pending:
+            load_content, *location = self._pending
+            self._pending = None
+            self['content'] = load_content(*location)
+            return self['content']
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return super().__contains__(key) or (key == 'content' and self._pending is not None)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+class Repository:
+    """Invention storage; subclasses implement connections and statement execution"""
+
+    dialect = None
+    # LIMIT value meaning "no limit"
+    no_limit = None
+    # Versioned schema changes: [(version, [statements])], applied by init_db()
+    migrations = []
+    # Methods that fill a migration's tables with data SQL can't derive (e.g. decompressed bodies)
+    backfills = {6: 'rebuild_search_index', 7: 'rebuild_search_index'}
+    # Statement opening a write transaction
+    begin = 'BEGIN'
+
+    def __init__(self):
+        self._local = threading.local()
+        self.codec = ContentCodec(self.load_dictionaries)
+        self.compress = CONTENT_COMPRESSION
+        self.content_store = CONTENT_STORE
+        self._segments = None
+
+    # --- backend hooks -------------------------------------------------
+
+    def connect(self):
+        raise NotImplementedError
+
+    def _execute(self, conn, name, params, fetch):
+        """Run a catalogue query; fetch is 'one', 'all' or None"""
+        raise NotImplementedError
+
+    def _execute_many(self, conn, name, param_rows):
+        """Run a write query once per parameter row, inside self.transaction()"""
+        raise NotImplementedError
+
+    def _statement(self, conn, sql):
+        """Run a bare statement such as BEGIN or COMMIT"""
+        raise NotImplementedError
+
+    def _migrate(self, conn, version, statements):
+        raise NotImplementedError
+
+    def _applied_versions(self, conn):
+        raise NotImplementedError
+
+    # --- connections ---------------------------------------------------
+
+    def connection(self):
+        """This thread's connection, reopened after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self.connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.prepared = set()
+        return conn
+
+    def reset_connection(self):
+        """Drop this thread's connection (after it broke)"""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def fetch_one(self, name, **params):
+        return self._run(name, params, 'one')
+
+    def fetch_all(self, name, **params):
+        return self._run(name, params, 'all')
+
+    def execute(self, name, **params):
+        return self._run(name, params, None)
+
+    def execute_many(self, name, param_rows):
+        if not param_rows:
+            return
+        with self.transaction():
+            return self._execute_many(self.connection(), name, param_rows)
+
+    @contextmanager
+    def transaction(self):
+        """Run the block's statements in one transaction on this thread's connection
+
+        Nested blocks join the outer transaction.
+        """
+        if self.in_transaction():
+            yield
+            return
+        conn = self.connection()
+        self._statement(conn, self.begin)
+        self._local.transaction = True
+        try:
+            yield
+        except BaseException:
+            self._local.transaction = False
+            try:
+                self._statement(conn, 'ROLLBACK')
+            except Exception:
+                # The connection broke; the server rolls back on its own
+                self.reset_connection()
+            raise
+        self._local.transaction = False
+        self._statement(conn, 'COMMIT')
+
+    def in_transaction(self):
+        return getattr(self._local, 'transaction', False)
+
+    def pin_primary(self, pinned=True):
+        """Send this thread's reads to the primary (read-your-writes); no-op without replicas"""
+        self._local.pinned = pinned
+
+    def pinned(self):
+        return getattr(self._local, 'pinned', False)
+
+    def _run(self, name, params, fetch):
+        return self._decode_result(self._execute(self.connection(), name, params, fetch), fetch)
+
+    def _decode_result(self, result, fetch):
+        if fetch == 'one' and result:
+            return self._decode(result)
+        if fetch == 'all':
+            return [self._decode(row) for row in result]
+        return result
+
+    def _decode(self, row):
+        return InventionRow(row, self._load_content) if 'content_z' in row else row
+
+    @property
+    def segments(self):
+        """The segment file store for bodies kept outside the database"""
+        if self._segments is None:
+            from segment_store import SegmentStore
+            self._segments = SegmentStore(SEGMENT_DIR)
+        return self._segments
+
+    def _load_content(self, version, blob, store, content_hash):
+        if store == 'segments':
+            version, blob = self.segments.read(content_hash)
+            if version is None:
+                return str(blob, 'utf-8')
+        return self.codec.decompress(version, blob)
+
+    # --- schema --------------------------------------------------------
+
+    def init_db(self):
+        """Apply pending schema migrations"""
+        conn = self.connection()
+        applied = self._applied_versions(conn)
+        backfills = {}
+        for version, statements in self.migrations:
+            if version not in applied:
+                self._migrate(conn, version, statements)
+                print(f"🗄️  Applied {self.dialect} migration {version}")
+                if version in self.backfills:
+                    backfills.setdefault(self.backfills[version], version)
+        # Once the schema is complete, and each method once however many migrations asked for it
+        for version in backfills.values():
+            self._backfill(version)
+        print("✅ Database initialized")
+
+    def _backfill(self, version):
+        method = self.backfills[version]
+        try:
+            count = getattr(self, method)()
+        except Exception as e:
+            # The migration itself is recorded; the backfill can be rerun on its own
+            print(f"❌ {method} failed after migration {version}: {e}")
+            raise
+        print(f"🗄️  Backfilled {count} inventions for migration {version}")
+
+    # --- inventions ----------------------------------------------------
+
+    def save_invention(self, invention_id, domain_key, domain_name, title, content, hash_value):
+        """Save invention to database"""
+        self.save_many([dict(invention_id=invention_id, domain_key=domain_key, domain_name=domain_name,
+                             title=title, content=content, hash=hash_value)])
+
+    def save_many(self, rows):
+        """Save several inventions in one transaction, with their search index entries
+
+        rows are dicts with invention_id, domain_key, domain_name, title, content and hash.
+        The contentless index can only drop an entry given the values it was built from,
+        so the rows and the index must never be committed apart.
+        """
+        # Compress (and write segment bodies) before taking the write lock
+        encoded = [self._encode(dict(row)) for row in rows]
+        with self.transaction():
+            previous = self._saved_versions(rows)
+            self.execute_many('save_invention', encoded)
+            self.index_search(rows, previous)
+            self.execute('bump_generation')
+        self._notify_saved(rows, previous)
+
+    def _saved_versions(self, rows):
+        """Title and content as currently stored for any of rows already saved"""
+        return [{'invention_id': row['invention_id'], 'title': row['title'], 'content': row['content']}
+                for row in self.fetch_all('saved_versions', ids=[row['invention_id'] for row in rows])]
+
+    def _notify_saved(self, rows, previous):
+        """Let derived data (feeds, caches, indexes) catch up; their failures never fail a save"""
+        for listener in _save_listeners:
+            try:
+                listener(self, rows, previous)
+            except Exception as e:
+                print(f"⚠️  {listener.__module__}.{listener.__name__} failed after save: {e}")
+
+    def _encode(self, row):
+        """Storage columns for a row's content (compressed and/or in segment files), plus its preview"""
+        content = row['content']
+        row['preview'] = content[:PREVIEW_LENGTH]
+        row['content_codec'], row['content_z'], row['content_store'] = None, None, None
+        if self.compress:
+            row['content_codec'], row['content_z'] = self.codec.compress(content)
+            row['content'] = ''
+        if self.content_store == 'segments':
+            # Body first, so a saved row never points at a missing body
+            payload = row['content_z'] if self.compress else content.encode('utf-8')
+            self.segments.append(row['hash'], content, row['content_codec'], payload)
+            row['content'], row['content_codec'], row['content_z'] = '', None, None
+            row['content_store'] = 'segments'
+        return row
+
+    def get_invention(self, domain_key, invention_id):
+        """Get a specific invention"""
+        return self.fetch_one('get_invention', domain_key=domain_key, invention_id=invention_id)
+
+    def get_many(self, ids):
+        """Get several inventions by invention_id, in the order requested"""
+        if not ids:
+            return []
+        rows = {row['invention_id']: row for row in self.fetch_all('get_many', ids=list(ids))}
+        return [rows[i] for i in ids if i in rows]
+
+    def get_inventions_by_domain(self, domain_key, limit=None):
+        """Get all inventions for a domain"""
+        return self.fetch_all('inventions_by_domain', domain_key=domain_key, limit=limit or self.no_limit)
+
+    def get_all_inventions(self, limit=100):
+        """Get all inventions across all domains"""
+        return self.fetch_all('all_inventions', limit=limit)
+
+    def search_inventions(self, query, domain_key=None, date_from=None, date_to=None, title_only=False, page=1):
+        """One page of hits for a query and filters, with hit counts per domain and per month
+
+        Dates are 'YYYY-MM-DD' and inclusive. Returns {'results', 'total', 'domains', 'months'}.
+        """
+        date_before = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat() if date_to else None
+        params = dict(pattern=f"%{query}%", domain_key=domain_key, date_from=date_from, date_before=date_before,
+                      title_only=bool(title_only), offset=(page - 1) * SEARCH_LIMIT)
+        if len(query) < 3:
+            rows = self.fetch_all('search_short', **params)
+        else:
+            # FTS5 phrase: consecutive trigrams, i.e. a case-insensitive substring match
+            phrase = '"' + query.replace('"', '""') + '"'
+            rows = self.fetch_all('search', phrase=f"title : {phrase}" if title_only else phrase, **params)
+
+        facets = rows[0]['facets'] if rows else None
+        if isinstance(facets, str):
+            facets = json.loads(facets)
+        facets = facets or {}
+        return {
+            'results': [row for row in rows if row['invention_id'] is not None],
+            'total': facets.get('total') or 0,
+            'domains': facets.get('domains') or {},
+            'months': facets.get('months') or {},
+        }
+
+    def index_search(self, rows, previous=()):
+        """Add saved inventions to the trigram index and their words to the vocabulary
+
+        previous are the versions of re-saved inventions that were indexed before; they are
+        taken out of the index and their terms no longer count.
+        """
+        counts = term_counts(rows)
+        counts.subtract(term_counts(previous))
+        with self.transaction():
+            self._index_bodies(rows, previous)
+            self._index_terms({term: n for term, n in counts.items() if n})
+
+    def _index_bodies(self, rows, previous):
+        def search_row(row):
+            return {'invention_id': row['invention_id'], 'title': row.get('title') or '', 'body': row['content']}
+
+        self.execute_many('unindex_invention', [search_row(row) for row in previous])
+        self.execute_many('index_invention', [search_row(row) for row in rows])
+
+    def _index_terms(self, counts):
+        """Add {term: change in documents}; sorted, so concurrent saves lock terms in the same order"""
+        changes = sorted(counts.items())
+        self.execute_many('save_terms', [{'term': term, 'documents': n} for term, n in changes])
+        self.execute_many('drop_term', [{'term': term} for term, n in changes if n < 0])
+
+    def has_term(self, term):
+        return self.fetch_one('get_term', term=term) is not None
+
+    def similar_terms(self, word, limit=5):
+        """Indexed terms closest to a (possibly misspelt) word, best first"""
+        candidates = self.fetch_all('term_candidates', word=word, trigrams=sorted(trigrams(word)))
+        scored = [(similarity(word, row['term']), row['documents'], row['term']) for row in candidates]
+        scored = sorted((item for item in scored if item[0] >= SIMILARITY_THRESHOLD), reverse=True)
+        return [term for _, _, term in scored[:limit]]
+
+    def frequent_terms(self, limit):
+        """The most widely used vocabulary terms, for type-ahead suggestions"""
+        return self.fetch_all('frequent_terms', limit=limit)
+
+    def clear_search_index(self):
+        with self.transaction():
+            self.execute('clear_invention_search')
+            self.execute('clear_search_terms')
+
+    def rebuild_search_index(self, batch_size=200):
+        """Re-index every invention, e.g. those saved before the index existed"""
+        self.clear_search_index()
+        count = 0
+        batch = []
+        for row in self.iter_contents(batch_size):
+            batch.append({'invention_id': row['invention_id'], 'title': row['title'], 'content': row['content']})
+            if len(batch) == batch_size:
+                self.index_search(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.index_search(batch)
+            count += len(batch)
+        return count
+
+    def corpus_generation(self):
+        """Counter that changes whenever inventions are saved"""
+        row = self.fetch_one('corpus_generation')
+        return row['value'] if row else 0
+
+    def record_searches(self, counts):
+        """Add {normalized query: searches} to the popular-search tally"""
+        self.execute_many('record_searches', [{'query': query, 'searches': n} for query, n in counts.items()])
+
+    def top_searches(self, limit):
+        """Most frequent normalized queries, most searched first"""
+        return [row['query'] for row in self.fetch_all('top_searches', limit=limit)]
+
+    def count_inventions_by_domain(self, domain_key):
+        """Count inventions in a domain"""
+        result = self.fetch_one('count_by_domain', domain_key=domain_key)
+        return result['count'] if result else 0
+
+    # --- content compression -------------------------------------------
+
+    def load_dictionaries(self):
+        """Every trained content dictionary, by version"""
+        return {row['version']: row['dictionary'] for row in self.fetch_all('dictionaries')}
+
+    def add_dictionary(self, dictionary):
+        """Store a newly trained dictionary; new content is compressed with it from now on"""
+        version = max(self.load_dictionaries(), default=0) + 1
+        self.execute('save_dictionary', version=version, dictionary=dictionary)
+        self.codec.refresh()
+        return version
+
+    def iter_contents(self, page_size=200):
+        """Every invention's id and content (decompressed on access), in pages"""
+        after = ''
+        while True:
+            rows = self.fetch_all('content_page', after=after, limit=page_size)
+            if not rows:
+                return
+            yield from rows
+            after = rows[-1]['invention_id']
+
+    def sample_contents(self, limit):
+        """Up to limit invention bodies, for dictionary training"""
+        samples = []
+        for row in self.iter_contents():
+            if len(samples) == limit:
+                break
+            samples.append(row['content'])
+        return samples
+
+    def recompress_all(self, batch_size=200):
+        """Rewrite every invention with the current compression and content store settings"""
+        count = 0
+        batch, texts = [], []
+        for row in self.iter_contents(batch_size):
+            encoded = self._encode({'content': row['content'], 'hash': row['hash']})
+            batch.append({'invention_id': row['invention_id'], 'content': encoded['content'],
+                          'content_codec': encoded['content_codec'], 'content_z': encoded['content_z'],
+                          'content_store': encoded['content_store']})
+            texts.append({'invention_id': row['invention_id'], 'title': row['title'], 'content': row['content']})
+            if len(batch) == batch_size:
+                self._set_contents(batch, texts)
+                count += len(batch)
+                batch, texts = [], []
+        if batch:
+            self._set_contents(batch, texts)
+            count += len(batch)
+        return count
+
+    def _set_contents(self, batch, texts):
+        with self.transaction():
+            self.execute_many('set_content', batch)
+            # Where a body is stored decides whether PostgreSQL's search index keeps a copy of it
+            self._index_bodies(texts, texts)
+
+    # --- feeds -----------------------------------------------------------
+
+    def recent_entries(self, limit, domain_key=None):
+        """Newest inventions' metadata and previews, for feeds"""
+        if domain_key:
+            return self.fetch_all('recent_domain_entries', domain_key=domain_key, limit=limit)
+        return self.fetch_all('recent_entries', limit=limit)
+
+    def catalogue_since(self, since, preview_length):
+        """Listing metadata of inventions created at or after since (None for all)"""
+        return self.fetch_all('catalogue_since', since=since or '1970-01-01', length=preview_length)
+
+    def catalogue_rows(self, ids, preview_length):
+        """Listing metadata of the given inventions, from the primary"""
+        return self.fetch_all('catalogue_rows', ids=list(ids), length=preview_length) if ids else []
+
+    def sitemap_page(self, offset, limit):
+        """Inventions in publication order, for one sitemap shard"""
+        return self.fetch_all('sitemap_page', offset=offset, limit=limit)
+
+    def get_feed(self, name):
+        return self.fetch_one('get_feed', feed_name=name)
+
+    def feed_etag(self, name):
+        row = self.fetch_one('feed_etag', feed_name=name)
+        return row['etag'] if row else None
+
+    def save_feed(self, name, content_type, body, etag, updated_at):
+        self.execute('save_feed', feed_name=name, content_type=content_type, body=body, etag=etag, updated_at=updated_at)
+
+    def lock_feeds(self):
+        """Wait until no other transaction is rebuilding feeds; held until this one ends"""
+        self.fetch_one('lock_feeds')
+
+    # --- statistics ----------------------------------------------------
+
+    def get_stats(self):
+        """Get overall statistics"""
+        total = self.fetch_one('count_total')['total']
+        by_domain = {row['domain_key']: row['count'] for row in self.fetch_all('counts_per_domain')}
+        return {
+            'total_inventions': total,
+            'domains_active': len(by_domain),
+            'by_domain': by_domain
+        }
+
+
+_repository = None
+_repository_lock = threading.Lock()
+_save_listeners = []
+
+
+def on_save(listener):
+    """Call listener(repository, rows, previous) after inventions are saved in this process
+
+    previous are the stored versions (invention_id, title, content) of re-saved rows.
+    """
+    if listener not in _save_listeners:
+        _save_listeners.append(listener)
+    return listener
+
+
+def get_repository():
+    """The repository for this process: PostgreSQL when DATABASE_URL is set, else SQLite"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            if os.getenv('DATABASE_URL'):
+                # Use PostgreSQL (production/Heroku)
+                print("📊 Using PostgreSQL database")
+                from database import PostgresRepository, DATABASE_REPLICA_URLS
+                _repository = PostgresRepository(os.getenv('DATABASE_URL'), DATABASE_REPLICA_URLS)
+            else:
+                # Use SQLite (local development fallback)
+                print("📊 Using SQLite database (local development only)")
+                print("⚠️  Warning: SQLite will NOT work on Heroku!")
+                print("   For Heroku deployment, you must set DATABASE_URL")
+                print("   See DATABASE_SETUP.md for instructions\n")
+                from database_sqlite import SQLiteRepository, DB_PATH
+                _repository = SQLiteRepository(DB_PATH)
+
+            # Feeds and sitemaps are rebuilt incrementally whenever this process saves
+            import feeds
+            import search_cache
+            on_save(feeds.update_feeds)
+            on_save(search_cache.cache.invalidate)
+    return _repository
+
+
+def init_db():
+    """Create tables and indexes (run once per deploy, not on every boot)"""
+    return get_repository().init_db()
+
+
+def pin_primary(pinned=True):
+    return get_repository().pin_primary(pinned)
+
+
+def save_invention(invention_id, domain_key, domain_name, title, content, hash_value):
+    return get_repository().save_invention(invention_id, domain_key, domain_name, title, content, hash_value)
+
+
+def save_many(rows):
+    return get_repository().save_many(rows)
+
+
+def get_invention(domain_key, invention_id):
+    return get_repository().get_invention(domain_key, invention_id)
+
+
+def get_many(ids):
+    return get_repository().get_many(ids)
+
+
+def get_inventions_by_domain(domain_key, limit=None):
+    return get_repository().get_inventions_by_domain(domain_key, limit)
+
+
+def get_all_inventions(limit=100):
+    return get_repository().get_all_inventions(limit)
+
+
+def search_inventions(query, **filters):
+    return get_repository().search_inventions(query, **filters)
+
+
+def count_inventions_by_domain(domain_key):
+    return get_repository().count_inventions_by_domain(domain_key)
+
+
+def get_stats():
+    return get_repository().get_stats()
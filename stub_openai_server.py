@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# stub_openai_server.py
+# Local stand-in for the OpenAI files, batches and (streaming) chat endpoints (no API key or spend)
+#
+# Usage:
+#   python stub_openai_server.py --port 8765
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python generate.py --batch --per-domain 2
+
+import json
+import time
+import uuid
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_CONTENT = """TITLE: Stub Invention {n} for {label}
+
+ABSTRACT: A placeholder disclosure produced by the local stub server so the pipeline can be exercised without calling a real model.
+
+DETAILED DESCRIPTION: The stub returns fixed text with every section present.
+
+CLAIMS:
+1. A stub claim.
+
+ENABLEMENT: Run the stub server and point OPENAI_BASE_URL at it.
+"""
+
+
+class StubState:
+    """In-memory files and batches"""
+
+    def __init__(self, polls_until_complete=1, fail_every=0, chunk_delay=0.0):
+        self.polls_until_complete = polls_until_complete
+        self.fail_every = fail_every
+        self.chunk_delay = chunk_delay
+        self.files = {}
+        self.batches = {}
+        self.completions = 0
+        self.lock = threading.Lock()
+
+    def add_file(self, data, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        self.files[file_id] = {
+            'id': file_id,
+            'object': 'file',
+            'bytes': len(data),
+            'created_at': int(time.time()),
+            'filename': filename,
+            'purpose': purpose,
+            'status': 'processed',
+            'data': data,
+        }
+        return self.files[file_id]
+
+    def complete_batch(self, batch):
+        """Produce output and error files for a batch"""
+        lines = self.files[batch['input_file_id']]['data'].decode().splitlines()
+        output, errors = [], []
+        for n, line in enumerate(filter(None, lines), 1):
+            item = json.loads(line)
+            if self.fail_every and n % self.fail_every == 0:
+                errors.append({
+                    'id': f"batch_req_{n}",
+                    'custom_id': item['custom_id'],
+                    'response': {'status_code': 500, 'body': {'error': {'message': 'stub failure'}}},
+                    'error': None,
+                })
+                continue
+            output.append({
+                'id': f"batch_req_{n}",
+                'custom_id': item['custom_id'],
+                'response': {'status_code': 200, 'request_id': uuid.uuid4().hex, 'body': chat_completion(
+                    STUB_CONTENT.format(n=n, label=item['custom_id']), item['body'].get('model', 'stub'))},
+                'error': None,
+            })
+
+        batch['output_file_id'] = self.add_file(
+            ''.join(json.dumps(o) + '\n' for o in output).encode(), 'output.jsonl', 'batch_output')['id']
+        if errors:
+            batch['error_file_id'] = self.add_file(
+                ''.join(json.dumps(e) + '\n' for e in errors).encode(), 'errors.jsonl', 'batch_output')['id']
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
+        batch['request_counts'] = {'total': len(output) + len(errors), 'completed': len(output), 'failed': len(errors)}
+
+
+def chat_completion(content, model):
+    """A chat.completion response body"""
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop',
+        }],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+    }
+
+
+def chat_completion_chunk(text, model):
+    """A chat.completion.chunk stream event carrying some text"""
+    return {
+        'id': 'chatcmpl-stub',
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'delta': {'content': text}, 'finish_reason': None}],
+    }
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_stream(self, content, model):
+            """Send a completion as chat.completion.chunk server-sent events, a few words at a time"""
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            words = content.split(' ')
+            pieces = [' '.join(words[i:i + 3]) + (' ' if i + 3 < len(words) else '') for i in range(0, len(words), 3)]
+            for piece in pieces:
+                chunk = chat_completion_chunk(piece, model)
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(state.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def _read_body(self):
+            return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        def do_POST(self):
+            body = self._read_body()
+            with state.lock:
+                if self.path == '/v1/files':
+                    # Parse the multipart upload with the stdlib email parser
+                    message = BytesParser(policy=default_policy).parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+                    fields = {part.get_param('name', header='content-disposition'): part for part in message.iter_parts()}
+                    upload = fields['file']
+                    record = state.add_file(upload.get_payload(decode=True), upload.get_filename(),
+                                            fields['purpose'].get_content().strip())
+                    return self._send_json({k: v for k, v in record.items() if k != 'data'})
+
+                if self.path == '/v1/batches':
+                    params = json.loads(body)
+                    batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+                    state.batches[batch_id] = {
+                        'id': batch_id,
+                        'object': 'batch',
+                        'endpoint': params['endpoint'],
+                        'input_file_id': params['input_file_id'],
+                        'completion_window': params['completion_window'],
+                        'metadata': params.get('metadata'),
+                        'status': 'in_progress',
+                        'created_at': int(time.time()),
+                        'output_file_id': None,
+                        'error_file_id': None,
+                        'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+                        'polls': 0,
+                    }
+                    return self._send_json(state.batches[batch_id])
+
+                if self.path == '/v1/chat/completions':
+                    params = json.loads(body)
+                    state.completions += 1
+                    content = STUB_CONTENT.format(n=state.completions, label='chat')
+                    if not params.get('stream'):
+                        return self._send_json(chat_completion(content, params.get('model', 'stub')))
+
+            if self.path == '/v1/chat/completions':
+                # Streamed outside the lock so slow streams don't block other requests
+                return self._send_stream(content, params.get('model', 'stub'))
+
+            self._send_json({'error': {'message': f'Unknown path {self.path}'}}, 404)
+
+        def do_GET(self):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            with state.lock:
+                if parts[:2] == ['v1', 'batches'] and len(parts) == 2:
+                    # Newest first, like the real list endpoint (a single page is enough here)
+                    return self._send_json({'object': 'list', 'data': list(reversed(state.batches.values())),
+                                            'has_more': False})
+
+                if parts[:2] == ['v1', 'batches'] and len(parts) == 3 and parts[2] in state.batches:
+                    batch = state.batches[parts[2]]
+                    batch['polls'] += 1
+                    if batch['status'] == 'in_progress' and batch['polls'] >= state.polls_until_complete:
+                        state.complete_batch(batch)
+                    return self._send_json(batch)
+
+                if parts[:2] == ['v1', 'files'] and len(parts) == 4 and parts[3] == 'content' and parts[2] in state.files:
+                    data = state.files[parts[2]]['data']
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/octet-stream')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+
+            self._send_json({'error': {'message': f'Unknown path {self.path}'}}, 404)
+
+        def log_message(self, format, *args):
+            print(f"🧪 stub: {format % args}")
+
+    return Handler
+
+
+def serve(host='127.0.0.1', port=8765, polls_until_complete=1, fail_every=0, chunk_delay=0.0):
+    """Run the stub server until interrupted"""
+    state = StubState(polls_until_complete, fail_every, chunk_delay)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    print(f"🧪 Stub OpenAI server on http://{host}:{port}/v1")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the OpenAI batch API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--polls', type=int, default=1, help='status polls before a batch completes')
+    parser.add_argument('--fail-every', type=int, default=0, help='make every Nth request in a batch fail')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='seconds between streamed chunks')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.polls, args.fail_every, args.chunk_delay)
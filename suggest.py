@@ -0,0 +1,216 @@
+# suggest.py
+# Type-ahead suggestions for /api/suggest: invention titles and frequent technical terms by prefix
+#
+# Two prefix indexes are kept per web process, each a sorted run of UTF-8 keys in one
+# buffer with typed arrays for offsets, order and weights, so a lookup is a binary search
+# followed by a short forward scan. Titles are keyed from every word on, so "panel" finds
+# "Solar Panel Array", and weighted by publication time (newest first). Terms come from
+# the search_terms vocabulary (see search_index.py), weighted by how many inventions use
+# them, and complete the last word of the query.
+#
+# The index loads on first use. Saves in this process add their terms at once and their
+# titles on the next lookup; titles saved elsewhere arrive by polling like catalogue.py,
+# and the terms are reloaded every SUGGEST_TERMS_RELOAD seconds.
+
+import os
+import time
+import bisect
+import threading
+from array import array
+import storage
+from catalogue import to_seconds
+from search_cache import normalize
+from search_index import term_counts
+
+SUGGEST_LIMIT = int(os.getenv('SUGGEST_LIMIT', '8'))  # titles and terms per response
+SUGGEST_TERMS = int(os.getenv('SUGGEST_TERMS', '20000'))  # most frequent terms kept
+SUGGEST_TERMS_RELOAD = float(os.getenv('SUGGEST_TERMS_RELOAD', '600'))  # seconds
+SUGGEST_POLL_SECONDS = float(os.getenv('SUGGEST_POLL_SECONDS', '5'))
+
+MIN_PREFIX = 2
+KEY_LENGTH = 48  # bytes of a title key kept; longer prefixes are checked against the title
+SCAN_LIMIT = 500  # keys examined per lookup, so short prefixes stay fast
+BULK_SORT = 256  # batches larger than this re-sort the index
+
+
+class PrefixIndex:
+    """Sorted byte-string keys, each with an integer value and a weight"""
+
+    __slots__ = ('text', 'offsets', 'order', 'values', 'weights')
+
+    def __init__(self):
+        self.text = bytearray()
+        self.offsets = array('Q', [0])  # key of entry i is text[offsets[i]:offsets[i + 1]]
+        self.order = array('I')         # entries sorted by key
+        self.values = array('I')
+        self.weights = array('d')
+
+    def __len__(self):
+        return len(self.values)
+
+    def key(self, entry):
+        return bytes(self.text[self.offsets[entry]:self.offsets[entry + 1]])
+
+    def add_many(self, items):
+        """Add (key, value, weight) items; a large batch is sorted once instead of inserted"""
+        first = len(self.values)
+        for key, value, weight in items:
+            self.text += key.encode('utf-8')
+            self.offsets.append(len(self.text))
+            self.values.append(value)
+            self.weights.append(weight)
+        added = range(first, len(self.values))
+        if len(added) > BULK_SORT:
+            self.order = array('I', sorted(range(len(self.values)), key=self.key))
+        else:
+            for entry in added:
+                self.order.insert(bisect.bisect_right(self.order, self.key(entry), key=self.key), entry)
+
+    def find(self, key):
+        """The entry whose key is exactly key, or None"""
+        key = key.encode('utf-8')
+        i = bisect.bisect_left(self.order, key, key=self.key)
+        if i < len(self.order) and self.key(self.order[i]) == key:
+            return self.order[i]
+        return None
+
+    def matches(self, prefix):
+        """Entries whose key starts with prefix, in key order, at most SCAN_LIMIT"""
+        prefix = prefix.encode('utf-8')
+        i = bisect.bisect_left(self.order, prefix, key=self.key)
+        found = []
+        while i < len(self.order) and len(found) < SCAN_LIMIT:
+            entry = self.order[i]
+            if not self.key(entry).startswith(prefix):
+                break
+            found.append(entry)
+            i += 1
+        return found
+
+
+class Suggester:
+    """Title and term indexes for one process"""
+
+    def __init__(self):
+        self.titles = PrefixIndex()  # title suffixes -> invention number, weighted by created_at
+        self.terms = PrefixIndex()   # term -> 0, weighted by documents
+        self.inventions = []         # invention number -> (invention_id, domain_key, title)
+        self.newest = None
+        self.newest_ids = set()      # ids at the newest created_at, already indexed
+        self.checked_at = 0
+        self.terms_loaded_at = 0
+        self._lock = threading.Lock()
+
+    # --- loading -------------------------------------------------------
+
+    def refresh(self, force=False):
+        """Add titles saved since the last poll, and reload the terms when due"""
+        now = time.monotonic()
+        repository = storage.get_repository()
+        if force or now - self.terms_loaded_at >= SUGGEST_TERMS_RELOAD:
+            self.terms_loaded_at = now
+            terms = PrefixIndex()
+            terms.add_many((row['term'], 0, row['documents']) for row in repository.frequent_terms(SUGGEST_TERMS))
+            self.terms = terms
+        if force or now - self.checked_at >= SUGGEST_POLL_SECONDS:
+            self.checked_at = now
+            rows = repository.catalogue_since(self.newest, 0)
+            with self._lock:
+                self.titles.add_many(self._title_keys(rows))
+
+    def _title_keys(self, rows):
+        """(key, invention number, created_at) for each word-initial tail of the new rows' titles"""
+        for row in rows:
+            seconds = to_seconds(row['created_at'])
+            if self.newest is not None:
+                newest = to_seconds(self.newest)
+                if seconds < newest or (seconds == newest and row['invention_id'] in self.newest_ids):
+                    continue
+                if seconds > newest:
+                    self.newest_ids = set()
+            self.newest = row['created_at']
+            self.newest_ids.add(row['invention_id'])
+
+            number = len(self.inventions)
+            title = row['title'] or ''
+            self.inventions.append((row['invention_id'], row['domain_key'], title))
+            words = normalize(title).split(' ')
+            for i, word in enumerate(words):
+                # Skip tails starting at "a", "of", "in"...
+                if i == 0 or len(word) >= 3:
+                    key = ' '.join(words[i:]).encode('utf-8')[:KEY_LENGTH].decode('utf-8', 'ignore')
+                    if len(key) >= MIN_PREFIX:
+                        yield key, number, seconds
+
+    def on_save(self, repository, rows, previous=()):
+        """Save listener: index the saved rows' terms now and their titles on the next read
+
+        Re-saved rows replace their previous versions' terms, as in search_terms.
+        """
+        counts = term_counts(rows)
+        counts.subtract(term_counts(previous))
+        with self._lock:
+            for term, documents in counts.items():
+                if not documents:
+                    continue
+                entry = self.terms.find(term)
+                if entry is None:
+                    if documents > 0:
+                        self.terms.add_many([(term, 0, documents)])
+                else:
+                    self.terms.weights[entry] += documents
+        self.checked_at = 0
+
+    # --- reading -------------------------------------------------------
+
+    def suggest(self, query, limit=SUGGEST_LIMIT):
+        """{'titles': [...], 'terms': [...]} for a partly typed query"""
+        query = normalize(query)
+        if len(query) < MIN_PREFIX:
+            return {'titles': [], 'terms': []}
+
+        with self._lock:
+            return {'titles': self._titles(query, limit), 'terms': self._terms(query, limit)}
+
+    def _titles(self, query, limit):
+        key = query.encode('utf-8')[:KEY_LENGTH].decode('utf-8', 'ignore')
+        best = {}
+        for entry in self.titles.matches(key):
+            number = self.titles.values[entry]
+            if number in best:
+                continue
+            title = self.inventions[number][2].lower()
+            if len(key) < len(query) and query not in normalize(title):
+                continue
+            # Titles starting with the query first, then the newest
+            best[number] = (title.startswith(query), self.titles.weights[entry])
+        ranked = sorted(best, key=best.get, reverse=True)[:limit]
+        return [dict(zip(('invention_id', 'domain_key', 'title'), self.inventions[n])) for n in ranked]
+
+    def _terms(self, query, limit):
+        head, _, word = query.rpartition(' ')
+        if len(word) < MIN_PREFIX:
+            return []
+        # Terms no invention uses any more stay in the index until the next reload
+        entries = [entry for entry in self.terms.matches(word) if self.terms.weights[entry] > 0]
+        entries.sort(key=lambda entry: -self.terms.weights[entry])
+        prefix = f"{head} " if head else ''
+        return [prefix + self.terms.key(entry).decode('utf-8') for entry in entries[:limit]]
+
+
+_suggester = None
+_load_lock = threading.Lock()
+
+
+def get_suggester():
+    """This process's suggestion index, loaded on first use"""
+    global _suggester
+    if _suggester is None:
+        with _load_lock:
+            if _suggester is None:
+                suggester = Suggester()
+                suggester.refresh(force=True)
+                storage.on_save(suggester.on_save)
+                _suggester = suggester
+    _suggester.refresh()
+    return _suggester
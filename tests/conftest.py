@@ -0,0 +1,37 @@
+# tests/conftest.py
+# Shared fixtures: the repository root on sys.path, the stub OpenAI server and a temporary SQLite repository
+
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def stub_server():
+    """Start stub_openai_server.py on a free port; yields (base URL, StubState)"""
+    from stub_openai_server import StubState, make_handler
+
+    state = StubState(polls_until_complete=2, fail_every=3)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1", state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch):
+    """A fresh SQLite repository installed as this process's repository"""
+    import storage
+    from database_sqlite import SQLiteRepository
+
+    repo = SQLiteRepository(str(tmp_path / 'inventions.db'))
+    repo.init_db()
+    monkeypatch.setattr(storage, '_repository', repo)
+    yield repo
+    repo.reset_connection()
@@ -0,0 +1,131 @@
+# tests/test_admission.py
+# Token buckets shared through the admission SQLite file, generation slots and client addresses
+
+import types
+import threading
+import pytest
+from flask import Flask
+import admission
+from admission import AdmissionStore, Slots, parse_limit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable time.time() for the bucket refill maths"""
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(admission, 'time', types.SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_parse_limit():
+    assert parse_limit('5/300') == (5.0, 5.0 / 300)
+
+
+def test_bucket_allows_a_burst_then_waits_for_a_refill(tmp_path, clock):
+    store = AdmissionStore(str(tmp_path))
+    capacity, rate = parse_limit('3/60')
+    assert [store.take('search:1.2.3.4', capacity, rate) for _ in range(3)] == [0, 0, 0]
+
+    wait = store.take('search:1.2.3.4', capacity, rate)
+    assert wait == pytest.approx(20.0)
+
+    clock.value += 20
+    assert store.take('search:1.2.3.4', capacity, rate) == 0
+    assert store.take('search:1.2.3.4', capacity, rate) > 0
+
+
+def test_refill_stops_at_capacity(tmp_path, clock):
+    store = AdmissionStore(str(tmp_path))
+    store.take('k', 2, 1.0)
+    clock.value += 3600
+    assert [store.take('k', 2, 1.0) for _ in range(2)] == [0, 0]
+    assert store.take('k', 2, 1.0) > 0
+
+
+def test_buckets_are_per_key(tmp_path, clock):
+    store = AdmissionStore(str(tmp_path))
+    assert store.take('generate:a', 1, 0.01) == 0
+    assert store.take('generate:a', 1, 0.01) > 0
+    assert store.take('generate:b', 1, 0.01) == 0
+    assert store.active_buckets() == 2
+
+
+def test_workers_share_buckets_through_the_file(tmp_path, clock):
+    first, second = AdmissionStore(str(tmp_path)), AdmissionStore(str(tmp_path))
+    assert first.take('generate:a', 1, 0.01) == 0
+    assert second.take('generate:a', 1, 0.01) > 0
+
+
+def test_shed_counts(tmp_path):
+    store = AdmissionStore(str(tmp_path))
+    store.record_shed('generate', 'rate')
+    store.record_shed('generate', 'rate')
+    store.record_shed('generate', 'capacity')
+    assert store.shed_counts() == {'generate:capacity': 1, 'generate:rate': 2}
+
+
+def test_slots_cap_holders_until_released(tmp_path):
+    slots = Slots('generation', 2, str(tmp_path))
+    held = [slots.acquire(), slots.acquire()]
+    assert all(held)
+    assert slots.acquire() is None
+    assert slots.in_use() == 2
+
+    held.pop().close()
+    assert slots.in_use() == 1
+    held.append(slots.acquire())
+    assert held[-1] is not None
+    for slot in held:
+        slot.close()
+
+
+@pytest.mark.parametrize('trusted, expected', [(0, '10.0.0.9'), (1, '5.6.7.8'), (2, '1.2.3.4'), (3, '10.0.0.9')])
+def test_client_ip_skips_trusted_proxies(monkeypatch, trusted, expected):
+    monkeypatch.setattr(admission, 'TRUSTED_PROXIES', trusted)
+    app = Flask(__name__)
+    with app.test_request_context('/', headers={'X-Forwarded-For': '1.2.3.4, 5.6.7.8'},
+                                  environ_base={'REMOTE_ADDR': '10.0.0.9'}):
+        assert admission.client_ip() == expected
+
+
+def test_counting_slots_never_blocks_an_acquire(tmp_path):
+    slots = Slots('generation', 1, str(tmp_path))
+    assert slots.in_use() == 0
+    slot = slots.acquire()
+    assert slots.in_use() == 1
+    slot.close()
+
+    # An acquire during a probe waits for it instead of finding the slot taken
+    probe = open(slots.path(0, 'busy'))
+    admission.fcntl.flock(probe, admission.fcntl.LOCK_SH | admission.fcntl.LOCK_NB)
+    threading.Timer(0.05, probe.close).start()
+    slot = slots.acquire()
+    assert slot is not None
+    slot.close()
+
+
+def limited_app(monkeypatch, tmp_path, slots):
+    monkeypatch.setattr(admission, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(admission, 'RATE_LIMITS', {'generate': '1/3600'})
+    monkeypatch.setattr(admission, 'store', AdmissionStore(str(tmp_path)))
+    app = Flask(__name__)
+
+    @app.route('/generate')
+    @admission.limit('generate', slots=slots)
+    def generate():
+        return 'ok'
+
+    return app.test_client()
+
+
+def test_a_busy_machine_keeps_the_clients_token(tmp_path, monkeypatch):
+    slots = Slots('generation', 1, str(tmp_path))
+    client = limited_app(monkeypatch, tmp_path, slots)
+
+    held = slots.acquire()
+    assert client.get('/generate').status_code == 503
+    held.close()
+    assert client.get('/generate').status_code == 200
+    assert client.get('/generate').status_code == 429
+    # The slot taken for the refused request was given back
+    assert slots.in_use() == 0
@@ -0,0 +1,128 @@
+# tests/test_batch.py
+# Batch backfills end to end against the stub server, and batch result parsing
+
+import json
+import pytest
+import batch
+import providers
+from domains import DOMAINS
+from stub_openai_server import STUB_CONTENT
+
+
+@pytest.fixture
+def openai_stub(stub_server, tmp_path, monkeypatch):
+    """Point the OpenAI client at the stub and keep batch files in a temp directory"""
+    url, state = stub_server
+    monkeypatch.setenv('OPENAI_API_KEY', 'stub')
+    monkeypatch.setenv('OPENAI_BASE_URL', url)
+    monkeypatch.setattr(providers, '_clients', {})
+    monkeypatch.setattr(batch, 'BATCH_POLL_INTERVAL', 0)
+    monkeypatch.chdir(tmp_path)
+    return state
+
+
+def test_backfill_saves_results_and_records_failures(openai_stub, repository):
+    domain_keys = list(DOMAINS)[:2]
+    state = batch.run_backfill(per_domain=3, domain_keys=domain_keys, resume=False)
+
+    # Every third request of six fails in the stub
+    assert state['status'] == 'done'
+    assert len(state['saved']) == 4
+    assert set(state['failed'].values()) == {500}
+    assert set(state['saved']) | set(state['failed']) == {f"{key}:{n}" for key in domain_keys for n in range(3)}
+
+    assert repository.get_stats()['total_inventions'] == 4
+    for custom_id, invention_id in state['saved'].items():
+        invention = repository.get_invention(custom_id.split(':')[0], invention_id)
+        assert invention['title'].startswith('Stub Invention')
+    assert batch.load_state() == state
+
+
+def test_processing_again_saves_nothing_twice(openai_stub, repository):
+    state = batch.run_backfill(per_domain=2, domain_keys=list(DOMAINS)[:1], resume=False)
+    saved = dict(state['saved'])
+
+    state = batch.process_results(state)
+    assert state['saved'] == saved
+    assert repository.get_stats()['total_inventions'] == len(saved)
+
+
+def test_stub_batch_needs_polls_before_completing(openai_stub):
+    state = batch.submit(batch.start_backfill(1, list(DOMAINS)[:1]))
+    batch_id = state['batch_id']
+    assert openai_stub.batches[batch_id]['status'] == 'in_progress'
+
+    state = batch.wait_for_batch(state)
+    assert state['status'] == 'completed'
+    assert openai_stub.batches[batch_id]['polls'] == openai_stub.polls_until_complete
+    assert state['output_file_id'] in openai_stub.files
+
+
+def test_build_requests_one_line_per_prompt():
+    lines = batch.build_requests(2, list(DOMAINS)[:3])
+    assert [line['custom_id'] for line in lines][:2] == [f"{list(DOMAINS)[0]}:0", f"{list(DOMAINS)[0]}:1"]
+    assert len(lines) == 6
+    assert all(line['url'] == batch.BATCH_ENDPOINT for line in lines)
+
+
+def test_read_results_streams_lines_and_skips_blanks(tmp_path):
+    first, second = tmp_path / 'output.jsonl', tmp_path / 'errors.jsonl'
+    first.write_text(json.dumps({'custom_id': 'a:0'}) + '\n\n' + json.dumps({'custom_id': 'a:1'}) + '\n')
+    second.write_text(json.dumps({'custom_id': 'b:0'}) + '\n')
+    assert [r['custom_id'] for r in batch.read_results([str(first), str(second)])] == ['a:0', 'a:1', 'b:0']
+
+
+def test_failed_batch_without_output_is_finished(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state = {'batch_id': 'batch_x', 'status': 'failed', 'output_file_id': None, 'error_file_id': None,
+             'saved': {}, 'failed': {}}
+    state = batch.process_results(state)
+    assert state['status'] == 'done'
+    assert state['batch_status'] == 'failed'
+
+
+def test_crash_after_create_resumes_the_same_batch(openai_stub, repository, monkeypatch):
+    save_state = batch.save_state
+
+    def crash_once_submitted(state, *args):
+        if state['status'] == 'submitted':
+            monkeypatch.setattr(batch, 'save_state', save_state)
+            raise KeyboardInterrupt
+        save_state(state, *args)
+
+    monkeypatch.setattr(batch, 'save_state', crash_once_submitted)
+    with pytest.raises(KeyboardInterrupt):
+        batch.run_backfill(per_domain=1, domain_keys=list(DOMAINS)[:1], resume=False)
+    assert batch.load_state()['status'] == 'submitting'
+
+    state = batch.run_backfill()
+    assert len(openai_stub.batches) == 1
+    assert state['batch_id'] in openai_stub.batches
+    assert len(state['saved']) == 1
+
+
+def test_malformed_results_are_not_saved(tmp_path, monkeypatch, repository):
+    monkeypatch.chdir(tmp_path)
+    domain_key = list(DOMAINS)[0]
+    output = tmp_path / 'batch-output.jsonl'
+    lines = []
+    for n, content in enumerate(['TITLE: Only a title', STUB_CONTENT.format(n=1, label='ok')]):
+        body = {'choices': [{'message': {'content': content}}]}
+        lines.append(json.dumps({'custom_id': f"{domain_key}:{n}", 'response': {'status_code': 200, 'body': body}}))
+    output.write_text('\n'.join(lines) + '\n')
+
+    state = {'batch_id': 'batch_x', 'status': 'completed', 'output_file_id': 'file-x', 'error_file_id': None,
+             'output_path': str(output), 'saved': {}, 'failed': {}}
+    state = batch.process_results(state)
+    assert list(state['saved']) == [f"{domain_key}:1"]
+    assert state['failed'][f"{domain_key}:0"].startswith('malformed: missing ABSTRACT')
+    assert repository.get_stats()['total_inventions'] == 1
+
+
+def test_save_state_replaces_the_file(tmp_path):
+    path = str(tmp_path / 'state.json')
+    batch.save_state({'status': 'built'}, path)
+    batch.save_state({'status': 'submitted'}, path)
+    assert batch.load_state(path) == {'status': 'submitted'}
+    assert not (tmp_path / 'state.json.tmp').exists()
+    assert batch.load_state(str(tmp_path / 'missing.json')) is None
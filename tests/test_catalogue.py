@@ -0,0 +1,73 @@
+# tests/test_catalogue.py
+# The in-process listing catalogue: ordering, per-domain slices, polling and re-saves
+
+import pytest
+import catalogue
+from catalogue import Catalogue
+
+
+def row(n, domain_key='energy', title=None):
+    return dict(invention_id=f'inv-20260101-{n:06d}', domain_key=domain_key, domain_name=domain_key.title(),
+                title=title or f'Invention {n}', content=f'TITLE: Invention {n}\n\nABSTRACT: Number {n}.',
+                hash=f'{n:064d}')
+
+
+def set_created(repository, n, created_at):
+    repository.connection().execute("UPDATE inventions SET created_at = ? WHERE invention_id = ?",
+                                    (created_at, row(n)['invention_id']))
+
+
+@pytest.fixture
+def loaded(repository, monkeypatch):
+    """A catalogue over three saved inventions, as get_catalogue() sets it up"""
+    repository.save_many([row(1), row(2, 'biotechnology'), row(3)])
+    for n, created_at in [(1, '2026-01-01 10:00:00'), (2, '2026-01-02 10:00:00'), (3, '2026-01-03 10:00:00')]:
+        set_created(repository, n, created_at)
+    monkeypatch.setattr(catalogue, '_catalogue', None)
+    monkeypatch.setattr(catalogue.storage, '_save_listeners', [])
+    return catalogue.get_catalogue()
+
+
+def ids(rows):
+    return [r['invention_id'][-1] for r in rows]
+
+
+def test_listings_are_newest_first(loaded):
+    assert ids(loaded.recent(10)) == ['3', '2', '1']
+    assert ids(loaded.recent(2)) == ['3', '2']
+    assert ids(loaded.domain('energy')) == ['3', '1']
+    assert loaded.domain('unknown') == []
+    assert loaded.stats() == {'total_inventions': 3, 'domains_active': 2,
+                              'by_domain': {'energy': 2, 'biotechnology': 1}}
+
+
+def test_rows_match_storage(loaded, repository):
+    held = loaded.domain('energy', limit=1)[0]
+    stored = repository.get_inventions_by_domain('energy', 1)[0]
+    for column in ('invention_id', 'domain_key', 'domain_name', 'title', 'preview', 'date'):
+        assert held[column] == stored[column], column
+
+
+def test_rows_saved_elsewhere_arrive_by_polling(loaded, repository, monkeypatch):
+    repository.save_many([row(4)])
+    set_created(repository, 4, '2026-01-04 10:00:00')
+    monkeypatch.setattr(catalogue, 'CATALOGUE_POLL_SECONDS', 0)
+    loaded.refresh()
+    assert ids(loaded.recent(1)) == ['4']
+    # Polling from the newest row again doesn't duplicate it
+    loaded.refresh()
+    assert len(loaded) == 4
+
+
+def test_resaved_title_shows_at_once(loaded, repository):
+    # The save listener get_catalogue() registered takes it in
+    repository.save_many([row(1, title='Renamed Gasket')])
+    assert [r['title'] for r in loaded.domain('energy')] == ['Invention 3', 'Renamed Gasket']
+    assert len(loaded) == 3
+
+
+def test_memory_is_a_few_hundred_bytes_per_invention():
+    held = Catalogue()
+    for n in range(1000):
+        held.add(dict(row(n), preview='x' * 300, created_at=f'2026-01-01 00:{n // 60 % 60:02d}:{n % 60:02d}'))
+    assert 300 < held.memory_bytes() / len(held) < 450
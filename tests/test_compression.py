@@ -0,0 +1,67 @@
+# tests/test_compression.py
+# zstd content compression: codec round trips, dictionary training and recompression
+
+import random
+import pytest
+from compression import ContentCodec, train_dictionary, NO_DICTIONARY
+
+
+def documents(count, seed=7):
+    rng = random.Random(seed)
+    words = ['graphene', 'lattice', 'actuator', 'membrane', 'polymer', 'catalyst', 'substrate', 'coil']
+    return [f"TITLE: {rng.choice(words).title()} {n}\n\nABSTRACT: " + ' '.join(rng.choices(words, k=400))
+            for n in range(count)]
+
+
+def row(n, content):
+    return dict(invention_id=f"inv-20260101-{n:06d}", domain_key='energy', domain_name='Energy',
+                title=content.split('\n')[0][7:], content=content, hash=f"{n:064d}")
+
+
+def stored_codecs(repository):
+    return {r['invention_id']: r['content_codec'] for r in
+            repository.connection().execute("SELECT invention_id, content_codec FROM inventions")}
+
+
+def test_codec_round_trip_without_a_dictionary():
+    codec = ContentCodec(dict)
+    version, blob = codec.compress('ünïcode text ' * 50)
+    assert version == NO_DICTIONARY
+    assert len(blob) < len('ünïcode text ' * 50)
+    assert codec.decompress(version, blob) == 'ünïcode text ' * 50
+
+
+def test_training_needs_enough_samples():
+    with pytest.raises(ValueError):
+        train_dictionary(documents(3))
+
+
+def test_rows_are_stored_compressed_and_read_back(repository):
+    texts = documents(3)
+    repository.save_many([row(n, text) for n, text in enumerate(texts)])
+    assert set(stored_codecs(repository).values()) == {NO_DICTIONARY}
+    assert repository.get_invention('energy', row(1, texts[1])['invention_id'])['content'] == texts[1]
+
+
+def test_new_dictionary_applies_to_new_rows_and_old_rows_stay_readable(repository):
+    texts = documents(40)
+    repository.save_many([row(0, texts[0])])
+    version = repository.add_dictionary(train_dictionary(texts, size=4096))
+    repository.save_many([row(1, texts[1])])
+
+    codecs = stored_codecs(repository)
+    assert codecs[row(0, '')['invention_id']] == NO_DICTIONARY
+    assert codecs[row(1, '')['invention_id']] == version
+    for n in (0, 1):
+        assert repository.get_invention('energy', row(n, '')['invention_id'])['content'] == texts[n]
+
+
+def test_recompress_rewrites_every_row_and_keeps_search(repository):
+    texts = documents(20)
+    repository.save_many([row(n, text) for n, text in enumerate(texts)])
+    version = repository.add_dictionary(train_dictionary(texts, size=4096))
+
+    assert repository.recompress_all(batch_size=7) == 20
+    assert set(stored_codecs(repository).values()) == {version}
+    assert [r['content'] for r in repository.iter_contents(page_size=6)] == texts
+    assert repository.search_inventions('Graphene')['total'] == sum('graphene' in t.lower() for t in texts)
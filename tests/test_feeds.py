@@ -0,0 +1,98 @@
+# tests/test_feeds.py
+# Incremental feed and sitemap rebuilds: appends, re-renders and the rebuild transaction
+
+import pytest
+import feeds
+
+# The real renderer, kept before the fixture wraps it
+render = feeds.build
+
+
+@pytest.fixture
+def built(monkeypatch):
+    """Small shards, and the names of documents rendered from scratch"""
+    monkeypatch.setattr(feeds, 'SITEMAP_SHARD_SIZE', 5)
+    monkeypatch.setattr(feeds, 'cache', feeds.FeedCache())
+    names = []
+
+    def recording(repository, name):
+        names.append(name)
+        return render(repository, name)
+
+    monkeypatch.setattr(feeds, 'build', recording)
+    return names
+
+
+def row(n, domain_key='energy'):
+    return dict(invention_id=f'inv-20260101-{n:06d}', domain_key=domain_key, domain_name='Energy',
+                title=f'Invention {n}', content=f'TITLE: Invention {n}', hash=f'{n:064d}')
+
+
+def save(repository, rows):
+    repository.save_many(rows)
+    feeds.update_feeds(repository, rows)
+
+
+def assert_current(repository):
+    """Every stored sitemap matches a render from scratch"""
+    shards = max(1, -(-repository.get_stats()['total_inventions'] // feeds.SITEMAP_SHARD_SIZE))
+    for name in ['sitemap.xml'] + [feeds.shard_name(n) for n in range(1, shards + 1)]:
+        assert repository.get_feed(name)['body'] == render(repository, name)[1], name
+
+
+def test_new_inventions_are_appended_to_the_last_shard(repository, built):
+    saved = 0
+    for size in [1, 1, 2, 3, 1, 4]:
+        save(repository, [row(saved + k) for k in range(size)])
+        saved += size
+        assert_current(repository)
+
+    built.clear()
+    save(repository, [row(saved)])
+    assert not [name for name in built if name.startswith('sitemaps/')]
+    assert_current(repository)
+
+
+def test_resave_leaves_the_sitemaps_alone(repository, built):
+    save(repository, [row(n) for n in range(3)])
+    built.clear()
+    save(repository, [dict(row(1), title='Renamed')])
+    assert not [name for name in built if 'sitemap' in name]
+    assert_current(repository)
+
+
+def test_an_invention_sorting_before_published_ones_rerenders_the_shard(repository, built):
+    save(repository, [row(n) for n in range(2, 5)])
+    built.clear()
+    repository.save_many([row(1)])
+    repository.connection().execute("UPDATE inventions SET created_at = '2026-01-01 00:00:00' WHERE invention_id = ?",
+                                    (row(1)['invention_id'],))
+    feeds.update_feeds(repository, [row(1)])
+    assert feeds.shard_name(1) in built
+    assert_current(repository)
+
+
+def test_a_new_shard_is_listed_in_the_index(repository, built):
+    save(repository, [row(n) for n in range(5)])
+    built.clear()
+    save(repository, [row(5)])
+    assert 'sitemap.xml' in built
+    assert feeds.shard_name(2) in repository.get_feed('sitemap.xml')['body']
+    assert_current(repository)
+
+
+def test_a_failed_rebuild_keeps_the_stored_feeds(repository, built, monkeypatch):
+    save(repository, [row(0)])
+    before = repository.get_feed('feed.atom')['body']
+    repository.save_many([row(1)])
+
+    def broken(repository, rows):
+        raise RuntimeError('render failure')
+
+    monkeypatch.setattr(feeds, 'update_sitemaps', broken)
+    with pytest.raises(RuntimeError):
+        feeds.update_feeds(repository, [row(1)])
+
+    assert repository.get_feed('feed.atom')['body'] == before
+    assert not feeds.cache.documents
+    assert not repository.in_transaction()
@@ -0,0 +1,101 @@
+# tests/test_generate.py
+# Multi-invention calls against a fake provider router, saved to a temporary SQLite repository
+
+import pytest
+import generate
+import generation_scheduler
+from domains import DOMAINS
+from parsing import INVENTION_START, INVENTION_END
+from tests.test_parsing import VALID
+
+DOMAIN_KEY = list(DOMAINS)[0]
+DOMAIN_NAME = DOMAINS[DOMAIN_KEY]['name']
+
+
+class FakeRouter:
+    """Streams scripted replies; an Exception in the script is raised instead"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.max_tokens = []
+
+    def stream(self, prompt, prefer=None, max_tokens=None):
+        self.max_tokens.append(max_tokens)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        yield from (reply[i:i + 50] for i in range(0, len(reply), 50))
+
+
+def block(n, text):
+    return f"{INVENTION_START.format(n=n)}\n{text}\n{INVENTION_END}\n"
+
+
+@pytest.fixture
+def fake_router(monkeypatch):
+    def install(*replies):
+        router = FakeRouter(replies)
+        monkeypatch.setattr(generate, 'router', router)
+        return router
+    return install
+
+
+def test_saves_every_invention_of_one_call(fake_router, repository):
+    fake_router(block(1, VALID) + block(2, VALID.replace('Gasket', 'Valve')))
+    saved = generate.generate_inventions(DOMAIN_KEY, DOMAIN_NAME, count=2)
+    assert len(saved) == 2
+    titles = {repository.get_invention(DOMAIN_KEY, inv_id)['title'] for inv_id in saved}
+    assert titles == {'Self-Healing Gasket', 'Self-Healing Valve'}
+
+
+def test_cut_off_and_malformed_items_are_regenerated(fake_router, repository, capsys):
+    router = fake_router(
+        block(1, VALID) + block(2, 'TITLE: No body') + INVENTION_START.format(n=3) + '\nTITLE: Cut',
+        VALID, VALID)
+    saved = generate.generate_inventions(DOMAIN_KEY, DOMAIN_NAME, count=3)
+    assert len(saved) == 3
+    assert len(router.max_tokens) == 3
+    output = capsys.readouterr().out
+    assert 'Discarding malformed invention' in output
+    assert 'cut off at the' in output
+
+
+def test_failure_after_saving_reports_the_saved_ids(fake_router, repository):
+    fake_router(block(1, VALID), RuntimeError('provider down'))
+    with pytest.raises(generate.PartialGeneration) as raised:
+        generate.generate_inventions(DOMAIN_KEY, DOMAIN_NAME, count=2)
+    assert len(raised.value.saved) == 1
+    assert repository.get_stats()['total_inventions'] == 1
+
+
+def test_failure_before_saving_raises_the_original_error(fake_router, repository):
+    fake_router(RuntimeError('provider down'))
+    with pytest.raises(RuntimeError, match='provider down'):
+        generate.generate_inventions(DOMAIN_KEY, DOMAIN_NAME, count=2)
+
+
+def test_scheduler_counts_inventions_saved_before_an_error(fake_router, repository):
+    fake_router(block(1, VALID), RuntimeError('provider down'))
+
+    class Jobs:
+        def reschedule_job(self, *args, **kwargs):
+            pass
+
+    class Router:
+        def wait_for_headroom(self):
+            return 0
+
+        def rate_limited_count(self):
+            return 0
+
+        def typical_latency(self):
+            return None
+
+    scheduler = generation_scheduler.GenerationScheduler(
+        Jobs(), count_fn=lambda: {}, router=Router(), cutoff='',
+        generate_fn=lambda key, name: generate.generate_inventions(key, name, count=2))
+    interval = scheduler.rate.interval
+    scheduler.run_slot(0)
+    assert sum(scheduler.balancer.counts.values()) == 1
+    assert sum(scheduler.balancer.in_flight.values()) == 0
+    assert scheduler.rate.interval < interval  # treated as progress, not an error
@@ -0,0 +1,83 @@
+# tests/test_parsing.py
+# Section validation, the multi-invention splitter and the streaming section parser
+
+import pytest
+from parsing import InventionSplitter, SectionParser, validate_invention, INVENTION_START, INVENTION_END
+
+VALID = """TITLE: Self-Healing Gasket
+
+ABSTRACT: A gasket that reseals its own cracks.
+
+**DETAILED DESCRIPTION:** Microcapsules of silicone resin.
+
+CLAIMS:
+1. A gasket with capsules.
+
+ENABLEMENT: Mix, cast and cure."""
+
+
+def delimited(*inventions):
+    return ''.join(f"{INVENTION_START.format(n=n)}\n{text}\n{INVENTION_END}\n" for n, text in enumerate(inventions, 1))
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_valid_invention_has_no_problems():
+    assert validate_invention(VALID) == []
+
+
+def test_missing_empty_and_out_of_order_sections():
+    assert validate_invention("TITLE: Only a title") == [
+        'missing ABSTRACT', 'missing DETAILED DESCRIPTION', 'missing CLAIMS', 'missing ENABLEMENT']
+    assert 'empty CLAIMS' in validate_invention(VALID.replace("1. A gasket with capsules.", ""))
+    title, rest = VALID.split('\n\n', 1)
+    assert validate_invention(rest + '\n\n' + title) == ['sections out of order']
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, 10000])
+def test_splitter_finds_every_invention_whatever_the_chunking(size):
+    text = "Preamble the model should not write\n" + delimited(VALID, VALID.replace('Gasket', 'Valve'))
+    splitter = InventionSplitter()
+    found = [item for chunk in chunked(text, size) for item in splitter.feed(chunk)]
+    completed, unterminated = splitter.close()
+    found += completed
+    assert found == [VALID, VALID.replace('Gasket', 'Valve')]
+    assert unterminated is None
+
+
+def test_splitter_reports_a_cut_off_invention_separately():
+    text = delimited(VALID) + INVENTION_START.format(n=2) + "\nTITLE: Half an invent"
+    splitter = InventionSplitter()
+    found = splitter.feed(text)
+    assert found == [VALID]
+    assert splitter.close() == ([], 'TITLE: Half an invent')
+
+
+def test_start_marker_closes_an_unterminated_invention():
+    text = f"{INVENTION_START.format(n=1)}\n{VALID}\n{INVENTION_START.format(n=2)}\n{VALID}\n{INVENTION_END}\n"
+    splitter = InventionSplitter()
+    assert splitter.feed(text) == [VALID, VALID]
+
+
+def test_end_marker_on_the_last_line_without_newline():
+    splitter = InventionSplitter()
+    splitter.feed(f"{INVENTION_START.format(n=1)}\n{VALID}\n")
+    splitter.feed(INVENTION_END)
+    assert splitter.close() == ([VALID], None)
+
+
+@pytest.mark.parametrize('size', [1, 5, 1000])
+def test_section_parser_reports_headers_as_they_complete(size):
+    parser = SectionParser()
+    headers = [header for chunk in chunked(VALID, size) for header in parser.feed(chunk)]
+    headers += parser.close()
+    assert headers == [
+        ('TITLE', 'Self-Healing Gasket'),
+        ('ABSTRACT', 'A gasket that reseals its own cracks.'),
+        ('DETAILED DESCRIPTION', 'Microcapsules of silicone resin.'),
+        ('CLAIMS', ''),
+        ('ENABLEMENT', 'Mix, cast and cure.'),
+    ]
+    assert parser.current == 'ENABLEMENT'
@@ -0,0 +1,33 @@
+# tests/test_profiling.py
+# Admin token checks and the collapsed-stack round trip
+
+import pytest
+from flask import Flask
+import profiling
+
+
+@pytest.mark.parametrize('headers, query, expected', [
+    ({'X-Admin-Token': 's3cret'}, '', True),
+    ({}, '?token=s3cret', True),
+    ({'X-Admin-Token': 's3cre'}, '', False),
+    ({'X-Admin-Token': 'sécret'}, '', False),
+    ({}, '', False),
+])
+def test_admin_token(monkeypatch, headers, query, expected):
+    monkeypatch.setattr(profiling, 'ADMIN_TOKEN', 's3cret')
+    with Flask(__name__).test_request_context('/' + query, headers=headers):
+        assert profiling.is_admin_request() is expected
+
+
+def test_no_admin_token_configured_refuses_everyone(monkeypatch):
+    monkeypatch.setattr(profiling, 'ADMIN_TOKEN', '')
+    with Flask(__name__).test_request_context('/?token='):
+        assert not profiling.is_admin_request()
+
+
+def test_collapsed_profiles_load_back(tmp_path):
+    path = tmp_path / 'profile.collapsed'
+    path.write_text('main (app.py:1);view (app.py:9) 3\nmain (app.py:1) 1\n')
+    stacks = profiling.load_profile(str(path))
+    assert stacks[('main (app.py:1)', 'view (app.py:9)')] == 3
+    assert profiling.top_frames(stacks)[0] == {'frame': 'view (app.py:9)', 'samples': 3, 'percent': 75.0}
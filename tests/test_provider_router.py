@@ -0,0 +1,84 @@
+# tests/test_provider_router.py
+# ProviderRouter streaming, failover and ranking with fake providers in place of the SDKs
+
+import pytest
+import providers
+from providers import ProviderRouter, ProviderError
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """A router over two configured fake providers; set fakes[name] to a list of chunks or an exception"""
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+    monkeypatch.setattr(providers, 'PROVIDER_EXPLORE_RATE', 0)
+    monkeypatch.setattr(providers, 'PROVIDER_MAX_RETRIES', 0)
+    fakes = {'openai': ['Hello', ' world'], 'anthropic': ['Hi']}
+
+    def fake(name):
+        def call(prompt, max_tokens):
+            if isinstance(fakes[name], Exception):
+                raise fakes[name]
+            return (chunk for chunk in fakes[name]), {}
+        return call
+
+    monkeypatch.setattr(providers, 'PROVIDER_STREAMS', {name: fake(name) for name in fakes})
+    router = ProviderRouter(preferred='openai')
+    router.fakes = fakes
+    return router
+
+
+def test_streams_from_the_preferred_provider(router):
+    assert ''.join(router.stream('prompt')) == 'Hello world'
+    assert router.stats['openai'].requests == 1
+    assert router.breakers['openai'].state == 'closed'
+
+
+def test_fails_over_before_the_first_chunk(router):
+    router.fakes['openai'] = RuntimeError('down')
+    assert ''.join(router.stream('prompt')) == 'Hi'
+    assert router.stats['openai'].failures == 1
+
+
+def test_all_providers_failing_raises(router):
+    router.fakes['openai'] = router.fakes['anthropic'] = RuntimeError('down')
+    with pytest.raises(ProviderError):
+        list(router.stream('prompt'))
+
+
+def test_consumer_leaving_mid_stream_ends_a_half_open_trial(router):
+    breaker = router.breakers['openai']
+    breaker.cooldown = 0
+    breaker.state = 'open'
+
+    stream = router.stream('prompt', prefer='openai')
+    assert next(stream) == 'Hello'
+    assert breaker.state == 'half_open'
+    stream.close()  # the browser disconnected
+
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_consumer_leaving_is_not_counted_as_a_failure(router):
+    stream = router.stream('prompt')
+    next(stream)
+    stream.close()
+    assert router.stats['openai'].failures == 0
+    assert router.breakers['openai'].failures == 0
+
+
+def test_unmeasured_provider_does_not_jump_ahead_of_a_fast_one(router, monkeypatch):
+    monkeypatch.setattr(providers, 'PROVIDER_UNMEASURED_LATENCY', 60)
+    router.stats['openai'].record(True, 5.0)
+    assert router.ordered(prefer='anthropic') == ['openai', 'anthropic']
+
+    # A slow or failing measured provider is overtaken by the untried one
+    slow = ProviderRouter(preferred='openai')
+    slow.stats['openai'].record(True, 120.0)
+    assert slow.ordered() == ['anthropic', 'openai']
+
+
+def test_preference_breaks_ties_between_unmeasured_providers(router):
+    assert router.ordered(prefer='anthropic') == ['anthropic', 'openai']
+    assert router.ordered(prefer='openai') == ['openai', 'anthropic']
@@ -0,0 +1,86 @@
+# tests/test_responses.py
+# Negotiated compression, reused compressed bodies and fingerprinted static files
+
+import gzip
+import pytest
+from flask import Flask, url_for
+import responses
+
+PAGE = '<p>' + 'A perpetual stream of inventions. ' * 100 + '</p>'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(responses, 'cache', responses.CompressedCache())
+    app = Flask(__name__, static_folder=None)
+    responses.init_responses(app)
+    renders = []
+
+    @app.route('/page')
+    def page():
+        return PAGE
+
+    @app.route('/small')
+    def small():
+        return '<p>small</p>'
+
+    @app.route('/feed')
+    def feed():
+        response = app.response_class(PAGE, mimetype='application/xml')
+        response.set_etag('feed-v1')
+        return response
+
+    @app.route('/invention')
+    def invention():
+        return responses.immutable_page('invention-v1', lambda: renders.append(1) or PAGE)
+
+    @app.route('/links')
+    def links():
+        return url_for('static', filename='style.css')
+
+    app.renders = renders
+    return app.test_client()
+
+
+def test_gzip_is_negotiated(client):
+    response = client.get('/page', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data).decode('utf-8') == PAGE
+
+
+def test_uncompressed_without_accept_encoding_or_for_small_bodies(client):
+    assert 'Content-Encoding' not in client.get('/page').headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_strong_etag_bodies_are_compressed_once(client):
+    first = client.get('/feed', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['ETag'] == '"feed-v1-gzip"'
+    assert list(responses.cache.entries) == [('feed-v1', 'gzip')]
+
+    again = client.get('/feed', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"feed-v1-gzip"'})
+    assert again.status_code == 304
+
+
+def test_immutable_page_renders_once_per_encoding(client):
+    for _ in range(3):
+        response = client.get('/invention', headers={'Accept-Encoding': 'gzip'})
+        assert gzip.decompress(response.data).decode('utf-8') == PAGE
+    assert len(client.application.renders) == 1
+    assert client.get('/invention').data.decode('utf-8') == PAGE
+    assert len(client.application.renders) == 2
+
+
+def test_static_files_are_fingerprinted_and_immutable(client):
+    url = client.get('/links').data.decode('utf-8')
+    assert url.startswith('/static/style.') and url != '/static/style.css'
+
+    hashed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert hashed.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in hashed.headers['Cache-Control']
+    assert 'max-age=31536000' in hashed.headers['Cache-Control']
+
+    plain = client.get('/static/style.css')
+    assert 'no-cache' in plain.headers['Cache-Control']
+    assert client.get('/static/missing.css').status_code == 404
@@ -0,0 +1,78 @@
+# tests/test_search.py
+# Faceted search: filters, per-domain and per-month counts, and query-string parsing
+
+import pytest
+from werkzeug.datastructures import MultiDict
+import storage
+from app import month_range, search_filters
+
+SAVED = [
+    ('inv-20260105-000001', 'materials-science', 'Graphene Gasket', '2026-01-05 10:00:00'),
+    ('inv-20260120-000002', 'materials-science', 'Ceramic Bearing', '2026-01-20 10:00:00'),
+    ('inv-20260203-000003', 'chemical-engineering', 'Graphene Catalyst', '2026-02-03 10:00:00'),
+    ('inv-20260301-000004', 'software-algorithms', 'Graphene Simulator', '2026-03-01 10:00:00'),
+]
+
+
+@pytest.fixture
+def corpus(repository):
+    repository.save_many([dict(invention_id=invention_id, domain_key=domain_key, domain_name=domain_key,
+                               title=title, content=f"TITLE: {title}\n\nABSTRACT: Uses graphene-free parts.",
+                               hash=invention_id.ljust(64, '0'))
+                          for invention_id, domain_key, title, _ in SAVED])
+    for invention_id, _, _, created_at in SAVED:
+        repository.connection().execute("UPDATE inventions SET created_at = ? WHERE invention_id = ?",
+                                        (created_at, invention_id))
+    return repository
+
+
+def ids(found):
+    return sorted(row['invention_id'][-1] for row in found['results'])
+
+
+def test_counts_per_domain_and_month(corpus):
+    found = corpus.search_inventions('graphene')
+    assert found['total'] == 4
+    assert found['domains'] == {'materials-science': 2, 'chemical-engineering': 1, 'software-algorithms': 1}
+    assert found['months'] == {'2026-01': 2, '2026-02': 1, '2026-03': 1}
+
+
+def test_domain_counts_ignore_the_domain_filter(corpus):
+    found = corpus.search_inventions('graphene', domain_key='materials-science')
+    assert ids(found) == ['1', '2'] and found['total'] == 2
+    assert found['domains']['chemical-engineering'] == 1
+    assert found['months'] == {'2026-01': 2}
+
+
+def test_month_counts_ignore_the_date_filter(corpus):
+    found = corpus.search_inventions('graphene', date_from='2026-01-20', date_to='2026-02-03')
+    assert ids(found) == ['2', '3']
+    assert found['months'] == {'2026-01': 2, '2026-02': 1, '2026-03': 1}
+    assert found['domains'] == {'materials-science': 1, 'chemical-engineering': 1}
+
+
+def test_title_only(corpus):
+    found = corpus.search_inventions('graphene', title_only=True)
+    assert ids(found) == ['1', '3', '4']
+    # Short queries take the LIKE path
+    assert corpus.search_inventions('ar')['total'] == 4
+    assert ids(corpus.search_inventions('ar', title_only=True)) == ['2']
+
+
+def test_pages_and_no_hits(corpus, monkeypatch):
+    monkeypatch.setattr(storage, 'SEARCH_LIMIT', 3)
+    assert len(corpus.search_inventions('graphene', page=2)['results']) == 1
+    assert corpus.search_inventions('titanium') == {'results': [], 'total': 0, 'domains': {}, 'months': {}}
+
+
+def test_search_filters_ignore_invalid_values():
+    args = MultiDict({'domain': 'materials-science', 'from': '2026-01-01', 'to': 'yesterday',
+                      'title': '1', 'page': '2'})
+    assert search_filters(args) == {'domain_key': 'materials-science', 'date_from': '2026-01-01',
+                                     'title_only': True, 'page': 2}
+    assert search_filters(MultiDict({'domain': 'alchemy', 'page': 'x'})) == {}
+
+
+def test_month_range():
+    assert month_range('2026-02') == ('2026-02-01', '2026-02-28')
+    assert month_range('2026-12') == ('2026-12-01', '2026-12-31')
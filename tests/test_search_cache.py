@@ -0,0 +1,89 @@
+# tests/test_search_cache.py
+# Search result cache: normalization, LRU/TTL eviction and invalidation by corpus generation
+
+import pytest
+import search_cache
+from search_cache import SearchCache, normalize
+
+ROW = dict(invention_id='inv-20260101-000000', domain_key='energy', domain_name='Energy',
+           title='Graphene Heat Spreader', content='TITLE: Graphene Heat Spreader', hash='a' * 64)
+
+
+@pytest.fixture
+def runs():
+    """A fake search recording each query it runs"""
+    calls = []
+
+    def search(query, **filters):
+        calls.append((query, filters))
+        return [f"result for {query}"]
+
+    search.calls = calls
+    return search
+
+
+def test_normalize():
+    assert normalize('  Heat\tSPREADER \n') == 'heat spreader'
+
+
+def test_equivalent_queries_share_an_entry(repository, runs):
+    cache = SearchCache()
+    assert cache.get('Heat Spreader', runs) == ['result for heat spreader']
+    cache.get('  heat   spreader', runs)
+    assert runs.calls == [('heat spreader', {})]
+    assert cache.stats()['hits'] == 1
+
+
+def test_filters_are_part_of_the_key(repository, runs):
+    cache = SearchCache()
+    cache.get('gasket', runs, domain_key='energy')
+    cache.get('gasket', runs, domain_key='biotechnology')
+    cache.get('gasket', runs, domain_key='energy')
+    assert len(runs.calls) == 2
+
+
+def test_a_save_makes_older_entries_miss(repository, runs):
+    cache = SearchCache()
+    cache.get('graphene', runs)
+    repository.save_many([ROW])
+    cache.invalidate(repository, [ROW])
+    cache.get('graphene', runs)
+    assert len(runs.calls) == 2
+
+
+def test_another_process_save_is_seen_after_the_check_interval(repository, runs, monkeypatch):
+    cache = SearchCache()
+    cache.get('graphene', runs)
+    repository.save_many([ROW])
+    cache.get('graphene', runs)
+    assert len(runs.calls) == 1
+
+    monkeypatch.setattr(search_cache, 'SEARCH_GENERATION_CHECK', 0)
+    cache.get('graphene', runs)
+    assert len(runs.calls) == 2
+
+
+def test_lru_and_ttl_eviction(repository, runs):
+    cache = SearchCache(size=2)
+    for query in ['a', 'b', 'a', 'c', 'a', 'b']:
+        cache.get(query, runs)
+    # b was least recently used when c arrived
+    assert [query for query, _ in runs.calls] == ['a', 'b', 'c', 'b']
+
+    expiring = SearchCache(ttl=0)
+    expiring.get('a', runs)
+    expiring.get('a', runs)
+    assert [query for query, _ in runs.calls][-2:] == ['a', 'a']
+
+
+def test_popular_queries_are_prewarmed(repository, runs, monkeypatch):
+    monkeypatch.setattr(search_cache, 'TALLY_FLUSH_SECONDS', 0)
+    cache = SearchCache()
+    for query in ['Gasket', 'gasket', 'heat pump']:
+        cache.get(query, runs)
+
+    fresh = SearchCache()
+    assert fresh.prewarm(runs, limit=1) == 1
+    runs.calls.clear()
+    fresh.get('GASKET', runs)
+    assert runs.calls == []
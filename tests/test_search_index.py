@@ -0,0 +1,57 @@
+# tests/test_search_index.py
+# Search vocabulary extraction and "did you mean" corrections
+
+from datetime import datetime
+from generate import format_invention
+from search_index import did_you_mean, extract_terms, model_text, term_counts
+
+BODY = """TITLE: Graphene Heat Spreader
+
+ABSTRACT: A graphene laminate spreads heat from CO2 compressors at 120 kPa.
+
+DETAILED DESCRIPTION: Layers bonded with polyimide, rated to 450 K.
+
+CLAIMS: 1. A spreader comprising graphene.
+
+ENABLEMENT: Laminate the polyimide at 300 C."""
+
+INVENTION_ID = 'inv-20261019-160412'
+
+
+def formatted():
+    return format_invention(BODY, datetime(2026, 10, 19, 16, 4, 12), INVENTION_ID,
+                            'electrical-engineering', 'Electrical Engineering')
+
+
+def test_words_with_digits_are_not_terms():
+    assert extract_terms('inv-20261019-160412 a3f9bc01 co2 part-4b self-healing gasket') == {
+        'self-healing', 'gasket'}
+
+
+def test_model_text_drops_front_matter_footer_and_labels():
+    text = model_text(formatted())
+    assert 'Graphene Heat Spreader' in text and 'polyimide' in text
+    for boilerplate in ('domain_key', 'sha256', 'Generated by', 'Creative Commons', 'TITLE:', 'ENABLEMENT:'):
+        assert boilerplate not in text
+    # Text that isn't formatted is taken as it is
+    assert model_text('A plain gasket') == 'A plain gasket'
+
+
+def test_vocabulary_holds_only_invention_words(repository):
+    repository.save_many([dict(invention_id=INVENTION_ID, domain_key='electrical-engineering',
+                               domain_name='Electrical Engineering', title='Graphene Heat Spreader',
+                               content=formatted(), hash='a' * 64)])
+
+    for term in ('graphene', 'polyimide', 'laminate', 'spreader'):
+        assert repository.has_term(term), term
+    for term in ('inv-20261019-160412', 'electrical-engineering', 'engineering', 'creative', 'commons',
+                 'dedication', 'generated', 'verification', 'publication', 'enablement', 'abstract'):
+        assert not repository.has_term(term), term
+    assert not [term for term in term_counts([{'title': '', 'content': formatted()}]) if any(c.isdigit() for c in term)]
+
+
+def test_did_you_mean(repository):
+    repository.save_many([dict(invention_id=INVENTION_ID, domain_key='energy', domain_name='Energy',
+                               title='Graphene Heat Spreader', content=BODY, hash='a' * 64)])
+    assert did_you_mean('grafene spreader', repository) == 'graphene spreader'
+    assert did_you_mean('graphene spreader', repository) is None
@@ -0,0 +1,102 @@
+# tests/test_segment_store.py
+# SegmentStore: content-addressed appends, reads, rollover, catch-up and torn tails
+
+import hashlib
+import pytest
+from segment_store import SegmentStore, HEADER
+
+
+def body(n):
+    content = f"Invention {n}\n" + "claim text " * 20
+    return hashlib.sha256(content.encode('utf-8')).hexdigest(), content
+
+
+def test_round_trip_plain_and_compressed(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    plain_hash, plain = body(1)
+    packed_hash, packed = body(2)
+    store.append(plain_hash, plain, None, plain.encode('utf-8'))
+    store.append(packed_hash, packed, 3, b'\x00compressed')
+
+    codec, view = store.read(plain_hash)
+    assert codec is None and bytes(view) == plain.encode('utf-8')
+    codec, view = store.read(packed_hash)
+    assert codec == 3 and bytes(view) == b'\x00compressed'
+    assert plain_hash in store
+    assert store.stats()['bodies'] == 2
+
+
+def test_rejects_content_that_does_not_match_its_hash(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    content_hash, content = body(1)
+    with pytest.raises(ValueError):
+        store.append(content_hash, content + '!', None, b'x')
+
+
+def test_same_body_is_stored_once(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    content_hash, content = body(1)
+    store.append(content_hash, content, None, content.encode('utf-8'))
+    size = store.stats()['bytes']
+    store.append(content_hash, content, None, content.encode('utf-8'))
+    assert store.stats()['bytes'] == size
+
+
+def test_missing_body_raises_lookup_error(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    with pytest.raises(LookupError):
+        store.read(body(1)[0])
+
+
+def test_starts_a_new_segment_at_max_bytes(tmp_path):
+    store = SegmentStore(str(tmp_path), max_bytes=HEADER.size + 300)
+    for n in range(3):
+        content_hash, content = body(n)
+        store.append(content_hash, content, None, content.encode('utf-8'))
+    assert store.stats()['segments'] == 3
+    for n in range(3):
+        content_hash, content = body(n)
+        assert bytes(store.read(content_hash)[1]) == content.encode('utf-8')
+
+
+def test_second_store_catches_up_with_appends(tmp_path):
+    writer = SegmentStore(str(tmp_path))
+    reader = SegmentStore(str(tmp_path))
+    content_hash, content = body(1)
+    writer.append(content_hash, content, None, content.encode('utf-8'))
+    # Another process's store finds the record on its first miss
+    assert bytes(reader.read(content_hash)[1]) == content.encode('utf-8')
+
+
+def test_torn_tail_is_ignored_and_overwritten(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    first_hash, first = body(1)
+    store.append(first_hash, first, None, first.encode('utf-8'))
+    segment = store.segments[1]
+    with open(segment.path, 'ab') as f:
+        f.write(b'\xff' * (HEADER.size + 5))  # a crashed writer's partial record
+
+    reopened = SegmentStore(str(tmp_path))
+    assert reopened.stats()['bodies'] == 1
+    second_hash, second = body(2)
+    reopened.append(second_hash, second, None, second.encode('utf-8'))
+
+    fresh = SegmentStore(str(tmp_path))
+    assert bytes(fresh.read(first_hash)[1]) == first.encode('utf-8')
+    assert bytes(fresh.read(second_hash)[1]) == second.encode('utf-8')
+    assert fresh.stats()['bodies'] == 2
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_repository_keeps_bodies_in_segments(repository, tmp_path, compress):
+    repository.content_store = 'segments'
+    repository.compress = compress
+    repository._segments = SegmentStore(str(tmp_path / 'segments'))
+    content_hash, content = body(1)
+    repository.save_invention('inv-20260101-000001', 'energy', 'Energy', 'Invention 1', content, content_hash)
+
+    stored = repository.connection().execute(
+        "SELECT content, content_z, content_store FROM inventions").fetchone()
+    assert (stored['content'], stored['content_z'], stored['content_store']) == ('', None, 'segments')
+    assert repository.get_invention('energy', 'inv-20260101-000001')['content'] == content
+    assert content_hash in repository.segments
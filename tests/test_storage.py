@@ -0,0 +1,59 @@
+# tests/test_storage.py
+# Saves through the SQLite repository: one transaction for rows, search index and corpus generation
+
+import pytest
+
+ROW = dict(invention_id='inv-20260101-000000', domain_key='energy', domain_name='Energy',
+           title='Graphene Heat Spreader', content='TITLE: Graphene Heat Spreader\n\nABSTRACT: Spreads heat.',
+           hash='a' * 64)
+
+
+def test_save_is_searchable_and_bumps_the_generation(repository):
+    generation = repository.corpus_generation()
+    repository.save_many([ROW])
+    assert repository.get_invention('energy', ROW['invention_id'])['title'] == ROW['title']
+    assert repository.search_inventions('graphene')['total'] == 1
+    assert repository.corpus_generation() == generation + 1
+
+
+def test_failed_index_step_rolls_back_the_row(repository, monkeypatch):
+    generation = repository.corpus_generation()
+
+    def broken(counts):
+        raise RuntimeError('index failure')
+
+    monkeypatch.setattr(repository, '_index_terms', broken)
+    with pytest.raises(RuntimeError):
+        repository.save_many([ROW])
+
+    assert repository.get_invention('energy', ROW['invention_id']) is None
+    assert repository.search_inventions('graphene')['total'] == 0
+    assert repository.corpus_generation() == generation
+    assert not repository.in_transaction()
+
+
+def test_failed_resave_keeps_the_previous_version_indexed(repository, monkeypatch):
+    repository.save_many([ROW])
+    monkeypatch.setattr(repository, '_index_terms', lambda counts: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        repository.save_invention(ROW['invention_id'], 'energy', 'Energy', 'Copper Heat Spreader',
+                                  ROW['content'].replace('Graphene', 'Copper'), 'b' * 64)
+    monkeypatch.undo()
+
+    assert repository.get_invention('energy', ROW['invention_id'])['title'] == ROW['title']
+    assert repository.search_inventions('graphene')['total'] == 1
+    assert repository.search_inventions('copper')['total'] == 0
+    # The index still holds the stored values, so a later re-save can replace them
+    repository.save_invention(ROW['invention_id'], 'energy', 'Energy', 'Copper Heat Spreader',
+                              ROW['content'].replace('Graphene', 'Copper'), 'b' * 64)
+    assert repository.search_inventions('copper')['total'] == 1
+    assert repository.search_inventions('graphene')['total'] == 0
+    repository.connection().execute("INSERT INTO invention_search (invention_search, rank) VALUES ('integrity-check', 1)")
+
+
+def test_nested_transactions_join_the_outer_one(repository):
+    with pytest.raises(RuntimeError):
+        with repository.transaction():
+            repository.save_many([ROW])
+            raise RuntimeError('outer failure')
+    assert repository.get_invention('energy', ROW['invention_id']) is None
@@ -0,0 +1,62 @@
+# tests/test_suggest.py
+# Type-ahead: title and term prefixes, and term weights kept in step with saves
+
+import pytest
+import suggest
+from suggest import PrefixIndex
+
+
+def row(n, title, body):
+    return dict(invention_id=f'inv-20260101-{n:06d}', domain_key='energy', domain_name='Energy',
+                title=title, content=f'TITLE: {title}\n\nABSTRACT: {body}', hash=f'{n:064d}')
+
+
+@pytest.fixture
+def suggester(repository, monkeypatch):
+    """A suggester over two saved inventions, as get_suggester() sets it up"""
+    repository.save_many([row(1, 'Solar Panel Array', 'Photovoltaic laminate tiles.'),
+                          row(2, 'Solar Kiln', 'Photovoltaic heating of ceramics.')])
+    monkeypatch.setattr(suggest, '_suggester', None)
+    monkeypatch.setattr(suggest.storage, '_save_listeners', [])
+    return suggest.get_suggester()
+
+
+def titles(found):
+    return [item['title'] for item in found['titles']]
+
+
+def test_prefix_index_orders_and_finds_keys():
+    index = PrefixIndex()
+    index.add_many([('kiln', 1, 1.0), ('array', 2, 1.0), ('solar kiln', 3, 1.0)])
+    assert index.find('kiln') is not None and index.find('kil') is None
+    assert [index.key(entry) for entry in index.matches('so')] == [b'solar kiln']
+
+
+def test_titles_match_from_any_word(suggester):
+    assert titles(suggester.suggest('panel')) == ['Solar Panel Array']
+    assert sorted(titles(suggester.suggest('Solar'))) == ['Solar Kiln', 'Solar Panel Array']
+    assert suggester.suggest('s') == {'titles': [], 'terms': []}
+
+
+def test_terms_complete_the_last_word_by_frequency(suggester):
+    assert suggester.suggest('cheap photo')['terms'] == ['cheap photovoltaic']
+    assert suggester.suggest('lamin')['terms'] == ['laminate']
+
+
+def test_saves_add_terms_at_once(suggester, repository):
+    repository.save_many([row(3, 'Graphene Gasket', 'Laminate seals.')])
+    entry = suggester.terms.find('laminate')
+    assert suggester.terms.weights[entry] == 2
+    assert suggester.suggest('graph')['terms'] == ['graphene']
+
+
+def test_resave_replaces_the_previous_terms(suggester, repository):
+    repository.save_many([row(1, 'Solar Panel Array', 'Perovskite tiles.')])
+    assert suggester.terms.weights[suggester.terms.find('photovoltaic')] == 1
+    assert suggester.terms.weights[suggester.terms.find('tiles')] == 1
+    assert suggester.suggest('lamin')['terms'] == []
+    assert suggester.suggest('perov')['terms'] == ['perovskite']
+
+    # Saving the same version again changes nothing
+    repository.save_many([row(1, 'Solar Panel Array', 'Perovskite tiles.')])
+    assert suggester.terms.weights[suggester.terms.find('perovskite')] == 1